@@ -8,6 +8,44 @@ load_dotenv()
 class Settings:
     PROJECT_NAME: str = "Absurdly Correct API"
     DATABASE_URL: str = os.getenv("DATABASE_URL", "postgresql+asyncpg://absurdly:correct@db:5432/absurdly_db")
+    DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_WARM_CONNECTIONS: int = int(os.getenv("DB_WARM_CONNECTIONS", os.getenv("DB_POOL_SIZE", "5")))
+    DB_SCHEMA: str = os.getenv("DB_SCHEMA", "check")
     ALLOWED_ORIGINS: list[str] = ["*"]
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    PRESENTATION_SECONDS: float = float(os.getenv("PRESENTATION_SECONDS", "5"))
+    SEND_QUEUE_SIZE: int = int(os.getenv("SEND_QUEUE_SIZE", "64"))
+    SLOW_CONSUMER_SECONDS: float = float(os.getenv("SLOW_CONSUMER_SECONDS", "10"))
+    REPLAY_VERSIONS: int = int(os.getenv("REPLAY_VERSIONS", "64"))
+    BROADCAST_WINDOW_MS: float = float(os.getenv("BROADCAST_WINDOW_MS", "0"))
+    WORKER_COUNT: int = int(os.getenv("WORKER_COUNT", "1"))
+    BACKPLANE: str = os.getenv("BACKPLANE", "socket")
+    BACKPLANE_ADDRESS: str = os.getenv("BACKPLANE_ADDRESS", "unix:/tmp/absurdly-backplane.sock")
+    AUDIENCE_SHARDS: int = int(os.getenv("AUDIENCE_SHARDS", "16"))
+    AUDIENCE_MERGE_MS: float = float(os.getenv("AUDIENCE_MERGE_MS", "250"))
+    GAME_FINISHED_TTL: float = float(os.getenv("GAME_FINISHED_TTL", "600"))
+    GAME_ABANDONED_TTL: float = float(os.getenv("GAME_ABANDONED_TTL", "300"))
+    GAME_IDLE_TTL: float = float(os.getenv("GAME_IDLE_TTL", "3600"))
+    MAX_GAMES: int = int(os.getenv("MAX_GAMES", "5000"))
+    MAX_GAMES_MEMORY_MB: int = int(os.getenv("MAX_GAMES_MEMORY_MB", "512"))
+    LIFECYCLE_INTERVAL: float = float(os.getenv("LIFECYCLE_INTERVAL", "30"))
+    SNAPSHOT_STORE: str = os.getenv("SNAPSHOT_STORE", "db")
+    SNAPSHOT_DIR: str = os.getenv("SNAPSHOT_DIR", "/tmp/absurdly-snapshots")
+    SNAPSHOT_INTERVAL: float = float(os.getenv("SNAPSHOT_INTERVAL", "3"))
+    HISTORY_STORE: str = os.getenv("HISTORY_STORE", "db")
+    HISTORY_QUEUE_SIZE: int = int(os.getenv("HISTORY_QUEUE_SIZE", "10000"))
+    HISTORY_BATCH_SIZE: int = int(os.getenv("HISTORY_BATCH_SIZE", "500"))
+    HISTORY_FLUSH_MS: float = float(os.getenv("HISTORY_FLUSH_MS", "1000"))
+    ACTION_RATE_LIMITS: str = os.getenv(
+        "ACTION_RATE_LIMITS",
+        "default=10/20,vote=2/4,select_card=2/4,update_settings=2/5,start_game=1/3,restart_game=1/3,sync=1/3,audience_vote=2/4",
+    )
+    GAME_ACTION_RATE: float = float(os.getenv("GAME_ACTION_RATE", "50"))
+    GAME_ACTION_BURST: float = float(os.getenv("GAME_ACTION_BURST", "100"))
+    MAX_BATCH_ACTIONS: int = int(os.getenv("MAX_BATCH_ACTIONS", "20"))
+    LEADERBOARD_MIN_GAMES: int = int(os.getenv("LEADERBOARD_MIN_GAMES", "5"))
+    LEADERBOARD_REFRESH_SECONDS: float = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "60"))
 
 settings = Settings()
@@ -0,0 +1,211 @@
+﻿# file: app/api/core/metrics.py
+
+import abc
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in self.values.items()]
+
+
+class GaugeMetric(Metric):
+    # Either set directly or computed by a callback at scrape time, which
+    # keeps things like "games by phase" off the hot path entirely.
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.collect = collect
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+    def samples(self) -> List[str]:
+        values = self.collect() if self.collect is not None else self.values
+        return [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in values.items()]
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.bounds = tuple(buckets)
+        self.children: Dict[LabelValues, HistogramChild] = {}
+
+    def labels(self, *labels: str) -> HistogramChild:
+        child = self.children.get(labels)
+        if child is None:
+            child = self.children[labels] = HistogramChild(self.bounds)
+        return child
+
+    def observe(self, value: float, *labels: str):
+        self.labels(*labels).observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> CounterMetric:
+        return self.register(CounterMetric(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (), collect=None) -> GaugeMetric:
+        return self.register(GaugeMetric(name, help_text, labels, collect))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> HistogramMetric:
+        return self.register(HistogramMetric(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+actions_total = registry.counter("absurdly_actions_total", "WebSocket actions handled, by action.", ["action"])
+action_seconds = registry.histogram("absurdly_action_seconds", "Time spent handling one action.", ["action"])
+broadcast_seconds = registry.histogram("absurdly_broadcast_seconds", "Time to build and queue one game state broadcast.")
+broadcast_bytes = registry.histogram("absurdly_broadcast_bytes", "Bytes queued by one game state broadcast.", buckets=SIZE_BUCKETS)
+db_query_seconds = registry.histogram("absurdly_db_query_seconds", "Database statement latency.")
+loop_lag_seconds = registry.histogram("absurdly_event_loop_lag_seconds", "How late the event loop woke a periodic probe.")
+
+
+def instrument_engine(engine):
+    # Statement timing via SQLAlchemy cursor events on the sync engine that
+    # backs the async one.
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append((context, time.perf_counter()))
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("query_started")
+        if started:
+            db_query_seconds.observe(time.perf_counter() - started.pop()[1])
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(error):
+        # A failed statement never reaches after_cursor_execute; drop its
+        # start time so the next statement on the connection is timed from
+        # its own start.
+        started = error.connection.info.get("query_started") if error.connection is not None else None
+        if started and started[-1][0] is error.execution_context:
+            started.pop()
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - expected)
+            loop_lag_seconds.observe(self.last_lag)
+
+
+loop_monitor = LoopLagMonitor()
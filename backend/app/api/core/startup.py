@@ -0,0 +1,132 @@
+﻿# file: app/api/core/startup.py
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.api.core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "migrations"))
+
+
+class SchemaError(RuntimeError):
+    pass
+
+
+def migration_heads() -> set:
+    # Alembic is only needed for this one check, so it is imported here
+    # instead of on every boot path.
+    from alembic.script import ScriptDirectory
+    return set(ScriptDirectory(MIGRATIONS_DIR).get_heads())
+
+
+async def database_revisions(engine) -> set:
+    from sqlalchemy import text
+    from sqlalchemy.exc import ProgrammingError
+
+    async with engine.connect() as conn:
+        try:
+            result = await conn.execute(text("SELECT version_num FROM alembic_version"))
+        except ProgrammingError:
+            return set()
+        return {row[0] for row in result}
+
+
+async def prepare_schema(engine, mode: str):
+    # "check" refuses to start on a database that is not migrated to the
+    # head revision, "warn" only logs it, "create" runs create_all like
+    # older versions did (handy for throwaway databases).
+    if mode == "create":
+        from app.api.db.models import Base
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        return
+    if mode not in ("check", "warn"):
+        raise ValueError(f"Unknown DB_SCHEMA mode: {mode}")
+    heads, current = await asyncio.gather(asyncio.to_thread(migration_heads), database_revisions(engine))
+    if current == heads:
+        return
+    message = (
+        f"Database schema is at {', '.join(sorted(current)) or 'no revision'}, "
+        f"expected {', '.join(sorted(heads))}; run `alembic upgrade head`"
+    )
+    if mode == "check":
+        raise SchemaError(message)
+    logger.warning(message)
+
+
+async def warm_pool(engine, connections: int):
+    # Opens the connections at the same time so they all stay in the pool
+    # and the first requests skip the connect and auth round trips.
+    from sqlalchemy import text
+
+    async def touch():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(touch() for _ in range(connections)))
+
+
+class Startup:
+    # Boot phases with their durations. The process is live as soon as it
+    # answers; it is ready once every warm-up step has finished, and stops
+    # being ready when shutdown begins.
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.began = clock()
+        self.phases: Dict[str, float] = {}
+        self.ready_at: Optional[float] = None
+        self.stopping = False
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None and not self.stopping
+
+    @property
+    def time_to_ready(self) -> Optional[float]:
+        return self.ready_at - self.began if self.ready_at is not None else None
+
+    async def step(self, name: str, step: Awaitable):
+        started = self.clock()
+        try:
+            return await step
+        finally:
+            self.phases[name] = self.clock() - started
+
+    async def run(self, **steps: Awaitable):
+        # Steps run concurrently. If several fail, a schema error is the one
+        # worth reporting, since it usually explains the others.
+        results = await asyncio.gather(*(self.step(name, step) for name, step in steps.items()),
+                                       return_exceptions=True)
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise next((e for e in errors if isinstance(e, SchemaError)), errors[0])
+
+    def mark_ready(self):
+        self.ready_at = self.clock()
+        logger.info("Ready in %.0f ms (%s)", self.time_to_ready * 1000, ", ".join(
+            f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases.items()
+        ))
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "stopping": self.stopping,
+            "timeToReadyMs": round(self.time_to_ready * 1000, 1) if self.time_to_ready is not None else None,
+            "uptimeSeconds": round(self.clock() - self.began, 1),
+            "phasesMs": {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()},
+        }
+
+
+startup = Startup()
+
+registry.gauge("absurdly_ready", "1 once startup warm-up has finished and until shutdown begins.",
+               collect=lambda: {(): int(startup.ready)})
+registry.gauge("absurdly_startup_seconds", "Duration of each startup phase.", ["phase"],
+               collect=lambda: {(name,): seconds for name, seconds in startup.phases.items()})
+registry.gauge("absurdly_time_to_ready_seconds", "Seconds from process start to ready.",
+               collect=lambda: {(): startup.time_to_ready} if startup.time_to_ready is not None else {})
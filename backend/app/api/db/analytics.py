@@ -0,0 +1,198 @@
+﻿# file: app/api/db/analytics.py
+
+import asyncio
+import time
+from typing import List, Optional, Sequence
+
+from sqlalchemy import func, select
+
+from app.api.db.database import async_session
+from app.api.db.models import RoundCardDB
+from app.api.game.catalog import CardCatalog, catalog as card_catalog
+
+np = None
+
+FETCH_CHUNK = 50000
+
+
+def load_numpy() -> bool:
+    # numpy is imported on first use, which keeps it off the startup path.
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+def _factorize(values: Sequence[str]):
+    # Distinct ids and an int code per row. Hashing is much faster than
+    # np.unique, which sorts the strings.
+    ids = list(dict.fromkeys(values))
+    codes = {value: i for i, value in enumerate(ids)}
+    return np.array(ids, dtype=object), np.fromiter(map(codes.__getitem__, values), dtype=np.int64, count=len(values))
+
+
+class CardWinRates:
+    # Round outcomes as columns: one row per answer played, with integer
+    # codes for the black and white card ids. Every statistic below is a
+    # handful of bincount/unique passes over these arrays.
+    def __init__(self, black: Sequence[str], white: Sequence[str], won: Sequence[bool]):
+        load_numpy()
+        self.black_ids, self.black = _factorize(black)
+        self.white_ids, self.white = _factorize(white)
+        self.won = np.asarray(won, dtype=bool)
+        self.outcomes = len(self.won)
+
+        self.white_plays = np.bincount(self.white, minlength=len(self.white_ids))
+        self.white_wins = np.bincount(self.white, weights=self.won, minlength=len(self.white_ids)).astype(np.int64)
+        self.black_plays = np.bincount(self.black, minlength=len(self.black_ids))
+        self.black_wins = np.bincount(self.black, weights=self.won, minlength=len(self.black_ids)).astype(np.int64)
+
+        # Black/white pairs that were actually played, as a sparse matrix
+        # keyed by black_code * white_count + white_code.
+        codes = self.black * len(self.white_ids) + self.white
+        self.pair_codes, inverse = np.unique(codes, return_inverse=True)
+        self.pair_plays = np.bincount(inverse)
+        self.pair_wins = np.bincount(inverse, weights=self.won).astype(np.int64)
+
+    @staticmethod
+    def _ranked(plays, wins, min_plays: int, limit: int, ascending: bool):
+        candidates = np.flatnonzero(plays >= min_plays)
+        rates = wins[candidates] / plays[candidates]
+        # Sort by win rate, then by play count (more plays first).
+        order = np.lexsort((-plays[candidates], rates if ascending else -rates))
+        return candidates[order[:limit]]
+
+    def _card_rows(self, ids, plays, wins, picked, pool) -> List[dict]:
+        rows = []
+        for i in picked.tolist():
+            card = pool.find(str(ids[i]))
+            rows.append({
+                "id": str(ids[i]),
+                "content": card.content if card is not None else None,
+                "plays": int(plays[i]),
+                "wins": int(wins[i]),
+                "winRate": round(float(wins[i] / plays[i]), 4),
+            })
+        return rows
+
+    def cards(self, kind: str, catalog: CardCatalog, min_plays: int = 1, limit: int = 50,
+              ascending: bool = False) -> List[dict]:
+        if kind == "white":
+            ids, plays, wins = self.white_ids, self.white_plays, self.white_wins
+        else:
+            ids, plays, wins = self.black_ids, self.black_plays, self.black_wins
+        picked = self._ranked(plays, wins, min_plays, limit, ascending)
+        return self._card_rows(ids, plays, wins, picked, catalog.pool(kind))
+
+    def pairs(self, min_plays: int = 1, limit: int = 50, ascending: bool = False) -> List[dict]:
+        picked = self._ranked(self.pair_plays, self.pair_wins, min_plays, limit, ascending)
+        width = len(self.white_ids)
+        return [{
+            "blackCardId": str(self.black_ids[code // width]),
+            "whiteCardId": str(self.white_ids[code % width]),
+            "plays": int(self.pair_plays[i]),
+            "wins": int(self.pair_wins[i]),
+            "winRate": round(float(self.pair_wins[i] / self.pair_plays[i]), 4),
+        } for i, code in zip(picked.tolist(), self.pair_codes[picked].tolist())]
+
+    def matrix(self, blacks: int = 20, whites: int = 50) -> dict:
+        # Dense plays/wins matrices for the most played black and white
+        # cards, built with one bincount over the selected outcomes.
+        top_black = np.argsort(-self.black_plays, kind="stable")[:blacks]
+        top_white = np.argsort(-self.white_plays, kind="stable")[:whites]
+        rows = np.full(len(self.black_ids), -1, dtype=np.int64)
+        cols = np.full(len(self.white_ids), -1, dtype=np.int64)
+        rows[top_black] = np.arange(len(top_black))
+        cols[top_white] = np.arange(len(top_white))
+        selected = (rows[self.black] >= 0) & (cols[self.white] >= 0)
+        flat = rows[self.black[selected]] * len(top_white) + cols[self.white[selected]]
+        size = len(top_black) * len(top_white)
+        shape = (len(top_black), len(top_white))
+        plays = np.bincount(flat, minlength=size).reshape(shape)
+        wins = np.bincount(flat, weights=self.won[selected], minlength=size).astype(np.int64).reshape(shape)
+        return {
+            "blackCardIds": [str(card_id) for card_id in self.black_ids[top_black]],
+            "whiteCardIds": [str(card_id) for card_id in self.white_ids[top_white]],
+            "plays": plays.tolist(),
+            "wins": wins.tolist(),
+        }
+
+
+class CardAnalytics:
+    # Win rates for the current catalog version. A card write bumps the
+    # version and the next request recomputes; so does an age limit, so
+    # newly archived rounds show up. Only one load runs at a time.
+    def __init__(self, catalog: Optional[CardCatalog] = None, max_age: float = 300.0):
+        self.catalog = catalog or card_catalog
+        self.max_age = max_age
+        self.version = -1
+        self.loaded_at = 0.0
+        self.result: Optional[CardWinRates] = None
+        self.loads = 0
+        self.hits = 0
+        self.last_load_ms = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def available(self) -> bool:
+        return load_numpy()
+
+    def _fresh(self) -> bool:
+        return (
+            self.result is not None
+            and self.version == self.catalog.version
+            and time.monotonic() - self.loaded_at < self.max_age
+        )
+
+    async def get(self) -> CardWinRates:
+        if self._fresh():
+            self.hits += 1
+            return self.result
+        async with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self.result
+            version = self.catalog.version
+            started = time.perf_counter()
+            black, white, won = await self._fetch()
+            self.result = await asyncio.to_thread(CardWinRates, black, white, won)
+            self.version = version
+            self.loaded_at = time.monotonic()
+            self.last_load_ms = (time.perf_counter() - started) * 1000
+            self.loads += 1
+            return self.result
+
+    @staticmethod
+    async def _fetch():
+        black: List[str] = []
+        white: List[str] = []
+        won: List[bool] = []
+        stmt = select(
+            func.coalesce(RoundCardDB.black_card_id, ""), RoundCardDB.white_card_id, RoundCardDB.won,
+        ).execution_options(yield_per=FETCH_CHUNK)
+        async with async_session() as session:
+            result = await session.stream(stmt)
+            async for rows in result.partitions(FETCH_CHUNK):
+                if rows:
+                    b, w, x = zip(*rows)
+                    black.extend(b)
+                    white.extend(w)
+                    won.extend(x)
+        return black, white, won
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "version": self.version,
+            "outcomes": self.result.outcomes if self.result is not None else 0,
+            "loads": self.loads,
+            "hits": self.hits,
+            "lastLoadMs": round(self.last_load_ms, 2),
+        }
+
+
+card_analytics = CardAnalytics()
@@ -0,0 +1,218 @@
+﻿# file: app/api/db/bulk.py
+
+import csv
+import hashlib
+import io
+import time
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.api.db.database import async_session
+from app.api.db.models import BlackCard, BlackCardDB, WhiteCard, WhiteCardDB
+from app.api.game.catalog import catalog
+from app.api.game.encoding import dumps, loads
+
+CARD_TABLES = {
+    "black": (BlackCardDB, BlackCard),
+    "white": (WhiteCardDB, WhiteCard),
+}
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+Row = Tuple[int, Optional[dict], Optional[str]]
+
+
+def content_hash(content: str) -> str:
+    # Whitespace differences don't make a new card.
+    return hashlib.sha256(" ".join(content.split()).encode()).hexdigest()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+def _card_row(number: int, data) -> Row:
+    if not isinstance(data, dict):
+        return number, None, "Expected an object"
+    content = data.get("content")
+    if not isinstance(content, str) or not content.strip():
+        return number, None, "Missing content"
+    card_id = data.get("id")
+    return number, {"id": str(card_id) if card_id else None, "content": content.strip()}, None
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            data = loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON"
+            continue
+        yield _card_row(number, data)
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Row]:
+    # Lines are joined until the quotes balance, so quoted fields may span
+    # lines; the first record is the header (`content` and optionally `id`).
+    header: Optional[List[str]] = None
+    record = ""
+    number = start = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        if not record:
+            start = number
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        try:
+            fields = next(csv.reader([text]))
+        except csv.Error as e:
+            yield start, None, str(e)
+            continue
+        if header is None:
+            header = [field.strip().lower() for field in fields]
+            if "content" not in header:
+                yield start, None, "Header must contain a content column"
+                return
+            continue
+        yield _card_row(start, dict(zip(header, fields)))
+    if record:
+        yield start, None, "Unterminated quoted field"
+
+
+class ImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self.started = time.perf_counter()
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self) -> dict:
+        seconds = time.perf_counter() - self.started
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "rowsPerSecond": round(self.received / seconds) if seconds > 0 else 0,
+        }
+
+
+def _split_batch(rows: List[dict], existing: Dict[str, str]) -> Tuple[List[dict], List[dict]]:
+    # existing maps the ids and content hashes already stored to each other
+    # (id -> hash). Content that is already stored is a duplicate whatever
+    # its id, so re-importing the same file is a no-op; a known id with new
+    # content is an edit.
+    stored_hashes = set(existing.values())
+    fresh, changed = [], []
+    for row in rows:
+        if row["content_hash"] in stored_hashes:
+            continue
+        (changed if row["id"] in existing else fresh).append(row)
+    return fresh, changed
+
+
+async def _write_batch(kind: str, rows: List[dict], report: ImportReport):
+    model, schema = CARD_TABLES[kind]
+    written = []
+    async with async_session() as session:
+        result = await session.execute(
+            select(model.id, model.content_hash).where(
+                or_(model.id.in_([row["id"] for row in rows]), model.content_hash.in_([row["content_hash"] for row in rows]))
+            )
+        )
+        fresh, changed = _split_batch(rows, dict(result.all()))
+        if fresh:
+            # DO NOTHING still covers rows a concurrent import got in first.
+            stmt = insert(model).values(fresh).on_conflict_do_nothing().returning(model.id, model.content)
+            inserted = (await session.execute(stmt)).all()
+            report.inserted += len(inserted)
+            written += inserted
+        if changed:
+            stmt = insert(model).values(changed)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[model.id],
+                set_={"content": stmt.excluded.content, "content_hash": stmt.excluded.content_hash},
+            ).returning(model.id, model.content)
+            updated = (await session.execute(stmt)).all()
+            report.updated += len(updated)
+            written += updated
+        await session.commit()
+    report.duplicates += len(rows) - len(written)
+    if written:
+        catalog.put_many(kind, (schema(id=card_id, content=content) for card_id, content in written))
+
+
+async def import_cards(kind: str, rows: AsyncIterator[Row]) -> dict:
+    report = ImportReport()
+    batch: Dict[str, dict] = {}
+    batch_ids: Dict[str, str] = {}
+    async for number, row, error in rows:
+        report.received += 1
+        if error is not None:
+            report.error(number, error)
+            continue
+        digest = content_hash(row["content"])
+        if digest in batch:
+            report.duplicates += 1
+            continue
+        if row["id"] in batch_ids:
+            # The same id twice in a batch: the later line wins, as it would
+            # across batches.
+            del batch[batch_ids[row["id"]]]
+            report.duplicates += 1
+        if row["id"]:
+            batch_ids[row["id"]] = digest
+        batch[digest] = {"id": row["id"] or str(uuid.uuid4()), "content": row["content"], "content_hash": digest}
+        if len(batch) >= BATCH_SIZE:
+            await _write_batch(kind, list(batch.values()), report)
+            batch, batch_ids = {}, {}
+    if batch:
+        await _write_batch(kind, list(batch.values()), report)
+    return report.as_dict()
+
+
+async def export_cards(kind: str, fmt: str = "ndjson") -> AsyncIterator[str]:
+    model, _ = CARD_TABLES[kind]
+    if fmt == "csv":
+        yield "id,content\r\n"
+    async with async_session() as session:
+        stream = await session.stream(
+            select(model.id, model.content).order_by(model.id).execution_options(yield_per=BATCH_SIZE)
+        )
+        async for rows in stream.partitions():
+            if fmt == "csv":
+                out = io.StringIO()
+                csv.writer(out).writerows(rows)
+                yield out.getvalue()
+            else:
+                yield "".join(dumps({"id": card_id, "content": content}) + "\n" for card_id, content in rows)
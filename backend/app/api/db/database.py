@@ -2,8 +2,15 @@
 from typing import AsyncGenerator
 
 from app.api.core.config import settings
+from app.api.core.metrics import instrument_engine
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=settings.DB_ECHO,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+)
+instrument_engine(engine)
 
 async_session = async_sessionmaker(
     bind=engine,
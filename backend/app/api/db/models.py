@@ -1,4 +1,4 @@
-﻿from sqlalchemy import Column, String
+﻿from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Text, func
 from sqlalchemy.orm import declarative_base
 from pydantic import BaseModel, ConfigDict
 
@@ -10,11 +10,85 @@ class BlackCardDB(Base):
     __tablename__ = "black_cards"
     id = Column(String, primary_key=True, index=True)
     content = Column(String, nullable=False)
+    content_hash = Column(String(64), unique=True)
 
 class WhiteCardDB(Base):
     __tablename__ = "white_cards"
     id = Column(String, primary_key=True, index=True)
     content = Column(String, nullable=False)
+    content_hash = Column(String(64), unique=True)
+
+class CardPackDB(Base):
+    __tablename__ = "card_packs"
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+    description = Column(String)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class PackCardDB(Base):
+    # Pack membership. The primary key serves "cards of these packs";
+    # the (kind, card_id) index serves cleanup when a card is deleted.
+    __tablename__ = "pack_cards"
+    __table_args__ = (Index("ix_pack_cards_kind_card", "kind", "card_id"),)
+    pack_id = Column(String, ForeignKey("card_packs.id", ondelete="CASCADE"), primary_key=True)
+    kind = Column(String(5), primary_key=True)
+    card_id = Column(String, primary_key=True)
+
+class GameSnapshotDB(Base):
+    __tablename__ = "game_snapshots"
+    game_id = Column(String, primary_key=True)
+    data = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class GameResultDB(Base):
+    __tablename__ = "game_results"
+    match_id = Column(String, primary_key=True)
+    game_id = Column(String, nullable=False, index=True)
+    rounds = Column(Integer, nullable=False)
+    winner_ids = Column(Text, nullable=False)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class PlayerResultDB(Base):
+    __tablename__ = "player_results"
+    match_id = Column(String, primary_key=True)
+    player_id = Column(String, primary_key=True, index=True)
+    nickname = Column(String, nullable=False)
+    score = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False)
+
+class RoundResultDB(Base):
+    __tablename__ = "round_results"
+    match_id = Column(String, primary_key=True)
+    round = Column(Integer, primary_key=True)
+    game_id = Column(String, nullable=False, index=True)
+    black_card_id = Column(String)
+    winner_ids = Column(Text, nullable=False)
+    winning_card_ids = Column(Text, nullable=False)
+    votes = Column(Text, nullable=False)
+    answers = Column(Integer, nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=False)
+
+class RoundCardDB(Base):
+    __tablename__ = "round_cards"
+    match_id = Column(String, primary_key=True)
+    round = Column(Integer, primary_key=True)
+    player_id = Column(String, primary_key=True)
+    black_card_id = Column(String)
+    white_card_id = Column(String, nullable=False)
+    votes = Column(Integer, nullable=False)
+    won = Column(Boolean, nullable=False)
+
+class PlayerStatsDB(Base):
+    __tablename__ = "player_stats"
+    __table_args__ = (Index("ix_player_stats_period_wins", "period", "wins"),)
+    period = Column(String, primary_key=True)
+    player_id = Column(String, primary_key=True)
+    nickname = Column(String, nullable=False)
+    games = Column(Integer, nullable=False, default=0)
+    wins = Column(Integer, nullable=False, default=0)
+    points = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
 
 # --- Pydantic Models ---
 
@@ -28,6 +102,14 @@ class WhiteCard(BaseModel):
     id: str | None = None
     content: str
 
+class CardPack(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: str | None = None
+    name: str
+    description: str | None = None
+    blackCardIds: list[str] = []
+    whiteCardIds: list[str] = []
+
 class Player(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: str
@@ -46,3 +128,4 @@ class GameSettings(BaseModel):
     selectionTime: int = 15
     votingTime: int = 60
     maxPlayers: int = 10
+    packs: list[str] = []
@@ -0,0 +1,105 @@
+﻿# file: app/api/db/pages.py
+
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+
+from app.api.db.bulk import CARD_TABLES
+from app.api.db.database import async_session
+from app.api.game.catalog import CardCatalog, catalog as card_catalog
+from app.api.game.encoding import dumps
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+PageKey = Tuple[str, Optional[str], int, Optional[str]]
+
+
+class CardPage:
+    # The ETag is a digest of the page body, so it is the same on every
+    # worker and across restarts as long as the cards are; the gzip variant
+    # gets its own tag because its bytes differ.
+    __slots__ = ("body", "next_cursor", "digest", "_gzipped")
+
+    def __init__(self, body: bytes, next_cursor: Optional[str]):
+        self.body = body
+        self.next_cursor = next_cursor
+        self.digest = hashlib.blake2b(body + (next_cursor or "").encode(), digest_size=16).hexdigest()
+        self._gzipped: Optional[bytes] = None
+
+    def etag(self, gzipped: bool = False) -> str:
+        return f'"{self.digest}-gzip"' if gzipped else f'"{self.digest}"'
+
+    @property
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+def escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class CardPageCache:
+    # Encoded listing pages for the current catalog version. Any card write
+    # bumps the version, which drops every cached page on the next lookup.
+    def __init__(self, catalog: Optional[CardCatalog] = None, max_pages: int = 256):
+        self.catalog = catalog or card_catalog
+        self.max_pages = max_pages
+        self.version = -1
+        self.pages: "OrderedDict[PageKey, CardPage]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _sync(self):
+        if self.version != self.catalog.version:
+            self.pages.clear()
+            self.version = self.catalog.version
+
+    async def get(self, kind: str, after: Optional[str], limit: int, q: Optional[str]) -> CardPage:
+        self._sync()
+        key = (kind, after, limit, q)
+        page = self.pages.get(key)
+        if page is not None:
+            self.hits += 1
+            self.pages.move_to_end(key)
+            return page
+        self.misses += 1
+        version = self.version
+        page = await self._fetch(kind, after, limit, q)
+        if version == self.catalog.version:
+            self.pages[key] = page
+            if len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+        return page
+
+    @staticmethod
+    async def _fetch(kind: str, after: Optional[str], limit: int, q: Optional[str]) -> CardPage:
+        model, _ = CARD_TABLES[kind]
+        stmt = select(model.id, model.content).order_by(model.id).limit(limit + 1)
+        if after is not None:
+            stmt = stmt.where(model.id > after)
+        if q:
+            stmt = stmt.where(model.content.ilike(f"%{escape_like(q)}%", escape="\\"))
+        async with async_session() as session:
+            rows = (await session.execute(stmt)).all()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        body = dumps([{"id": card_id, "content": content} for card_id, content in rows[:limit]])
+        return CardPage(body.encode(), next_cursor)
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "pages": len(self.pages),
+            "hits": self.hits,
+            "misses": self.misses,
+            "notModified": self.not_modified,
+        }
+
+
+card_pages = CardPageCache()
@@ -0,0 +1,248 @@
+﻿# file: app/api/db/search.py
+
+import heapq
+import math
+import re
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select
+
+from app.api.db.bulk import CARD_TABLES
+from app.api.db.database import async_session
+from app.api.db.pages import escape_like
+from app.api.game.catalog import CardCatalog, CardPool, catalog as card_catalog
+
+CARD_KINDS = ("black", "white")
+MAX_PREFIX_TERMS = 64
+CACHED_TERMS = 4096
+CACHED_QUERIES = 1024
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[^\W_]+")
+
+# (-score, length in words, slot): sorts best first.
+Ranked = Tuple[float, int, int]
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+class KindIndex:
+    # Inverted index over one card pool: token -> {slot: term frequency}.
+    # It remembers which card object it indexed in every slot, so catching
+    # up with the pool only reindexes the slots whose card was replaced.
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.indexed: List[Optional[object]] = []
+        self.total_length = 0
+        self.cache: "OrderedDict[Tuple[str, bool], TermHits]" = OrderedDict()
+        self.results: "OrderedDict[tuple, Tuple[int, List[Ranked]]]" = OrderedDict()
+        self._vocabulary: Optional[List[str]] = None
+
+    def _add(self, slot: int, card):
+        tokens = tokenize(card.content)
+        for token, count in Counter(tokens).items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                self._vocabulary = None
+            postings[slot] = count
+        self.lengths[slot] = len(tokens)
+        self.total_length += len(tokens)
+
+    def _discard(self, slot: int, card):
+        for token in set(tokenize(card.content)):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(slot, None)
+                if not postings:
+                    del self.postings[token]
+                    self._vocabulary = None
+        self.total_length -= self.lengths.pop(slot, 0)
+
+    def sync(self, pool: CardPool) -> int:
+        if len(self.indexed) < len(pool.cards):
+            self.indexed.extend([None] * (len(pool.cards) - len(self.indexed)))
+        changed = 0
+        for slot, card in enumerate(pool.cards):
+            old = self.indexed[slot]
+            if old is card:
+                continue
+            if old is not None:
+                self._discard(slot, old)
+            if card is not None:
+                self._add(slot, card)
+            self.indexed[slot] = card
+            changed += 1
+        return changed
+
+    def _expand(self, prefix: str) -> List[str]:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        start = bisect_left(vocabulary, prefix)
+        terms = []
+        for term in vocabulary[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def _term_scores(self, term: str) -> Dict[int, float]:
+        postings = self.postings.get(term, {})
+        documents = len(self.lengths)
+        idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+        average = self.total_length / documents if documents else 1.0
+        return {
+            slot: idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[slot] / average))
+            for slot, tf in postings.items()
+        }
+
+    def _hits(self, token: str, prefix: bool) -> "TermHits":
+        # Scores per query word are cached until the next reindex, so a
+        # repeated or common word costs a dict lookup.
+        key = (token, prefix)
+        hits = self.cache.get(key)
+        if hits is not None:
+            self.cache.move_to_end(key)
+            return hits
+        if prefix:
+            scores: Dict[int, float] = {}
+            for term in self._expand(token):
+                for slot, score in self._term_scores(term).items():
+                    if score > scores.get(slot, 0.0):
+                        scores[slot] = score
+        else:
+            scores = self._term_scores(token)
+        hits = self.cache[key] = TermHits(scores, self.lengths)
+        if len(self.cache) > CACHED_TERMS:
+            self.cache.popitem(last=False)
+        return hits
+
+    def search(self, tokens: List[str], prefix: bool, count: int) -> Tuple[int, List[Ranked]]:
+        # Every query word has to match; the last one may be a prefix of a
+        # longer word (search as you type). Cards are scored with BM25 and
+        # the best `count` are returned with the number of matches.
+        hits = [self._hits(token, prefix and i == len(tokens) - 1) for i, token in enumerate(tokens)]
+        if any(not h.scores for h in hits):
+            return 0, []
+        if len(hits) == 1:
+            return len(hits[0].scores), hits[0].top(count)
+        key = (tuple(tokens), prefix, count)
+        found = self.results.get(key)
+        if found is not None:
+            self.results.move_to_end(key)
+            return found
+        hits.sort(key=lambda h: len(h.scores))
+        slots = hits[0].scores.keys() & hits[1].scores.keys()
+        for h in hits[2:]:
+            slots &= h.scores.keys()
+        lengths = self.lengths
+        matched = [(-sum(h.scores[slot] for h in hits), lengths[slot], slot) for slot in slots]
+        found = self.results[key] = (len(matched), heapq.nsmallest(count, matched))
+        if len(self.results) > CACHED_QUERIES:
+            self.results.popitem(last=False)
+        return found
+
+    def clear_cache(self):
+        self.cache.clear()
+        self.results.clear()
+
+
+class TermHits:
+    __slots__ = ("scores", "lengths", "_ranked")
+
+    def __init__(self, scores: Dict[int, float], lengths: Dict[int, int]):
+        self.scores = scores
+        self.lengths = lengths
+        self._ranked: Optional[List[Ranked]] = None
+
+    def top(self, count: int) -> List[Ranked]:
+        if self._ranked is None:
+            self._ranked = sorted((-score, self.lengths[slot], slot) for slot, score in self.scores.items())
+        return self._ranked[:count]
+
+
+class CardSearchIndex:
+    # Serves card search from memory. The index catches up with the catalog
+    # lazily, on the first query after a card write.
+    def __init__(self, catalog: Optional[CardCatalog] = None):
+        self.catalog = catalog or card_catalog
+        self.kinds = {kind: KindIndex() for kind in CARD_KINDS}
+        self.version = -1
+        self.queries = 0
+        self.reindexed = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.catalog.loaded
+
+    def sync(self):
+        if self.version != self.catalog.version:
+            for kind, index in self.kinds.items():
+                changed = index.sync(self.catalog.pool(kind))
+                if changed:
+                    index.clear_cache()
+                self.reindexed += changed
+            self.version = self.catalog.version
+
+    def search(self, query: str, kinds: Tuple[str, ...] = CARD_KINDS, limit: int = 20,
+               offset: int = 0) -> Tuple[int, List[dict]]:
+        self.sync()
+        self.queries += 1
+        tokens = tokenize(query)
+        if not tokens:
+            return 0, []
+        prefix = query[-1:].isalnum()
+        total = 0
+        found = []
+        for kind in kinds:
+            matched, top = self.kinds[kind].search(tokens, prefix, offset + limit)
+            total += matched
+            found.extend((neg_score, length, kind, slot) for neg_score, length, slot in top)
+        # Ties go to shorter cards, then a stable order by slot.
+        found.sort()
+        results = []
+        for neg_score, _, kind, slot in found[offset:offset + limit]:
+            card = self.catalog.pool(kind).cards[slot]
+            results.append({"kind": kind, "id": card.id, "content": card.content, "score": round(-neg_score, 4)})
+        return total, results
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "terms": {kind: len(index.postings) for kind, index in self.kinds.items()},
+            "cachedTerms": {kind: len(index.cache) for kind, index in self.kinds.items()},
+            "queries": self.queries,
+            "reindexedCards": self.reindexed,
+        }
+
+
+async def search_database(query: str, kinds: Tuple[str, ...] = CARD_KINDS, limit: int = 20,
+                          offset: int = 0) -> Tuple[int, List[dict]]:
+    # Same contract, answered by Postgres through the pg_trgm indexes; used
+    # until the catalog is in memory.
+    total = 0
+    found = []
+    async with async_session() as session:
+        for kind in kinds:
+            model, _ = CARD_TABLES[kind]
+            score = func.similarity(model.content, query)
+            matches = or_(model.content.op("%")(query), model.content.ilike(f"%{escape_like(query)}%", escape="\\"))
+            total += (await session.execute(select(func.count()).select_from(model).where(matches))).scalar_one()
+            rows = await session.execute(
+                select(model.id, model.content, score).where(matches)
+                .order_by(score.desc(), func.length(model.content), model.id).limit(offset + limit)
+            )
+            found.extend({"kind": kind, "id": card_id, "content": content, "score": round(float(value), 4)}
+                         for card_id, content, value in rows.all())
+    found.sort(key=lambda row: (-row["score"], len(row["content"]), row["kind"], row["id"]))
+    return total, found[offset:offset + limit]
+
+
+card_search = CardSearchIndex()
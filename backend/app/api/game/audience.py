@@ -0,0 +1,99 @@
+﻿# file: app/api/game/audience.py
+
+import zlib
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set
+
+from app.api.game.scheduler import TimerHandle, scheduler
+
+
+class AudienceShard:
+    __slots__ = ("choices", "counts")
+
+    def __init__(self):
+        self.choices: Dict[str, str] = {}
+        self.counts: Counter = Counter()
+
+    def vote(self, spectator_id: str, voted_player_id: str) -> bool:
+        previous = self.choices.get(spectator_id)
+        if previous == voted_player_id:
+            return False
+        if previous is not None:
+            self.counts[previous] -= 1
+            if not self.counts[previous]:
+                del self.counts[previous]
+        self.choices[spectator_id] = voted_player_id
+        self.counts[voted_player_id] += 1
+        return True
+
+
+class AudienceVotes:
+    # Spectator votes and viewer counts for one game. Votes land in a shard
+    # picked by spectator id; totals are only merged from the shards on a
+    # short interval, so a burst of audience votes costs one state change.
+    def __init__(self, shards: int = 16, interval: float = 0.25, on_merge: Optional[Callable[[], None]] = None):
+        self.shards: List[AudienceShard] = [AudienceShard() for _ in range(shards)]
+        self.interval = interval
+        self.on_merge = on_merge
+        self.viewers_by_origin: Dict[int, int] = {}
+        self.totals: Dict[str, int] = {}
+        self.viewers = 0
+        self.received = 0
+        self.merges = 0
+        self._dirty: Set[int] = set()
+        self._viewers_dirty = False
+        self._handle: Optional[TimerHandle] = None
+
+    def _shard_of(self, spectator_id: str) -> int:
+        return zlib.crc32(spectator_id.encode()) % len(self.shards)
+
+    def vote(self, spectator_id: str, voted_player_id: str):
+        self.received += 1
+        index = self._shard_of(spectator_id)
+        if self.shards[index].vote(spectator_id, voted_player_id):
+            self._dirty.add(index)
+            self._schedule()
+
+    def set_viewers(self, origin: int, count: int):
+        if self.viewers_by_origin.get(origin, 0) == count:
+            return
+        if count:
+            self.viewers_by_origin[origin] = count
+        else:
+            self.viewers_by_origin.pop(origin, None)
+        self._viewers_dirty = True
+        self._schedule()
+
+    def clear(self):
+        for index, shard in enumerate(self.shards):
+            if shard.choices:
+                self.shards[index] = AudienceShard()
+        self._dirty.clear()
+        self.totals = {}
+
+    def _schedule(self):
+        if self._handle is None:
+            self._handle = scheduler.call_later(self.interval, self.merge)
+
+    def merge(self):
+        self._handle = None
+        if not self._dirty and not self._viewers_dirty:
+            return
+        totals: Counter = Counter()
+        for shard in self.shards:
+            totals.update(shard.counts)
+        self.totals = dict(totals)
+        self.viewers = sum(self.viewers_by_origin.values())
+        self._dirty.clear()
+        self._viewers_dirty = False
+        self.merges += 1
+        if self.on_merge is not None:
+            self.on_merge()
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def state(self) -> dict:
+        return {"viewers": self.viewers, "votes": self.totals}
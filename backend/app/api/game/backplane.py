@@ -0,0 +1,292 @@
+﻿# file: app/api/game/backplane.py
+
+import abc
+import asyncio
+import inspect
+import logging
+import os
+import signal
+from typing import Callable, Dict, List, Optional, Set
+
+from app.api.game.encoding import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], object]
+
+STREAM_LIMIT = 16 * 1024 * 1024
+RECONNECT_DELAYS = (0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 5.0, 5.0)
+
+
+class Backplane(abc.ABC):
+    # Fire-and-forget pub/sub between workers. publish() never blocks the
+    # caller; delivery happens on the subscriber's event loop.
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.reconnects = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self, worker_count: int) -> int:
+        return 0
+
+    async def close(self):
+        pass
+
+    def subscribe(self, channel: str, handler: Handler):
+        self.handlers.setdefault(channel, []).append(handler)
+
+    @abc.abstractmethod
+    def publish(self, channel: str, message: dict):
+        ...
+
+    def _dispatch(self, channel: str, message: dict):
+        for handler in self.handlers.get(channel, ()):
+            self.delivered += 1
+            try:
+                result = handler(message)
+            except Exception:
+                logger.exception("Backplane handler for %s failed", channel)
+                continue
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+
+class LocalBackplane(Backplane):
+    # In-process implementation used by tests and single-host setups where
+    # several nodes share one event loop.
+    def __init__(self):
+        super().__init__()
+        self._next_worker = 0
+
+    async def start(self, worker_count: int) -> int:
+        worker_id = self._next_worker % worker_count
+        self._next_worker += 1
+        return worker_id
+
+    def publish(self, channel: str, message: dict):
+        self.published += 1
+        asyncio.get_running_loop().call_soon(self._dispatch, channel, message)
+
+
+class BackplaneHub:
+    # Relays newline-delimited JSON between worker processes over a unix
+    # socket or TCP port and hands out worker slots on connect.
+    def __init__(self, address: str):
+        self.address = address
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.subscribers: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self.workers: Dict[int, asyncio.StreamWriter] = {}
+        self.connections: Set[asyncio.StreamWriter] = set()
+
+    async def start(self):
+        if self.address.startswith("unix:"):
+            path = self.address[5:]
+            if os.path.exists(path):
+                try:
+                    _, probe = await asyncio.open_unix_connection(path)
+                except OSError:
+                    os.unlink(path)
+                else:
+                    probe.close()
+                    raise OSError(f"Backplane hub already listening on {path}")
+            self.server = await asyncio.start_unix_server(self._serve, path=path, limit=STREAM_LIMIT)
+        else:
+            host, port = self.address.rsplit(":", 1)
+            self.server = await asyncio.start_server(self._serve, host, int(port), limit=STREAM_LIMIT)
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels: Set[str] = set()
+        worker_id = None
+        self.connections.add(writer)
+        try:
+            while line := await reader.readline():
+                message = loads(line)
+                op = message.get("op")
+                if op == "hello":
+                    count = int(message.get("count", 1))
+                    # A reconnecting worker asks for its old slot back.
+                    wanted = message.get("worker")
+                    if wanted is not None:
+                        worker_id = wanted if wanted not in self.workers else None
+                    else:
+                        worker_id = next((i for i in range(count) if i not in self.workers), None)
+                    if worker_id is not None:
+                        self.workers[worker_id] = writer
+                    writer.write((dumps({"op": "welcome", "worker": worker_id}) + "\n").encode())
+                elif op == "sub":
+                    channels.add(message["channel"])
+                    self.subscribers.setdefault(message["channel"], set()).add(writer)
+                elif op == "pub":
+                    payload = (dumps({"channel": message["channel"], "message": message["message"]}) + "\n").encode()
+                    for subscriber in self.subscribers.get(message["channel"], ()):
+                        subscriber.write(payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            for channel in channels:
+                self.subscribers.get(channel, set()).discard(writer)
+            if worker_id is not None and self.workers.get(worker_id) is writer:
+                del self.workers[worker_id]
+            writer.close()
+
+
+class SocketBackplane(Backplane):
+    # Connects to a BackplaneHub; the first worker that finds no hub
+    # listening starts one in its own process. If the hub goes away the
+    # worker reconnects (starting a new hub if need be), reclaims its slot
+    # and re-sends its subscriptions; when that keeps failing on_lost is
+    # called, which by default terminates the worker so it gets restarted.
+    def __init__(self, address: str, reconnect_delays=RECONNECT_DELAYS):
+        super().__init__()
+        self.address = address
+        self.reconnect_delays = reconnect_delays
+        self.hub: Optional[BackplaneHub] = None
+        self.worker_id: Optional[int] = None
+        self.worker_count = 1
+        self.on_lost: Callable[[], object] = self._terminate
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+
+    async def _open(self):
+        if self.address.startswith("unix:"):
+            return await asyncio.open_unix_connection(self.address[5:], limit=STREAM_LIMIT)
+        host, port = self.address.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port), limit=STREAM_LIMIT)
+
+    async def _connect(self, attempts: int = 20):
+        for _ in range(attempts):
+            try:
+                self._reader, self._writer = await self._open()
+                return
+            except OSError:
+                pass
+            if self.hub is None:
+                hub = BackplaneHub(self.address)
+                try:
+                    await hub.start()
+                    self.hub = hub
+                    continue
+                except OSError:
+                    pass
+            await asyncio.sleep(0.05)
+        raise ConnectionError(f"Backplane hub at {self.address} is unreachable")
+
+    async def _handshake(self) -> Optional[int]:
+        hello = {"op": "hello", "count": self.worker_count}
+        if self.worker_id is not None:
+            hello["worker"] = self.worker_id
+        self._send(hello)
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError(f"Backplane hub at {self.address} closed the connection")
+        worker_id = loads(line).get("worker")
+        if worker_id is not None:
+            for channel in self.handlers:
+                self._send({"op": "sub", "channel": channel})
+        return worker_id
+
+    async def start(self, worker_count: int) -> int:
+        self.worker_count = worker_count
+        await self._connect()
+        worker_id = await self._handshake()
+        if worker_id is None:
+            raise RuntimeError(f"All {worker_count} worker slots are taken")
+        self.worker_id = worker_id
+        self._read_task = asyncio.create_task(self._read_loop())
+        return worker_id
+
+    async def close(self):
+        if self._read_task:
+            self._read_task.cancel()
+        if self._writer:
+            self._writer.close()
+        if self.hub:
+            await self.hub.close()
+
+    def subscribe(self, channel: str, handler: Handler):
+        if channel not in self.handlers and self._writer is not None:
+            self._send({"op": "sub", "channel": channel})
+        super().subscribe(channel, handler)
+
+    def publish(self, channel: str, message: dict):
+        self.published += 1
+        if self._writer.is_closing():
+            # Messages published while reconnecting are lost, like any other
+            # fire-and-forget delivery to a worker that is down.
+            self.dropped += 1
+            return
+        self._send({"op": "pub", "channel": channel, "message": message})
+
+    def _send(self, message: dict):
+        self._writer.write((dumps(message) + "\n").encode())
+
+    async def _read_loop(self):
+        while True:
+            try:
+                while line := await self._reader.readline():
+                    envelope = loads(line)
+                    self._dispatch(envelope["channel"], envelope["message"])
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            logger.warning("Lost connection to backplane hub at %s, reconnecting", self.address)
+            self._writer.close()
+            if not await self._reconnect():
+                logger.critical(
+                    "Could not reconnect worker %s to backplane hub at %s", self.worker_id, self.address
+                )
+                self.on_lost()
+                return
+
+    async def _reconnect(self) -> bool:
+        for delay in self.reconnect_delays:
+            await asyncio.sleep(delay)
+            try:
+                await self._connect(attempts=2)
+                worker_id = await self._handshake()
+            except (OSError, ValueError):
+                continue
+            if worker_id != self.worker_id:
+                # Another process took our slot; the games sharded to it
+                # cannot have two owners.
+                logger.error("Backplane worker slot %s is taken by another process", self.worker_id)
+                self._writer.close()
+                return False
+            self.reconnects += 1
+            logger.info("Reconnected worker %s to backplane hub at %s", self.worker_id, self.address)
+            return True
+        return False
+
+    @staticmethod
+    def _terminate():
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+def create_backplane(kind: str, address: str) -> Backplane:
+    if kind == "socket":
+        return SocketBackplane(address)
+    if kind == "local":
+        return LocalBackplane()
+    raise ValueError(f"Unknown backplane: {kind}")
+
+
+if __name__ == "__main__":
+    async def _main():
+        hub = BackplaneHub(os.getenv("BACKPLANE_ADDRESS", "unix:/tmp/absurdly-backplane.sock"))
+        await hub.start()
+        await asyncio.Event().wait()
+
+    asyncio.run(_main())
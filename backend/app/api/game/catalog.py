@@ -0,0 +1,296 @@
+﻿# file: app/api/game/catalog.py
+
+import asyncio
+from array import array
+from itertools import chain
+from typing import Callable, Dict, Generic, Iterable, List, Optional, Sequence, TypeVar
+
+from sqlalchemy import select
+
+from app.api.db.database import async_session
+from app.api.db.models import BlackCard, WhiteCard, BlackCardDB, WhiteCardDB, CardPack, CardPackDB, PackCardDB
+from app.api.game.encoding import dumps
+
+CardT = TypeVar("CardT", BlackCard, WhiteCard)
+
+
+class CardPool(Generic[CardT]):
+    # Cards live in stable slots so games can keep integer references to them.
+    # Deleted cards leave a None tombstone instead of shifting the other slots.
+    def __init__(self):
+        self.cards: List[Optional[CardT]] = []
+        self.index: Dict[str, int] = {}
+        self.fragments: Dict[int, str] = {}
+        self.encoded: Dict[str, Dict[int, object]] = {}
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    @property
+    def live_count(self) -> int:
+        return len(self.index)
+
+    def get(self, slot: int) -> Optional[CardT]:
+        return self.cards[slot] if 0 <= slot < len(self.cards) else None
+
+    def find(self, card_id: str) -> Optional[CardT]:
+        slot = self.index.get(card_id)
+        return self.cards[slot] if slot is not None else None
+
+    def slot_of(self, card_id: str) -> Optional[int]:
+        return self.index.get(card_id)
+
+    def fragment(self, card: CardT) -> str:
+        # Encoded JSON of a card, cached per slot for as long as the slot
+        # still holds this exact card object.
+        slot = self.index.get(card.id)
+        if slot is None or self.cards[slot] is not card:
+            return dumps(card.model_dump())
+        encoded = self.fragments.get(slot)
+        if encoded is None:
+            encoded = self.fragments[slot] = dumps(card.model_dump())
+        return encoded
+
+    def encoded_card(self, card: CardT, codec) -> object:
+        # Same as fragment() for codecs other than JSON, cached per codec.
+        if codec.base == "json":
+            return self.fragment(card)
+        slot = self.index.get(card.id)
+        if slot is None or self.cards[slot] is not card:
+            return codec.encode(card.model_dump())
+        cache = self.encoded.setdefault(codec.base, {})
+        encoded = cache.get(slot)
+        if encoded is None:
+            encoded = cache[slot] = codec.encode(card.model_dump())
+        return encoded
+
+    def _forget(self, slot: int):
+        self.fragments.pop(slot, None)
+        for cache in self.encoded.values():
+            cache.pop(slot, None)
+
+    def live(self) -> List[CardT]:
+        return [card for card in self.cards if card is not None]
+
+    def put(self, card: CardT) -> int:
+        slot = self.index.get(card.id)
+        if slot is None:
+            slot = len(self.cards)
+            self.cards.append(card)
+            self.index[card.id] = slot
+        else:
+            self.cards[slot] = card
+            self._forget(slot)
+        return slot
+
+    def remove(self, card_id: str) -> bool:
+        slot = self.index.pop(card_id, None)
+        if slot is None:
+            return False
+        self.cards[slot] = None
+        self._forget(slot)
+        return True
+
+    def replace_all(self, cards: Iterable[CardT]):
+        seen = set()
+        for card in cards:
+            self.put(card)
+            seen.add(card.id)
+        for card_id in [cid for cid in self.index if cid not in seen]:
+            self.remove(card_id)
+
+
+CARD_MODELS = {"black": (BlackCard, BlackCardDB), "white": (WhiteCard, WhiteCardDB)}
+
+
+def _empty_slots() -> Dict[str, array]:
+    return {"black": array("i"), "white": array("i")}
+
+
+class CardCatalog:
+    def __init__(self):
+        self.black: CardPool[BlackCard] = CardPool()
+        self.white: CardPool[WhiteCard] = CardPool()
+        # Pack id -> kind -> catalog slots of its cards. Arrays are replaced,
+        # never changed in place, because decks keep them as their base.
+        self.packs: Dict[str, CardPack] = {}
+        self.pack_slots: Dict[str, Dict[str, array]] = {}
+        self.loaded = False
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.remote_changes = 0
+        # Called with every card and pack write made on this worker, so the
+        # cluster can apply it on the others (see apply_change).
+        self.on_change: Optional[Callable[[dict], None]] = None
+        self._lock = asyncio.Lock()
+
+    def _changed(self, change: dict):
+        if self.on_change is not None:
+            self.on_change(change)
+
+    def pool(self, kind: str) -> CardPool:
+        if kind == "black":
+            return self.black
+        if kind == "white":
+            return self.white
+        raise ValueError(f"Unknown card type: {kind}")
+
+    async def load(self):
+        async with async_session() as session:
+            black_result = await session.execute(select(BlackCardDB))
+            white_result = await session.execute(select(WhiteCardDB))
+            black_cards = [BlackCard.model_validate(card) for card in black_result.scalars().all()]
+            white_cards = [WhiteCard.model_validate(card) for card in white_result.scalars().all()]
+            pack_result = await session.execute(select(CardPackDB))
+            packs = [CardPack.model_validate(pack) for pack in pack_result.scalars().all()]
+            members = (await session.execute(select(PackCardDB.pack_id, PackCardDB.kind, PackCardDB.card_id))).all()
+        self.black.replace_all(black_cards)
+        self.white.replace_all(white_cards)
+        self.packs = {pack.id: pack for pack in packs}
+        self.pack_slots = {pack.id: _empty_slots() for pack in packs}
+        for pack_id, kind, card_id in members:
+            slot = self.pool(kind).slot_of(card_id)
+            if slot is not None and pack_id in self.pack_slots:
+                self.pack_slots[pack_id][kind].append(slot)
+        self.loaded = True
+        self.reloads += 1
+        self.version += 1
+
+    async def ensure_loaded(self):
+        if self.loaded:
+            self.hits += 1
+            return
+        self.misses += 1
+        async with self._lock:
+            if not self.loaded:
+                await self.load()
+
+    async def ensure_packs(self, pack_ids: Iterable[str]):
+        # A game playing with a few packs does not wait for the full catalog:
+        # until it is loaded, only the cards of the requested packs are read,
+        # through the pack_cards primary key.
+        if self.loaded or all(pack_id in self.pack_slots for pack_id in pack_ids):
+            self.hits += 1
+            return
+        self.misses += 1
+        async with self._lock:
+            missing = [pack_id for pack_id in pack_ids if pack_id not in self.pack_slots]
+            if missing and not self.loaded:
+                await self.load_packs(missing)
+
+    async def load_packs(self, pack_ids: List[str]):
+        rows = {}
+        async with async_session() as session:
+            pack_result = await session.execute(select(CardPackDB).where(CardPackDB.id.in_(pack_ids)))
+            packs = [CardPack.model_validate(pack) for pack in pack_result.scalars().all()]
+            for kind, (_, model) in CARD_MODELS.items():
+                result = await session.execute(
+                    select(PackCardDB.pack_id, model)
+                    .join(model, model.id == PackCardDB.card_id)
+                    .where(PackCardDB.pack_id.in_(pack_ids), PackCardDB.kind == kind)
+                )
+                rows[kind] = result.all()
+        slots = {pack.id: _empty_slots() for pack in packs}
+        for kind, kind_rows in rows.items():
+            card_model = CARD_MODELS[kind][0]
+            pool = self.pool(kind)
+            for pack_id, card in kind_rows:
+                slots[pack_id][kind].append(pool.put(card_model.model_validate(card)))
+        for pack in packs:
+            self.packs[pack.id] = pack
+        self.pack_slots.update(slots)
+        self.version += 1
+
+    def slots_of(self, kind: str, pack_ids: Sequence[str]) -> Sequence[int]:
+        # Deck base for a game's packs; a single pack is used as is.
+        arrays = [self.pack_slots[p][kind] for p in dict.fromkeys(pack_ids) if p in self.pack_slots]
+        if len(arrays) == 1:
+            return arrays[0]
+        return array("i", dict.fromkeys(chain.from_iterable(arrays)))
+
+    def set_pack(self, pack: CardPack):
+        self.packs[pack.id] = pack.model_copy(update={"blackCardIds": [], "whiteCardIds": []})
+        slots = _empty_slots()
+        for kind, card_ids in (("black", pack.blackCardIds), ("white", pack.whiteCardIds)):
+            pool = self.pool(kind)
+            slots[kind] = array("i", (s for s in map(pool.slot_of, dict.fromkeys(card_ids)) if s is not None))
+        self.pack_slots[pack.id] = slots
+        self.version += 1
+        self._changed({"op": "pack", "pack": pack.model_dump()})
+
+    def remove_pack(self, pack_id: str) -> bool:
+        self.pack_slots.pop(pack_id, None)
+        if self.packs.pop(pack_id, None) is None:
+            return False
+        self.version += 1
+        self._changed({"op": "remove_pack", "id": pack_id})
+        return True
+
+    def pack_summary(self, pack_id: str) -> dict:
+        pack = self.packs[pack_id]
+        slots = self.pack_slots.get(pack_id) or _empty_slots()
+        return {
+            "id": pack.id,
+            "name": pack.name,
+            "description": pack.description,
+            "blackCards": sum(self.black.get(slot) is not None for slot in slots["black"]),
+            "whiteCards": sum(self.white.get(slot) is not None for slot in slots["white"]),
+        }
+
+    def put(self, kind: str, card):
+        self.put_many(kind, [card])
+
+    def put_many(self, kind: str, cards: Iterable):
+        # One version bump for a whole batch, so the search index and page
+        # cache rebuild once rather than per card.
+        pool = self.pool(kind)
+        cards = list(cards)
+        for card in cards:
+            pool.put(card)
+        self.version += 1
+        self._changed({"op": "put", "kind": kind, "cards": [card.model_dump() for card in cards]})
+
+    def remove(self, kind: str, card_id: str) -> bool:
+        removed = self.pool(kind).remove(card_id)
+        if removed:
+            self.version += 1
+            self._changed({"op": "remove", "kind": kind, "id": card_id})
+        return removed
+
+    def apply_change(self, change: dict):
+        # A write made on another worker. It is applied like a local one,
+        # without being passed on again. Until the catalog is loaded, a pack
+        # is dropped instead so ensure_packs reads it with its cards.
+        self.remote_changes += 1
+        on_change, self.on_change = self.on_change, None
+        try:
+            op = change["op"]
+            if op == "put":
+                card_model = CARD_MODELS[change["kind"]][0]
+                self.put_many(change["kind"], [card_model.model_validate(card) for card in change["cards"]])
+            elif op == "remove":
+                self.remove(change["kind"], change["id"])
+            elif op == "pack" and self.loaded:
+                self.set_pack(CardPack.model_validate(change["pack"]))
+            elif op in ("pack", "remove_pack"):
+                self.remove_pack(change.get("id") or change["pack"]["id"])
+        finally:
+            self.on_change = on_change
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "version": self.version,
+            "blackCards": self.black.live_count,
+            "whiteCards": self.white.live_count,
+            "packs": len(self.packs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "remoteChanges": self.remote_changes,
+        }
+
+
+catalog = CardCatalog()
@@ -0,0 +1,196 @@
+﻿# file: app/api/game/cluster.py
+
+import base64
+import uuid
+import zlib
+from typing import Awaitable, Callable, Optional, Set
+
+from app.api.game.backplane import Backplane
+from app.api.game.codecs import CODECS, JSON, Codec, Frame
+from app.api.game.logic import Game
+from app.api.game.manager import ConnectionManager
+
+ActionHandler = Callable[[str, str, dict], Awaitable[None]]
+RESULTS_CHANNEL = "results"
+CATALOG_CHANNEL = "catalog"
+
+
+def shard_of(game_id: str, worker_count: int) -> int:
+    return zlib.crc32(game_id.encode()) % worker_count
+
+
+class RemoteConnection:
+    # Stands in for a socket held by another worker: frames queued for it are
+    # relayed over the backplane to the worker that owns the socket.
+    websocket = None
+    depth = 0
+
+    def __init__(self, backplane: Backplane, channel: str, game_id: str, player_id: str, codec: Codec = JSON):
+        self.backplane = backplane
+        self.channel = channel
+        self.game_id = game_id
+        self.player_id = player_id
+        self.codec = codec
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, frame: Frame, state: bool = False) -> bool:
+        if not self.closed:
+            message = {"kind": "frame", "game": self.game_id, "player": self.player_id, "state": state}
+            if isinstance(frame, bytes):
+                message["frame"] = base64.b64encode(frame).decode()
+                message["binary"] = True
+            else:
+                message["frame"] = frame
+            self.backplane.publish(self.channel, message)
+            self.sent += 1
+        return True
+
+    def replace_state(self, frame: Frame):
+        self.offer(frame, True)
+
+    @staticmethod
+    def lagging_for() -> float:
+        return 0.0
+
+    def close(self):
+        self.closed = True
+
+    async def evict(self, code: int = 1013):
+        self.close()
+
+
+class Cluster:
+    # Each game is owned by exactly one worker, picked by hashing its id.
+    # Sockets that land on another worker forward their actions to the owner
+    # and receive its frames back through the backplane.
+    def __init__(self, manager: ConnectionManager, backplane: Optional[Backplane] = None, worker_count: int = 1):
+        self.manager = manager
+        self.backplane = backplane
+        self.worker_count = worker_count
+        self.worker_id = 0
+        self.action_handler: Optional[ActionHandler] = None
+        self.result_handler: Optional[Callable[[dict], None]] = None
+        self.catalog_handler: Optional[Callable[[dict], None]] = None
+        self.watching: Set[str] = set()
+        self.forwarded = 0
+        self.relayed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backplane is not None and self.worker_count > 1
+
+    async def start(self):
+        if not self.enabled:
+            return
+        self.worker_id = await self.backplane.start(self.worker_count)
+        self.backplane.subscribe(self.channel(self.worker_id), self._on_message)
+        self.backplane.subscribe(RESULTS_CHANNEL, self._on_result)
+        self.backplane.subscribe(CATALOG_CHANNEL, self._on_catalog_change)
+        self.manager.audience_relay = self.relay_audience
+
+    async def close(self):
+        if self.backplane is not None:
+            await self.backplane.close()
+
+    @staticmethod
+    def channel(worker_id: int) -> str:
+        return f"worker:{worker_id}"
+
+    def owner_of(self, game_id: str) -> int:
+        return shard_of(game_id, self.worker_count) if self.enabled else self.worker_id
+
+    def owns(self, game_id: str) -> bool:
+        return game_id == "nogame" or self.owner_of(game_id) == self.worker_id
+
+    def new_game_id(self) -> str:
+        while True:
+            game_id = str(uuid.uuid4())[:8]
+            if self.owns(game_id):
+                return game_id
+
+    @staticmethod
+    def audience_channel(game_id: str) -> str:
+        return f"audience:{game_id}"
+
+    def watch(self, game_id: str):
+        # Spectators on a non-owner worker share one subscription to the
+        # owner's audience frames, however many of them there are.
+        if game_id in self.watching:
+            return
+        self.watching.add(game_id)
+        self.backplane.subscribe(
+            self.audience_channel(game_id),
+            lambda message: self.manager.fanout_audience(game_id, message["frame"]),
+        )
+
+    def relay_audience(self, game: Game, frame: str):
+        if any(origin != self.worker_id for origin in game.audience.viewers_by_origin):
+            self.backplane.publish(self.audience_channel(game.id), {"frame": frame})
+
+    def share_result(self, result: dict):
+        # Finished games are told to every worker so their leaderboards
+        # don't wait for the next reload.
+        if self.enabled:
+            self.backplane.publish(RESULTS_CHANNEL, {"origin": self.worker_id, "result": result})
+
+    def _on_result(self, message: dict):
+        if message["origin"] != self.worker_id and self.result_handler is not None:
+            self.result_handler(message["result"])
+
+    def share_catalog_change(self, change: dict):
+        # Card and pack writes go to every worker, so none of them keeps
+        # serving stale pages, search hits or decks.
+        if self.enabled:
+            self.backplane.publish(CATALOG_CHANNEL, {"origin": self.worker_id, "change": change})
+
+    def _on_catalog_change(self, message: dict):
+        if message["origin"] != self.worker_id and self.catalog_handler is not None:
+            self.catalog_handler(message["change"])
+
+    def _send(self, game_id: str, message: dict):
+        self.backplane.publish(self.channel(self.owner_of(game_id)), message)
+
+    def attach(self, game_id: str, player_id: str, codec: Codec = JSON):
+        self._send(game_id, {
+            "kind": "attach", "game": game_id, "player": player_id, "origin": self.worker_id, "codec": codec.name,
+        })
+
+    def forward(self, game_id: str, player_id: str, data: dict):
+        self.forwarded += 1
+        self._send(game_id, {"kind": "action", "game": game_id, "player": player_id, "data": data})
+
+    def detach(self, game_id: str, player_id: str):
+        self._send(game_id, {"kind": "detach", "game": game_id, "player": player_id})
+
+    async def _on_message(self, message: dict):
+        kind = message["kind"]
+        game_id = message["game"]
+        player_id = message["player"]
+        if kind == "frame":
+            self.relayed += 1
+            frame = base64.b64decode(message["frame"]) if message.get("binary") else message["frame"]
+            if not self.manager.relay(game_id, player_id, frame, message["state"]):
+                self.forward(game_id, player_id, {"action": "sync"})
+        elif kind == "attach":
+            channel = self.channel(message["origin"])
+            codec = CODECS.get(message.get("codec"), JSON)
+            self.manager.attach(game_id, player_id, RemoteConnection(self.backplane, channel, game_id, player_id, codec))
+        elif kind == "detach":
+            self.manager.disconnect(game_id, player_id)
+        elif kind == "action" and self.action_handler is not None:
+            await self.action_handler(game_id, player_id, message["data"])
+
+    def stats(self) -> dict:
+        return {
+            "workerId": self.worker_id,
+            "workerCount": self.worker_count,
+            "forwardedActions": self.forwarded,
+            "relayedFrames": self.relayed,
+            "watchedAudiences": len(self.watching),
+            "published": self.backplane.published if self.backplane else 0,
+            "delivered": self.backplane.delivered if self.backplane else 0,
+            "dropped": self.backplane.dropped if self.backplane else 0,
+            "reconnects": self.backplane.reconnects if self.backplane else 0,
+        }
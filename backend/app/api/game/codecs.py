@@ -0,0 +1,253 @@
+﻿# file: app/api/game/codecs.py
+
+import base64
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import unquote
+
+from app.api.game.encoding import dumps, encode_fields, loads
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+Frame = Union[str, bytes]
+# Pre-encoded members of an object: how many there are and their bytes,
+# so a message can be spliced from parts encoded at different times.
+Fields = Tuple[int, Frame]
+
+SUBPROTOCOL_PREFIX = "absurdly."
+
+# Field ids of the "fields" codec. Append only: clients keep old ids.
+FIELD_NAMES = (
+    "type", "version", "baseVersion", "changes", "gameId", "players", "blackCard", "currentRound",
+    "gamePhase", "route", "settings", "playerAnswers", "currentPresentationIndex", "deadline",
+    "winners", "votes", "answersCount", "audience", "playerId", "isHost", "whiteCards",
+    "votedPlayerId", "timeLeft", "serverTime", "selectedCardId", "id", "content", "nickname",
+    "score", "card", "cardsPerPlayer", "selectionTime", "votingTime", "maxPlayers", "viewers",
+    "message", "action", "cardId", "packs", "actions", "resumeToken",
+)
+FIELD_IDS = {name: i for i, name in enumerate(FIELD_NAMES)}
+
+
+class Codec:
+    name = "json"
+    binary = False
+
+    @property
+    def base(self) -> str:
+        # Codecs that only differ in compression share encoded parts.
+        return self.name
+
+    def encode(self, value) -> Frame:
+        return dumps(value)
+
+    def decode(self, data: Frame):
+        return loads(data)
+
+    def pairs(self, mapping: dict) -> Fields:
+        return len(mapping), encode_fields(mapping)
+
+    def pair(self, key: str, raw: Frame) -> Fields:
+        return 1, f"{dumps(key)}:{raw}"
+
+    def array(self, raws: Iterable[Frame]) -> Frame:
+        return "[" + ",".join(raws) + "]"
+
+    def obj(self, *parts: Fields) -> Frame:
+        return "{" + ",".join(body for count, body in parts if count) + "}"
+
+    def finish(self, raw: Frame) -> Frame:
+        return raw
+
+    def pack(self, value) -> Frame:
+        return self.finish(self.encode(value))
+
+
+def _map_header(count: int) -> bytes:
+    if count < 16:
+        return bytes((0x80 | count,))
+    if count < 0x10000:
+        return b"\xde" + count.to_bytes(2, "big")
+    return b"\xdf" + count.to_bytes(4, "big")
+
+
+def _array_header(count: int) -> bytes:
+    if count < 16:
+        return bytes((0x90 | count,))
+    if count < 0x10000:
+        return b"\xdc" + count.to_bytes(2, "big")
+    return b"\xdd" + count.to_bytes(4, "big")
+
+
+class MsgPackCodec(Codec):
+    name = "msgpack"
+    binary = True
+
+    def encode(self, value) -> bytes:
+        return msgpack.packb(value)
+
+    def decode(self, data: Frame):
+        return msgpack.unpackb(data, strict_map_key=False)
+
+    def pairs(self, mapping: dict) -> Fields:
+        packed = self.encode(mapping)
+        return len(mapping), packed[len(_map_header(len(mapping))):]
+
+    def pair(self, key: str, raw: Frame) -> Fields:
+        return 1, self.encode(key) + raw
+
+    def array(self, raws: Iterable[Frame]) -> bytes:
+        raws = list(raws)
+        return _array_header(len(raws)) + b"".join(raws)
+
+    def obj(self, *parts: Fields) -> bytes:
+        return _map_header(sum(count for count, _ in parts)) + b"".join(body for count, body in parts if count)
+
+
+def _to_ids(value):
+    if isinstance(value, dict):
+        return {FIELD_IDS.get(key, key): _to_ids(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_ids(item) for item in value]
+    return value
+
+
+def _to_names(value):
+    if isinstance(value, dict):
+        return {
+            FIELD_NAMES[key] if isinstance(key, int) and 0 <= key < len(FIELD_NAMES) else key: _to_names(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_to_names(item) for item in value]
+    return value
+
+
+class FieldIdCodec(MsgPackCodec):
+    # MessagePack with the known key names replaced by small integer ids.
+    name = "fields"
+
+    def encode(self, value) -> bytes:
+        return msgpack.packb(_to_ids(value))
+
+    def decode(self, data: Frame):
+        return _to_names(super().decode(data))
+
+    def pair(self, key: str, raw: Frame) -> Fields:
+        return 1, msgpack.packb(FIELD_IDS.get(key, key)) + raw
+
+
+def sample_state() -> dict:
+    # Typical keys and values of state frames; every codec's deflate
+    # dictionary is this sample encoded by the codec itself.
+    card = {"id": "00000000-0000-0000-0000-000000000000", "content": ""}
+    player = {"id": "00000000-0000-0000-0000-000000000000", "nickname": "", "score": 0}
+    return {
+        "type": "state_patch", "version": 0, "baseVersion": 0, "changes": {},
+        "gameId": "00000000", "players": [player], "blackCard": card, "currentRound": 0,
+        "gamePhase": "selection", "route": "/presentation/", "playerAnswers": [
+            {"playerId": player["id"], "nickname": "", "card": card},
+        ],
+        "settings": {"cardsPerPlayer": 5, "selectionTime": 15, "votingTime": 60, "maxPlayers": 10},
+        "currentPresentationIndex": 0, "deadline": 0, "winners": [], "votes": {}, "answersCount": 0,
+        "audience": {"viewers": 0, "votes": {}}, "playerId": "", "isHost": False, "whiteCards": [card],
+        "votedPlayerId": None, "timeLeft": 0, "serverTime": 0, "selectedCardId": None,
+        "others": ["game_update", "audience_update", "voting", "results", "lobby", "/game/", "/voting/"],
+    }
+
+
+class DeflateCodec(Codec):
+    # Per-message raw deflate primed with a shared dictionary. Messages are
+    # compressed independently (no context takeover), so identical frames
+    # sent to many sockets are compressed once.
+    binary = True
+
+    def __init__(self, inner: Codec):
+        self.inner = inner
+        self.name = f"{inner.name}+deflate"
+        sample = inner.encode(sample_state())
+        self.dictionary = sample.encode() if isinstance(sample, str) else sample
+        self._last: Optional[Tuple[Frame, bytes]] = None
+
+    @property
+    def base(self) -> str:
+        return self.inner.name
+
+    def encode(self, value) -> Frame:
+        return self.inner.encode(value)
+
+    def pairs(self, mapping: dict) -> Fields:
+        return self.inner.pairs(mapping)
+
+    def pair(self, key: str, raw: Frame) -> Fields:
+        return self.inner.pair(key, raw)
+
+    def array(self, raws: Iterable[Frame]) -> Frame:
+        return self.inner.array(raws)
+
+    def obj(self, *parts: Fields) -> Frame:
+        return self.inner.obj(*parts)
+
+    def finish(self, raw: Frame) -> bytes:
+        last = self._last
+        if last is not None and last[0] == raw:
+            return last[1]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=self.dictionary)
+        data = raw.encode() if isinstance(raw, str) else raw
+        compressed = compressor.compress(data) + compressor.flush()
+        self._last = (raw, compressed)
+        return compressed
+
+    def decode(self, data: Frame):
+        if isinstance(data, str):
+            return self.inner.decode(data)
+        decompressor = zlib.decompressobj(-15, zdict=self.dictionary)
+        raw = decompressor.decompress(data) + decompressor.flush()
+        return self.inner.decode(raw if self.inner.binary else raw.decode())
+
+
+JSON = Codec()
+
+
+def _build_codecs() -> Dict[str, Codec]:
+    bases: List[Codec] = [JSON]
+    if msgpack is not None:
+        bases += [MsgPackCodec(), FieldIdCodec()]
+    codecs = {codec.name: codec for codec in bases}
+    for codec in bases:
+        deflated = DeflateCodec(codec)
+        codecs[deflated.name] = deflated
+    return codecs
+
+
+CODECS = _build_codecs()
+
+
+def negotiate(websocket) -> Tuple[Codec, Optional[str]]:
+    # Subprotocols ("absurdly.msgpack+deflate") in the client's order of
+    # preference, then a ?codec= query parameter; JSON otherwise.
+    scope = getattr(websocket, "scope", None) or {}
+    for protocol in scope.get("subprotocols") or ():
+        if protocol.startswith(SUBPROTOCOL_PREFIX) and protocol[len(SUBPROTOCOL_PREFIX):] in CODECS:
+            return CODECS[protocol[len(SUBPROTOCOL_PREFIX):]], protocol
+    query = scope.get("query_string", b"").decode()
+    for part in query.split("&"):
+        key, _, value = part.partition("=")
+        if key == "codec" and unquote(value) in CODECS:
+            return CODECS[unquote(value)], None
+    return JSON, None
+
+
+def describe() -> dict:
+    return {
+        "default": JSON.name,
+        "codecs": list(CODECS),
+        "subprotocolPrefix": SUBPROTOCOL_PREFIX,
+        "fields": list(FIELD_NAMES),
+        "dictionaries": {
+            codec.inner.name: base64.b64encode(codec.dictionary).decode()
+            for codec in CODECS.values() if isinstance(codec, DeflateCodec)
+        },
+    }
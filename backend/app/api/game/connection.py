@@ -0,0 +1,112 @@
+﻿# file: app/api/game/connection.py
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional, Tuple
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+
+from app.api.game.codecs import JSON, Codec, Frame
+
+logger = logging.getLogger(__name__)
+
+
+class Connection:
+    # An outbound queue per socket drained by its own writer task, so a slow
+    # client never blocks the broadcast that produced its frames.
+    def __init__(self, websocket: WebSocket, player_id: str, max_queue: int, codec: Codec = JSON):
+        self.websocket = websocket
+        self.player_id = player_id
+        self.max_queue = max_queue
+        self.codec = codec
+        self.queue: Deque[Tuple[Frame, bool]] = deque()
+        self.sent = 0
+        self.dropped = 0
+        self.behind_since: Optional[float] = None
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def offer(self, frame: Frame, state: bool = False) -> bool:
+        if self.closed:
+            return True
+        if len(self.queue) >= self.max_queue:
+            if self.behind_since is None:
+                self.behind_since = time.monotonic()
+            self.dropped += 1
+            return False
+        self._push(frame, state)
+        return True
+
+    def replace_state(self, frame: Frame):
+        # Queued state frames are superseded by a fresh snapshot.
+        kept = deque(item for item in self.queue if not item[1])
+        self.dropped += len(self.queue) - len(kept)
+        self.queue = kept
+        self._push(frame, True)
+
+    def lagging_for(self) -> float:
+        return time.monotonic() - self.behind_since if self.behind_since is not None else 0.0
+
+    def _push(self, frame: Frame, state: bool):
+        self.queue.append((frame, state))
+        self._ready.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                while not self.queue:
+                    self.behind_since = None
+                    self._ready.clear()
+                    await self._ready.wait()
+                frame, _ = self.queue.popleft()
+                if self.websocket.application_state != WebSocketState.CONNECTED:
+                    break
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.debug("Dropping connection for %s after a failed send", self.player_id)
+        self.closed = True
+        self.queue.clear()
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        if not self._writer.done():
+            self._writer.cancel()
+
+    async def evict(self, code: int = 1013):
+        self.close()
+        if self.websocket.application_state == WebSocketState.CONNECTED:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+
+
+class SpectatorConnection(Connection):
+    # Spectators only ever need the latest frame, kept in a single slot that
+    # each new frame overwrites in place.
+    def __init__(self, websocket: WebSocket, player_id: str, codec: Codec = JSON):
+        super().__init__(websocket, player_id, 1, codec)
+
+    def replace_state(self, frame: Frame):
+        if self.closed:
+            return
+        if self.queue:
+            self.queue[0] = (frame, True)
+            self.dropped += 1
+        else:
+            self._push(frame, True)
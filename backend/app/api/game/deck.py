@@ -0,0 +1,67 @@
+﻿# file: app/api/game/deck.py
+
+import random
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+
+class Deck:
+    # A shuffled deck of catalog slots. The draw order is an incremental
+    # Fisher-Yates permutation where only the swapped positions are stored,
+    # so a deck over a million cards costs nothing until cards are drawn.
+    def __init__(self, size: int = 0, base: Optional[Sequence[int]] = None, rng: Optional[random.Random] = None):
+        self.rng = rng or random
+        self.discards: List[int] = []
+        self.excluded: Set[int] = set()
+        self._reset(size, base)
+
+    def _reset(self, size: int, base: Optional[Sequence[int]]):
+        self.base = base
+        self.size = len(base) if base is not None else size
+        self.position = 0
+        self.swaps: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.size - self.position
+
+    def _slot(self, offset: int) -> int:
+        return self.base[offset] if self.base is not None else offset
+
+    def exclude(self, slots: Iterable[int]):
+        # Slots that are already in play (e.g. hands restored from a
+        # snapshot) and must be skipped until the next reshuffle.
+        self.excluded.update(slots)
+
+    def draw(self) -> Optional[int]:
+        while True:
+            slot = self._draw()
+            if slot is None or slot not in self.excluded:
+                return slot
+
+    def _draw(self) -> Optional[int]:
+        if self.position >= self.size:
+            return None
+        head = self.position
+        pick = self.rng.randrange(head, self.size)
+        offset = self.swaps.get(pick, pick)
+        if pick != head:
+            self.swaps[pick] = self.swaps.pop(head, head)
+        else:
+            self.swaps.pop(head, None)
+        self.position += 1
+        return self._slot(offset)
+
+    def discard(self, slot: int):
+        self.discards.append(slot)
+
+    def remaining(self) -> List[int]:
+        slots = (self._slot(self.swaps.get(i, i)) for i in range(self.position, self.size))
+        return [slot for slot in slots if slot not in self.excluded]
+
+    def reshuffle(self):
+        # Undrawn cards and the discard pile form the next cycle; the new
+        # permutation is again produced lazily as cards are drawn.
+        pile = self.remaining() if self.position < self.size else []
+        pile.extend(self.discards)
+        self.discards = []
+        self.excluded = set()
+        self._reset(len(pile), pile)
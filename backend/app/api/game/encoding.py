@@ -0,0 +1,27 @@
+﻿# file: app/api/game/encoding.py
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_fields(fields: dict) -> str:
+    # The members of a JSON object without the surrounding braces, ready to
+    # be spliced into a larger message.
+    return dumps(fields)[1:-1]
+
@@ -0,0 +1,238 @@
+﻿# file: app/api/game/history.py
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.api.core.metrics import registry
+from app.api.db.database import async_session
+from app.api.db.models import GameResultDB, PlayerResultDB, PlayerStatsDB, RoundCardDB, RoundResultDB
+from app.api.game.encoding import dumps
+from app.api.game.leaderboard import stat_rows
+
+logger = logging.getLogger(__name__)
+
+history_dropped_total = registry.counter(
+    "absurdly_history_dropped_total", "Game history records dropped because the write buffer was full.", ["kind"],
+)
+
+
+# asyncpg allows 32767 bind parameters per statement.
+MAX_PARAMETERS = 30000
+
+
+def _chunks(rows: List[dict]) -> List[List[dict]]:
+    size = max(1, MAX_PARAMETERS // max(1, len(rows[0]))) if rows else 1
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def _timestamp(value: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
+
+
+class HistoryStore:
+    async def write(self, games: List[dict], rounds: List[dict]):
+        pass
+
+
+class DatabaseHistoryStore(HistoryStore):
+    # One transaction for the whole batch, with multi-row INSERTs chunked
+    # only to stay under the bind parameter limit. Rows are keyed by match
+    # and round, so a retried batch that partly made it in is harmless;
+    # leaderboard aggregates are only bumped for games that were actually
+    # inserted.
+    async def write(self, games: List[dict], rounds: List[dict]):
+        game_rows = [{
+            "match_id": game["match_id"],
+            "game_id": game["game_id"],
+            "rounds": game["rounds"],
+            "winner_ids": dumps(game["winner_ids"]),
+            "started_at": _timestamp(game["started_at"]),
+            "finished_at": _timestamp(game["finished_at"]),
+        } for game in games]
+        player_rows = [
+            {"match_id": game["match_id"], **player} for game in games for player in game["players"]
+        ]
+        round_rows = [{
+            "match_id": row["match_id"],
+            "round": row["round"],
+            "game_id": row["game_id"],
+            "black_card_id": row["black_card_id"],
+            "winner_ids": dumps(row["winner_ids"]),
+            "winning_card_ids": dumps(row["winning_card_ids"]),
+            "votes": dumps(row["votes"]),
+            "answers": row["answers"],
+            "finished_at": _timestamp(row["finished_at"]),
+        } for row in rounds]
+        card_rows = [{
+            "match_id": row["match_id"],
+            "round": row["round"],
+            "player_id": player_id,
+            "black_card_id": row["black_card_id"],
+            "white_card_id": card_id,
+            "votes": votes,
+            "won": won,
+        } for row in rounds for player_id, card_id, votes, won in row.get("plays", ())]
+        async with async_session() as session:
+            inserted = set()
+            for chunk in _chunks(game_rows):
+                result = await session.execute(
+                    insert(GameResultDB).values(chunk).on_conflict_do_nothing().returning(GameResultDB.match_id)
+                )
+                inserted.update(result.scalars().all())
+            for model, rows in ((PlayerResultDB, player_rows), (RoundResultDB, round_rows), (RoundCardDB, card_rows)):
+                for chunk in _chunks(rows):
+                    await session.execute(insert(model).values(chunk).on_conflict_do_nothing())
+            for chunk in _chunks(stat_rows(game for game in games if game["match_id"] in inserted)):
+                stmt = insert(PlayerStatsDB).values(chunk)
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=[PlayerStatsDB.period, PlayerStatsDB.player_id],
+                    set_={
+                        "nickname": stmt.excluded.nickname,
+                        "games": PlayerStatsDB.games + stmt.excluded.games,
+                        "wins": PlayerStatsDB.wins + stmt.excluded.wins,
+                        "points": PlayerStatsDB.points + stmt.excluded.points,
+                        "updated_at": func.now(),
+                    },
+                ))
+            await session.commit()
+
+
+def create_history_store(kind: str) -> HistoryStore:
+    if kind == "db":
+        return DatabaseHistoryStore()
+    if kind == "none":
+        return HistoryStore()
+    raise ValueError(f"Unknown history store: {kind}")
+
+
+class HistoryWriter:
+    # Write-behind buffer for round and game results. Games hand records
+    # over synchronously and never wait on the database; a background task
+    # writes them in batches when a batch fills up or the interval passes.
+    #
+    # The buffer is bounded. When it is full because the database is slow
+    # or down, the oldest round record is dropped to make room (rounds are
+    # the bulk of the traffic, and the game result still carries the final
+    # scores); game results are only dropped once no rounds are left.
+    # Failed writes are retried with exponential backoff.
+    def __init__(self, store: HistoryStore, max_pending: int = 10000, batch_size: int = 500,
+                 interval: float = 1.0, max_backoff: float = 30.0):
+        self.store = store
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.games: Deque[dict] = deque()
+        self.rounds: Deque[dict] = deque()
+        self.written: Dict[str, int] = {"game": 0, "round": 0}
+        self.dropped: Dict[str, int] = {"game": 0, "round": 0}
+        self.batches = 0
+        self.failures = 0
+        self.last_write_ms = 0.0
+        self._backoff = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self.games) + len(self.rounds)
+
+    def record(self, kind: str, row: dict):
+        if self.pending >= self.max_pending:
+            self._drop_oldest()
+        (self.games if kind == "game" else self.rounds).append(row)
+        if self._wake is not None and self.pending >= self.batch_size:
+            self._wake.set()
+
+    def _drop_oldest(self):
+        kind = "round" if self.rounds else "game"
+        (self.rounds if self.rounds else self.games).popleft()
+        self.dropped[kind] += 1
+        history_dropped_total.inc(kind)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval + self._backoff)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self.pending:
+                try:
+                    await self.flush_batch()
+                except Exception:
+                    self.failures += 1
+                    self._backoff = min(self.max_backoff, max(self.interval, self._backoff * 2))
+                    logger.exception("Writing game history failed, retrying in %.1fs", self.interval + self._backoff)
+                    break
+                self._backoff = 0.0
+                if self.pending < self.batch_size:
+                    break
+
+    async def flush_batch(self) -> int:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            games = [self.games.popleft() for _ in range(min(len(self.games), self.batch_size))]
+            rounds = [self.rounds.popleft() for _ in range(min(len(self.rounds), self.batch_size - len(games)))]
+            if not games and not rounds:
+                return 0
+            started = time.perf_counter()
+            try:
+                await self.store.write(games, rounds)
+            except BaseException:
+                # Put the batch back in front, then trim if new records
+                # filled the buffer meanwhile.
+                self.rounds.extendleft(reversed(rounds))
+                self.games.extendleft(reversed(games))
+                while self.pending > self.max_pending:
+                    self._drop_oldest()
+                raise
+            self.last_write_ms = (time.perf_counter() - started) * 1000
+            self.batches += 1
+            self.written["game"] += len(games)
+            self.written["round"] += len(rounds)
+            return len(games) + len(rounds)
+
+    async def close(self, timeout: float = 10.0):
+        # Stops the background task and writes whatever is left, giving up
+        # after `timeout` so a dead database cannot hold up shutdown.
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        deadline = time.monotonic() + timeout
+        while self.pending and time.monotonic() < deadline:
+            try:
+                await asyncio.wait_for(self.flush_batch(), max(0.0, deadline - time.monotonic()))
+            except Exception:
+                logger.exception("Could not flush game history on shutdown, %d records lost", self.pending)
+                break
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "maxPending": self.max_pending,
+            "written": dict(self.written),
+            "dropped": dict(self.dropped),
+            "batches": self.batches,
+            "failures": self.failures,
+            "lastWriteMs": round(self.last_write_ms, 2),
+        }
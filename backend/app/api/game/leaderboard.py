@@ -0,0 +1,311 @@
+﻿# file: app/api/game/leaderboard.py
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.api.core.config import settings
+from app.api.db.database import async_session
+from app.api.db.models import PlayerStatsDB
+from app.api.game.scheduler import TimerHandle, scheduler
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("wins", "games", "winRate")
+ALL_TIME = "all"
+
+
+def periods_of(timestamp: float) -> List[str]:
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    year, week, _ = moment.isocalendar()
+    return [ALL_TIME, f"month:{moment.year}-{moment.month:02d}", f"week:{year}-W{week:02d}"]
+
+
+def stat_rows(results: Iterable[dict]) -> List[dict]:
+    # Per (period, player) increments for a batch of game results, ready to
+    # be added onto the player_stats table.
+    rows: Dict[Tuple[str, str], dict] = {}
+    for result in results:
+        for period in periods_of(result["finished_at"]):
+            for player in result["players"]:
+                row = rows.get((period, player["player_id"]))
+                if row is None:
+                    row = rows[(period, player["player_id"])] = {
+                        "period": period, "player_id": player["player_id"], "games": 0, "wins": 0, "points": 0,
+                    }
+                row["nickname"] = player["nickname"]
+                row["games"] += 1
+                row["wins"] += player["rank"] == 1
+                row["points"] += player["score"]
+    return list(rows.values())
+
+
+class SortedKeys:
+    # A sorted list split into short sublists, so inserts and removals move
+    # a few hundred pointers instead of the whole list, and the rank of a
+    # key costs one pass over the sublist lengths plus a bisect.
+    def __init__(self, load: int = 512):
+        self.load = load
+        self._lists: List[list] = []
+        self._maxes: list = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def reset(self, keys: List[tuple]):
+        keys = sorted(keys)
+        self._lists = [keys[i:i + self.load] for i in range(0, len(keys), self.load)]
+        self._maxes = [sub[-1] for sub in self._lists]
+        self._len = len(keys)
+
+    def add(self, key: tuple):
+        self._len += 1
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            return
+        i = min(bisect_left(self._maxes, key), len(self._lists) - 1)
+        sub = self._lists[i]
+        insort(sub, key)
+        self._maxes[i] = sub[-1]
+        if len(sub) > 2 * self.load:
+            self._lists[i:i + 1] = [sub[:self.load], sub[self.load:]]
+            self._maxes[i:i + 1] = [sub[self.load - 1], sub[-1]]
+
+    def remove(self, key: tuple):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._lists):
+            return
+        sub = self._lists[i]
+        j = bisect_left(sub, key)
+        if j == len(sub) or sub[j] != key:
+            return
+        del sub[j]
+        self._len -= 1
+        if sub:
+            self._maxes[i] = sub[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+
+    def index(self, key: tuple) -> int:
+        i = bisect_left(self._maxes, key)
+        return sum(len(sub) for sub in self._lists[:i]) + (bisect_left(self._lists[i], key) if i < len(self._lists) else 0)
+
+    def slice(self, offset: int, limit: int) -> List[tuple]:
+        found = []
+        for sub in self._lists:
+            if offset >= len(sub):
+                offset -= len(sub)
+                continue
+            found.extend(sub[offset:offset + limit - len(found)])
+            offset = 0
+            if len(found) >= limit:
+                break
+        return found
+
+
+class PlayerStats:
+    __slots__ = ("player_id", "nickname", "games", "wins", "points")
+
+    def __init__(self, player_id: str, nickname: str, games: int = 0, wins: int = 0, points: int = 0):
+        self.player_id = player_id
+        self.nickname = nickname
+        self.games = games
+        self.wins = wins
+        self.points = points
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+    def to_dict(self, rank: Optional[int] = None) -> dict:
+        return {
+            "rank": rank,
+            "playerId": self.player_id,
+            "nickname": self.nickname,
+            "games": self.games,
+            "wins": self.wins,
+            "winRate": round(self.win_rate, 4),
+            "points": self.points,
+        }
+
+
+class Board:
+    # Stats of one period with a sorted index per metric. Ties rank by the
+    # other metric and then by player id, so every rank is unique.
+    def __init__(self, period: str, min_games: int = 5):
+        self.period = period
+        self.min_games = min_games
+        self.stats: Dict[str, PlayerStats] = {}
+        self.by_nickname: Dict[str, str] = {}
+        self.rankings: Dict[str, SortedKeys] = {metric: SortedKeys() for metric in METRICS}
+
+    def _key(self, metric: str, stats: PlayerStats) -> Optional[tuple]:
+        if metric == "wins":
+            return -stats.wins, stats.games, stats.player_id
+        if metric == "games":
+            return -stats.games, -stats.wins, stats.player_id
+        if stats.games < self.min_games:
+            return None
+        return -stats.win_rate, -stats.games, stats.player_id
+
+    def load(self, rows: Iterable[PlayerStats]):
+        for stats in rows:
+            self.stats[stats.player_id] = stats
+            self.by_nickname[stats.nickname] = stats.player_id
+        for metric, ranking in self.rankings.items():
+            ranking.reset([key for key in (self._key(metric, s) for s in self.stats.values()) if key is not None])
+
+    def apply(self, player_id: str, nickname: str, games: int, wins: int, points: int):
+        stats = self.stats.get(player_id)
+        if stats is None:
+            stats = self.stats[player_id] = PlayerStats(player_id, nickname)
+        else:
+            for metric, ranking in self.rankings.items():
+                key = self._key(metric, stats)
+                if key is not None:
+                    ranking.remove(key)
+        stats.nickname = nickname
+        stats.games += games
+        stats.wins += wins
+        stats.points += points
+        self.by_nickname[nickname] = player_id
+        for metric, ranking in self.rankings.items():
+            key = self._key(metric, stats)
+            if key is not None:
+                ranking.add(key)
+
+    def top(self, metric: str, limit: int, offset: int = 0) -> List[dict]:
+        keys = self.rankings[metric].slice(offset, limit)
+        return [self.stats[key[-1]].to_dict(offset + i + 1) for i, key in enumerate(keys)]
+
+    def player(self, player_id: str, metric: str) -> Optional[dict]:
+        stats = self.stats.get(player_id)
+        if stats is None:
+            return None
+        key = self._key(metric, stats)
+        return stats.to_dict(self.rankings[metric].index(key) + 1 if key is not None else None)
+
+    def size(self, metric: str) -> int:
+        return len(self.rankings[metric])
+
+
+class Leaderboards:
+    # All-time, current month and current week boards live in memory and
+    # are updated as each game finishes, on this worker or (through the
+    # cluster) on another one. Every interval the boards are rebuilt from
+    # the player_stats aggregates, which are the source of truth, so results
+    # missed by this worker or dropped by the history writer only skew the
+    # ranks until then. Older periods are read on demand and a few are kept.
+    def __init__(self, min_games: int = 5, cached_periods: int = 4, interval: float = 60):
+        self.min_games = min_games
+        self.cached_periods = cached_periods
+        self.interval = interval
+        self.boards: Dict[str, Board] = {}
+        self.past: "OrderedDict[str, Board]" = OrderedDict()
+        self.current: List[str] = []
+        self.recorded = 0
+        self.loads = 0
+        self.refreshes = 0
+        self._handle: Optional[TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0:
+            self._handle = scheduler.call_later(self.interval, self._tick)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self):
+        self._handle = scheduler.call_later(self.interval, self._tick)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._refresh())
+
+    async def _refresh(self):
+        try:
+            await self.refresh(time.time())
+        except Exception:
+            logger.exception("Reloading leaderboards failed")
+
+    async def refresh(self, now: float):
+        # The new boards are swapped in whole, so readers never see a
+        # half-loaded period.
+        boards = {period: await self._read(period) for period in periods_of(now)}
+        self.current = list(boards)
+        self.boards = boards
+        self.past.clear()
+        self.refreshes += 1
+
+    def _roll(self, now: float):
+        periods = periods_of(now)
+        if periods == self.current:
+            return
+        self.current = periods
+        for period in [p for p in self.boards if p not in periods]:
+            self.boards.pop(period)
+        for period in periods:
+            self.boards.setdefault(period, Board(period, self.min_games))
+
+    def record_game(self, result: dict):
+        self.recorded += 1
+        self._roll(result["finished_at"])
+        for period in periods_of(result["finished_at"]):
+            board = self.boards.get(period)
+            if board is None:
+                continue
+            for player in result["players"]:
+                board.apply(player["player_id"], player["nickname"], 1, int(player["rank"] == 1), player["score"])
+
+    async def _read(self, period: str) -> Board:
+        board = Board(period, self.min_games)
+        async with async_session() as session:
+            result = await session.stream(select(
+                PlayerStatsDB.player_id, PlayerStatsDB.nickname, PlayerStatsDB.games,
+                PlayerStatsDB.wins, PlayerStatsDB.points,
+            ).where(PlayerStatsDB.period == period))
+            board.load([PlayerStats(*row) async for row in result])
+        self.loads += 1
+        return board
+
+    async def load(self, now: float):
+        self.current = []
+        self.boards = {}
+        self._roll(now)
+        for period in self.current:
+            self.boards[period] = await self._read(period)
+
+    async def board(self, period: str) -> Board:
+        board = self.boards.get(period)
+        if board is not None:
+            return board
+        board = self.past.get(period)
+        if board is None:
+            board = self.past[period] = await self._read(period)
+            while len(self.past) > self.cached_periods:
+                self.past.popitem(last=False)
+        else:
+            self.past.move_to_end(period)
+        return board
+
+    def stats(self) -> dict:
+        return {
+            "periods": {period: len(board.stats) for period, board in self.boards.items()},
+            "cachedPastPeriods": list(self.past),
+            "recordedGames": self.recorded,
+            "loads": self.loads,
+            "refreshes": self.refreshes,
+        }
+
+
+leaderboards = Leaderboards(settings.LEADERBOARD_MIN_GAMES, interval=settings.LEADERBOARD_REFRESH_SECONDS)
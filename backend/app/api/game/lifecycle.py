@@ -0,0 +1,167 @@
+﻿# file: app/api/game/lifecycle.py
+
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.api.core.metrics import registry
+from app.api.game.deck import Deck
+from app.api.game.logic import Game
+from app.api.game.manager import ConnectionManager
+from app.api.game.scheduler import TimerHandle, scheduler
+
+evictions_total = registry.counter("absurdly_games_evicted_total", "Games dropped from memory, by reason.", ["reason"])
+
+
+def _deck_bytes(deck: Deck) -> int:
+    return 100 * len(deck.swaps) + 36 * (len(deck.base or ()) + len(deck.discards) + len(deck.excluded))
+
+
+def estimate_game_bytes(game: Game) -> int:
+    # A rough per-game footprint from the structures that grow with play;
+    # cards themselves are shared with the catalog and not counted.
+    return (
+        4096
+        + 600 * len(game.players)
+        + 64 * sum(len(hand) for hand in game.player_cards.values())
+        + 200 * len(game.player_answers)
+        + _deck_bytes(game.white_deck)
+        + _deck_bytes(game.black_deck)
+    )
+
+
+class GameLifecycle:
+    # Sweeps the games dict on an interval. Activity is read from each
+    # game's revision counter, so the hot path pays nothing for tracking.
+    # Finished games, games nobody is connected to, and games idle for
+    # too long are evicted after their TTL; caps on count and estimated
+    # memory evict the least recently active idle games first.
+    def __init__(self, games: Dict[str, Game], manager: ConnectionManager, finished_ttl: float = 600,
+                 abandoned_ttl: float = 300, idle_ttl: float = 3600, max_games: int = 5000,
+                 max_bytes: int = 512 * 1024 * 1024, interval: float = 30,
+                 clock: Callable[[], float] = time.time):
+        self.games = games
+        self.manager = manager
+        self.finished_ttl = finished_ttl
+        self.abandoned_ttl = abandoned_ttl
+        self.idle_ttl = idle_ttl
+        self.max_games = max_games
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.clock = clock
+        self.last_active: Dict[str, float] = {}
+        self.seen_revision: Dict[str, int] = {}
+        self.evicted: Dict[str, int] = {}
+        self.rejected = 0
+        self.footprint = 0
+        self.sweeps = 0
+        self.on_evict: Optional[Callable[[str], None]] = None
+        self._handle: Optional[TimerHandle] = None
+
+    def start(self):
+        if self.interval > 0:
+            self._handle = scheduler.call_later(self.interval, self._tick)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self):
+        self._handle = scheduler.call_later(self.interval, self._tick)
+        self.sweep()
+
+    def touch(self, game_id: str):
+        self.last_active[game_id] = self.clock()
+        game = self.games.get(game_id)
+        if game is not None:
+            self.seen_revision[game_id] = game.revision
+
+    def _refresh(self, now: float):
+        for game_id, game in self.games.items():
+            if self.seen_revision.get(game_id) != game.revision:
+                self.seen_revision[game_id] = game.revision
+                self.last_active[game_id] = now
+        for game_id in [gid for gid in self.last_active if gid not in self.games]:
+            self.last_active.pop(game_id, None)
+            self.seen_revision.pop(game_id, None)
+
+    def _connected(self, game_id: str) -> bool:
+        return bool(self.manager.active_connections.get(game_id)) or bool(self.manager.audiences.get(game_id))
+
+    def _expired_reason(self, game: Game, idle: float) -> Optional[str]:
+        if game.game_phase == "results" and idle > self.finished_ttl:
+            return "finished"
+        if idle > self.abandoned_ttl and not self._connected(game.id):
+            return "abandoned"
+        if idle > self.idle_ttl:
+            return "idle"
+        return None
+
+    def sweep(self) -> List[str]:
+        now = self.clock()
+        self.sweeps += 1
+        self._refresh(now)
+        evicted = []
+        for game_id, game in list(self.games.items()):
+            reason = self._expired_reason(game, now - self.last_active.get(game_id, now))
+            if reason is not None:
+                self.evict(game_id, reason)
+                evicted.append(game_id)
+        evicted.extend(self._enforce_caps(self.max_games))
+        return evicted
+
+    def _enforce_caps(self, max_games: int) -> List[str]:
+        self.footprint = sum(estimate_game_bytes(game) for game in self.games.values())
+        if len(self.games) <= max_games and self.footprint <= self.max_bytes:
+            return []
+        # Least recently active first; games with connected players go last
+        # and are never evicted for a cap while they are still being played.
+        candidates = sorted(
+            (gid for gid, game in self.games.items() if game.game_phase == "results" or not self._connected(gid)),
+            key=lambda gid: self.last_active.get(gid, 0),
+        )
+        evicted = []
+        for game_id in candidates:
+            if len(self.games) <= max_games and self.footprint <= self.max_bytes:
+                break
+            self.footprint -= estimate_game_bytes(self.games[game_id])
+            self.evict(game_id, "capacity")
+            evicted.append(game_id)
+        return evicted
+
+    def admit(self) -> bool:
+        # Called before a new game is created; makes room if possible.
+        if len(self.games) < self.max_games and self.footprint < self.max_bytes:
+            return True
+        self._refresh(self.clock())
+        self._enforce_caps(self.max_games - 1)
+        if len(self.games) < self.max_games and self.footprint < self.max_bytes:
+            return True
+        self.rejected += 1
+        return False
+
+    def evict(self, game_id: str, reason: str):
+        game = self.games.pop(game_id, None)
+        if game is None:
+            return
+        game.cancel_timer()
+        game.audience.cancel()
+        game.notify = None
+        self.manager.close_game(game_id)
+        self.last_active.pop(game_id, None)
+        self.seen_revision.pop(game_id, None)
+        self.evicted[reason] = self.evicted.get(reason, 0) + 1
+        evictions_total.inc(reason)
+        if self.on_evict is not None:
+            self.on_evict(game_id)
+
+    def stats(self) -> dict:
+        return {
+            "games": len(self.games),
+            "maxGames": self.max_games,
+            "estimatedBytes": self.footprint,
+            "maxBytes": self.max_bytes,
+            "evicted": dict(self.evicted),
+            "rejected": self.rejected,
+            "sweeps": self.sweeps,
+        }
@@ -1,97 +1,255 @@
 ﻿# file: app/game/logic.py
 
+import math
 import random
-import asyncio
-from typing import List, Dict, Optional, Callable, Awaitable
+import time
+import uuid
+from collections import Counter
+from typing import List, Dict, Optional, Callable, Set
 from fastapi import WebSocket
 
+from app.api.core.config import settings as app_settings
 from app.api.db.models import (
     BlackCard,
     WhiteCard,
     Player,
     PlayerAnswer,
     GameSettings,
-    BlackCardDB,
-    WhiteCardDB,
 )
-from sqlalchemy import select
-from app.api.db.database import async_session
+from app.api.game.audience import AudienceVotes
+from app.api.game.catalog import CardCatalog, CardPool, catalog as card_catalog
+from app.api.game.deck import Deck
+from app.api.game.scheduler import TimerHandle, scheduler
 
 class Game:
-    def __init__(self, game_id: str, host_id: str):
+    def __init__(self, game_id: str, host_id: str, catalog: Optional[CardCatalog] = None):
         self.id = game_id
         self.host_id = host_id
         self.players: List[Player] = []
-        self.black_cards: List[BlackCard] = []
-        self.white_cards: List[WhiteCard] = []
-        self.used_black_cards: List[BlackCard] = []
-        self.used_white_cards: List[WhiteCard] = []
+        self.player_index: Dict[str, Player] = {}
+        self.nicknames: Set[str] = set()
+        self.black_deck = Deck()
+        self.white_deck = Deck()
         self.player_cards: Dict[str, List[WhiteCard]] = {}
         self.current_black_card: Optional[BlackCard] = None
         self.player_answers: List[PlayerAnswer] = []
-        self.votes: Dict[str, str] = {}
+        self.answered: Dict[str, PlayerAnswer] = {}
+        self._votes: Dict[str, str] = {}
+        self.vote_counts: Counter = Counter()
         self.current_round = 0
         self.round_winners: List[str] = []
         self.game_phase = "lobby"
         self.settings = GameSettings()
         self.connections: Dict[str, WebSocket] = {}
-        self.timer_task: Optional[asyncio.Task] = None
-        self.presentation_task: Optional[asyncio.Task] = None
+        self.timer_handle: Optional[TimerHandle] = None
+        self.deadline: Optional[float] = None
         self.current_presentation_index = 0
-        self.timer_value = 0
-        self.notify: Optional[Callable[[], Awaitable[None]]] = None
+        self.notify: Optional[Callable[[], None]] = None
+        self.record: Optional[Callable[[str, dict], None]] = None
+        self.match_id: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.catalog = catalog or card_catalog
+        self.revision = 0
+        self.audience = AudienceVotes(
+            app_settings.AUDIENCE_SHARDS, app_settings.AUDIENCE_MERGE_MS / 1000, self.mark_dirty,
+        )
+
+    @property
+    def votes(self) -> Dict[str, str]:
+        return self._votes
+
+    @votes.setter
+    def votes(self, votes: Dict[str, str]):
+        # Assigning a whole vote map rebuilds the counters; single votes go
+        # through submit_vote so the counters stay incremental.
+        self._votes = dict(votes)
+        self.vote_counts = Counter(self._votes.values())
+
+    def reindex(self):
+        self.player_index = {p.id: p for p in self.players}
+        self.nicknames = {p.nickname for p in self.players}
+        self.answered = {ans.playerId: ans for ans in self.player_answers}
+        self.votes = self._votes
+
+    def reset_round(self):
+        self.player_answers.clear()
+        self.answered.clear()
+        self._votes.clear()
+        self.vote_counts.clear()
+        self.audience.clear()
+
+    def mark_dirty(self):
+        self.revision += 1
+        if self.notify:
+            self.notify()
+
+    def to_snapshot(self) -> dict:
+        return {
+            "id": self.id,
+            "hostId": self.host_id,
+            "phase": self.game_phase,
+            "round": self.current_round,
+            "settings": self.settings.model_dump(),
+            "players": [[p.id, p.nickname, p.score] for p in self.players],
+            "hands": {player_id: [c.id for c in hand] for player_id, hand in self.player_cards.items()},
+            "blackCard": self.current_black_card.id if self.current_black_card else None,
+            "answers": [[ans.playerId, ans.card.id] for ans in self.player_answers],
+            "votes": dict(self.votes),
+            "presentationIndex": self.current_presentation_index,
+            "deadline": self.deadline,
+            "matchId": self.match_id,
+            "startedAt": self.started_at,
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict, catalog: Optional[CardCatalog] = None) -> "Game":
+        # Decks are not stored: they restart as fresh permutations of the
+        # catalog that skip every card still held in a hand or on the table.
+        game = cls(game_id=data["id"], host_id=data["hostId"], catalog=catalog)
+        white, black = game.catalog.white, game.catalog.black
+        game.game_phase = data["phase"]
+        game.current_round = data["round"]
+        game.settings = GameSettings.model_validate(data["settings"])
+        game.players = [Player(id=pid, nickname=nickname, score=score) for pid, nickname, score in data["players"]]
+        game.player_cards = {
+            player_id: [card for card in map(white.find, card_ids) if card is not None]
+            for player_id, card_ids in data["hands"].items()
+        }
+        game.current_black_card = black.find(data["blackCard"]) if data["blackCard"] else None
+        game.reindex()
+        for player_id, card_id in data["answers"]:
+            card = white.find(card_id)
+            player = game.player_index.get(player_id)
+            if card is not None and player is not None:
+                answer = PlayerAnswer(playerId=player_id, nickname=player.nickname, card=card)
+                game.player_answers.append(answer)
+                game.answered[player_id] = answer
+        game.votes = data["votes"]
+        game.current_presentation_index = data["presentationIndex"]
+        game.deadline = data["deadline"]
+        game.match_id = data.get("matchId")
+        game.started_at = data.get("startedAt")
+        if game.game_phase != "lobby":
+            game.build_decks()
+            in_play = [c for hand in game.player_cards.values() for c in hand] + [a.card for a in game.player_answers]
+            game.white_deck.exclude(white.slot_of(c.id) for c in in_play)
+            if game.current_black_card is not None:
+                game.black_deck.exclude([black.slot_of(game.current_black_card.id)])
+        return game
+
+    def resume_timer(self):
+        callbacks = {
+            "selection": self._on_selection_timeout,
+            "presentation": self._transition_to_voting,
+            "voting": self._on_voting_timeout,
+        }
+        deadline = self.deadline
+        if deadline is None or self.game_phase not in callbacks:
+            return
+        self.cancel_timer()
+        self.deadline = deadline
+        self.timer_handle = scheduler.call_at(deadline, callbacks[self.game_phase])
+
+    @property
+    def timer_value(self) -> int:
+        if self.deadline is None:
+            return 0
+        return max(0, math.ceil(self.deadline - scheduler.clock()))
 
     async def load_cards(self):
-        async with async_session() as session:
-            black_result = await session.execute(select(BlackCardDB))
-            white_result = await session.execute(select(WhiteCardDB))
-            self.black_cards = [BlackCard.model_validate(card) for card in black_result.scalars().all()]
-            self.white_cards = [WhiteCard.model_validate(card) for card in white_result.scalars().all()]
-        random.shuffle(self.black_cards)
-        random.shuffle(self.white_cards)
+        if self.settings.packs:
+            await self.catalog.ensure_packs(self.settings.packs)
+        else:
+            await self.catalog.ensure_loaded()
+        self.build_decks()
+
+    def build_decks(self):
+        # With packs chosen the decks only span their cards' slots.
+        packs = self.settings.packs
+        if packs:
+            self.black_deck = Deck(base=self.catalog.slots_of("black", packs))
+            self.white_deck = Deck(base=self.catalog.slots_of("white", packs))
+        else:
+            self.black_deck = Deck(len(self.catalog.black))
+            self.white_deck = Deck(len(self.catalog.white))
+
+    def choose_packs(self, pack_ids: List[str]):
+        if pack_ids == self.settings.packs:
+            return
+        if self.game_phase != "lobby":
+            raise ValueError("Card packs can only be changed in the lobby")
+        self.settings = self.settings.model_copy(update={"packs": list(dict.fromkeys(pack_ids))})
+        self.black_deck = Deck()
+        self.white_deck = Deck()
+
+    @staticmethod
+    def _draw(deck: Deck, pool: CardPool):
+        while True:
+            slot = deck.draw()
+            if slot is None:
+                return None
+            card = pool.get(slot)
+            if card is not None:
+                return card
 
     def add_player(self, player_id: str, nickname: str) -> Player:
-        if any(p.id == player_id for p in self.players):
-            return next(p for p in self.players if p.id == player_id)
+        existing = self.player_index.get(player_id)
+        if existing is not None:
+            return existing
         if len(self.players) >= self.settings.maxPlayers:
             raise ValueError("Game is full")
-        if any(p.nickname == nickname for p in self.players):
+        while nickname in self.nicknames:
             nickname += f"_{random.randint(1, 999)}"
         player = Player(id=player_id, nickname=nickname)
         self.players.append(player)
+        self.player_index[player_id] = player
+        self.nicknames.add(nickname)
         return player
 
     def remove_player(self, player_id: str):
-        self.players = [p for p in self.players if p.id != player_id]
+        player = self.player_index.pop(player_id, None)
+        if player is None:
+            return
+        self.players.remove(player)
+        self.nicknames.discard(player.nickname)
         self.connections.pop(player_id, None)
         if player_id == self.host_id and self.players:
             self.host_id = self.players[0].id
         if len(self.players) < 2 and self.game_phase != "lobby":
             self.end_game()
 
+    def _discard_white(self, card: WhiteCard):
+        slot = self.catalog.white.slot_of(card.id)
+        if slot is not None:
+            self.white_deck.discard(slot)
+
     def deal_cards(self):
         for player in self.players:
-            if len(self.white_cards) < self.settings.cardsPerPlayer:
-                self.white_cards.extend(self.used_white_cards)
-                self.used_white_cards.clear()
-                random.shuffle(self.white_cards)
-            hand = [self.white_cards.pop(0) for _ in range(self.settings.cardsPerPlayer) if self.white_cards]
+            for card in self.player_cards.get(player.id, []):
+                self._discard_white(card)
+            if len(self.white_deck) < self.settings.cardsPerPlayer:
+                self.white_deck.reshuffle()
+            hand = []
+            for _ in range(self.settings.cardsPerPlayer):
+                card = self._draw(self.white_deck, self.catalog.white)
+                if card is None:
+                    break
+                hand.append(card)
             self.player_cards[player.id] = hand
 
     def select_black_card(self):
-        if not self.black_cards:
-            self.black_cards.extend(self.used_black_cards)
-            self.used_black_cards.clear()
-            random.shuffle(self.black_cards)
-        if self.black_cards:
-            self.current_black_card = self.black_cards.pop(0)
-            self.used_black_cards.append(self.current_black_card)
+        if not self.black_deck:
+            self.black_deck.reshuffle()
+        card = self._draw(self.black_deck, self.catalog.black)
+        if card is not None:
+            self.current_black_card = card
+            self.black_deck.discard(self.catalog.black.slot_of(card.id))
 
     def submit_answer(self, player_id: str, card_id: str) -> bool:
-        if any(ans.playerId == player_id for ans in self.player_answers):
+        if player_id in self.answered:
             return False
-        player = next((p for p in self.players if p.id == player_id), None)
-        if not player:
+        player = self.player_index.get(player_id)
+        if player is None:
             return False
         hand = self.player_cards.get(player_id, [])
         chosen_card = next((c for c in hand if c.id == card_id), None)
@@ -99,117 +257,155 @@ class Game:
             return False
         answer = PlayerAnswer(playerId=player_id, nickname=player.nickname, card=chosen_card)
         self.player_answers.append(answer)
+        self.answered[player_id] = answer
         self.player_cards[player_id] = [c for c in hand if c.id != card_id]
-        self.used_white_cards.append(chosen_card)
+        self._discard_white(chosen_card)
         if len(self.player_answers) >= len(self.players) and self.game_phase == "selection":
             self.cancel_timer()
-            asyncio.create_task(self._transition_to_presentation())
-        if self.notify:
-            asyncio.create_task(self.notify())
+            self._transition_to_presentation()
+        self.mark_dirty()
         return True
 
     def submit_vote(self, voter_id: str, voted_player_id: str) -> bool:
-        self.votes[voter_id] = voted_player_id
+        previous = self._votes.get(voter_id)
+        if previous == voted_player_id:
+            return True
+        if previous is not None:
+            self.vote_counts[previous] -= 1
+            if not self.vote_counts[previous]:
+                del self.vote_counts[previous]
+        self._votes[voter_id] = voted_player_id
+        self.vote_counts[voted_player_id] += 1
         if len(self.votes) == len(self.players) and self.game_phase == "voting":
             self.cancel_timer()
             self.tally_votes()
             self.next_round()
-        if self.notify:
-            asyncio.create_task(self.notify())
+        self.mark_dirty()
+        return True
+
+    def submit_audience_vote(self, spectator_id: str, voted_player_id: str) -> bool:
+        if self.game_phase != "voting" or voted_player_id not in self.player_index:
+            return False
+        self.audience.vote(spectator_id, voted_player_id)
         return True
 
     def tally_votes(self):
-        vote_counts = {}
-        for voted in self.votes.values():
-            vote_counts[voted] = vote_counts.get(voted, 0) + 1
-        if not vote_counts:
-            return []
-        max_votes = max(vote_counts.values())
-        winners = [pid for pid, count in vote_counts.items() if count == max_votes]
-        for winner_id in winners:
-            winner = next((p for p in self.players if p.id == winner_id), None)
-            if winner:
-                winner.score += 1
+        winners = []
+        if self.vote_counts:
+            max_votes = max(self.vote_counts.values())
+            winners = [pid for pid, count in self.vote_counts.items() if count == max_votes]
+            for winner_id in winners:
+                winner = self.player_index.get(winner_id)
+                if winner is not None:
+                    winner.score += 1
+        if self.record is not None and self.match_id is not None:
+            self.record("round", {
+                "match_id": self.match_id,
+                "round": self.current_round,
+                "game_id": self.id,
+                "black_card_id": self.current_black_card.id if self.current_black_card else None,
+                "winner_ids": winners,
+                "winning_card_ids": [self.answered[pid].card.id for pid in winners if pid in self.answered],
+                "votes": dict(self.vote_counts),
+                "answers": len(self.player_answers),
+                "plays": [
+                    [ans.playerId, ans.card.id, self.vote_counts.get(ans.playerId, 0), ans.playerId in winners]
+                    for ans in self.player_answers
+                ],
+                "finished_at": time.time(),
+            })
         return winners
 
     async def start_game(self):
         if len(self.players) < 2:
             raise ValueError("Need at least 2 players to start")
-        if not self.black_cards or not self.white_cards:
+        if not self.black_deck or not self.white_deck:
             await self.load_cards()
         self.current_round = 0
         self.game_phase = "selection"
-        self.player_answers.clear()
-        self.votes.clear()
+        self.match_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.reset_round()
         self.round_winners.clear()
         self.deal_cards()
         self.select_black_card()
-        self.timer_value = self.settings.selectionTime
-        self.timer_task = asyncio.create_task(self._run_selection_timer())
-        if self.notify:
-            await self.notify()
-
-    async def _run_selection_timer(self):
-        while self.timer_value > 0 and self.game_phase == "selection":
-            await asyncio.sleep(1)
-            self.timer_value -= 1
-            if self.notify:
-                await self.notify()
-        if self.game_phase == "selection":
-            for player in self.players:
-                if not any(ans.playerId == player.id for ans in self.player_answers):
-                    hand = self.player_cards.get(player.id, [])
-                    if hand:
-                        self.submit_answer(player.id, random.choice(hand).id)
-            await self._transition_to_presentation()
-
-    async def _transition_to_presentation(self):
-        self.game_phase = "presentation"
+        self.start_timer(self.settings.selectionTime, self._on_selection_timeout)
+        self.mark_dirty()
+
+    def start_timer(self, seconds: float, on_expire: Callable):
         self.cancel_timer()
-        if self.notify:
-            await self.notify()
-        await asyncio.sleep(5)
-        await self._transition_to_voting()
+        self.deadline = scheduler.clock() + seconds
+        self.timer_handle = scheduler.call_at(self.deadline, on_expire)
 
-    async def _transition_to_voting(self):
+    def _on_selection_timeout(self):
+        if self.game_phase != "selection":
+            return
+        for player in list(self.players):
+            if player.id not in self.answered:
+                hand = self.player_cards.get(player.id, [])
+                if hand:
+                    self.submit_answer(player.id, random.choice(hand).id)
+        self._transition_to_presentation()
+
+    def _transition_to_presentation(self):
+        if self.game_phase != "selection":
+            return
+        self.game_phase = "presentation"
+        self.start_timer(app_settings.PRESENTATION_SECONDS, self._transition_to_voting)
+        self.mark_dirty()
+
+    def _transition_to_voting(self):
+        if self.game_phase != "presentation":
+            return
         self.game_phase = "voting"
-        self.timer_value = self.settings.votingTime
-        if self.notify:
-            await self.notify()
-        self.timer_task = asyncio.create_task(self._run_voting_timer())
-
-    async def _run_voting_timer(self):
-        while self.timer_value > 0 and self.game_phase == "voting":
-            await asyncio.sleep(1)
-            self.timer_value -= 1
-            if self.notify:
-                await self.notify()
+        self.start_timer(self.settings.votingTime, self._on_voting_timeout)
+        self.mark_dirty()
+
+    def _on_voting_timeout(self):
         if self.game_phase == "voting":
             self.tally_votes()
             self.next_round()
 
     def next_round(self):
-        self.player_answers.clear()
-        self.votes.clear()
+        self.reset_round()
         self.current_round += 1
         if any(len(hand) == 0 for hand in self.player_cards.values()):
             self.end_game()
             return False
         self.game_phase = "selection"
-        self.timer_value = self.settings.selectionTime
         self.select_black_card()
-        self.timer_task = asyncio.create_task(self._run_selection_timer())
-        if self.notify:
-            asyncio.create_task(self.notify())
+        self.start_timer(self.settings.selectionTime, self._on_selection_timeout)
+        self.mark_dirty()
         return True
 
     def end_game(self):
         self.game_phase = "results"
         self.players.sort(key=lambda p: p.score, reverse=True)
         self.cancel_timer()
+        if self.record is not None and self.match_id is not None:
+            self.record("game", self.result())
+        self.match_id = None
+
+    def result(self) -> dict:
+        # Final standings; tied players share a rank.
+        scores = [p.score for p in self.players]
+        players = [
+            {"player_id": p.id, "nickname": p.nickname, "score": p.score,
+             "rank": 1 + sum(score > p.score for score in scores)}
+            for p in self.players
+        ]
+        return {
+            "match_id": self.match_id,
+            "game_id": self.id,
+            "rounds": self.current_round,
+            "winner_ids": [entry["player_id"] for entry in players if entry["rank"] == 1],
+            "players": players,
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+        }
 
     def cancel_timer(self):
-        if self.timer_task and not self.timer_task.done():
-            self.timer_task.cancel()
-        if self.presentation_task and not self.presentation_task.done():
-            self.presentation_task.cancel()
+        if self.timer_handle:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+        self.deadline = None
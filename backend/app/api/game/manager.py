@@ -1,68 +1,335 @@
 ﻿# file: app/game/manager.py
 
-from typing import Dict
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from fastapi import WebSocket
-from starlette.websockets import WebSocketState
+from app.api.core.config import settings
+from app.api.core.metrics import broadcast_bytes, broadcast_seconds, registry
+from app.api.game.codecs import JSON, Codec, Frame, negotiate
+from app.api.game.connection import Connection, SpectatorConnection
+from app.api.game.encoding import loads
 from app.api.game.logic import Game
+from app.api.game.state import StateTracker, shared_state
+
+AUDIENCE_FANOUT_BATCH = 1000
+
+resumes_total = registry.counter(
+    "absurdly_resumes_total", "Reconnects with a resume token, by outcome (replayed or snapshot).", ["outcome"],
+)
+
+Encoder = Callable[[Codec], Frame]
+
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
+        self.active_connections: Dict[str, Dict[str, Connection]] = {}
+        self.trackers: Dict[str, StateTracker] = {}
+        self.audiences: Dict[str, Dict[str, Connection]] = {}
+        self.audience_frames: Dict[str, Tuple[StateTracker, int, Dict[str, Frame], Encoder]] = {}
+        self.audience_relay: Optional[Callable[[Game, str], None]] = None
+        self.audience_frames_sent = 0
+        self.evicted = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.resumed: Dict[str, int] = {"replayed": 0, "snapshot": 0}
+        self._closing: Set[asyncio.Task] = set()
+        self._dirty: Dict[str, Game] = {}
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._flush_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    async def _accept(websocket: WebSocket) -> Codec:
+        codec, subprotocol = negotiate(websocket)
+        if subprotocol is not None:
+            await websocket.accept(subprotocol=subprotocol)
+        else:
+            await websocket.accept()
+        return codec
+
+    async def connect(self, websocket: WebSocket, game_id: str, player_id: str) -> Connection:
+        codec = await self._accept(websocket)
+        previous = self.active_connections.get(game_id, {}).get(player_id)
+        if previous is not None:
+            self._retire(previous)
+        conn = self.active_connections.setdefault(game_id, {})[player_id] = Connection(
+            websocket, player_id, settings.SEND_QUEUE_SIZE, codec,
+        )
+        self.resync(game_id, player_id)
+        return conn
+
+    async def connect_spectator(self, websocket: WebSocket, game_id: str, spectator_id: str) -> Connection:
+        codec = await self._accept(websocket)
+        audience = self.audiences.setdefault(game_id, {})
+        previous = audience.get(spectator_id)
+        if previous is not None:
+            self._retire(previous)
+        conn = audience[spectator_id] = SpectatorConnection(websocket, spectator_id, codec)
+        cached = self.audience_frames.get(game_id)
+        if cached is not None:
+            conn.replace_state(self._frame_in(cached[2], cached[3], codec))
+        return conn
+
+    def disconnect_spectator(self, game_id: str, spectator_id: str, websocket: Optional[WebSocket] = None):
+        audience = self.audiences.get(game_id)
+        if not audience:
+            return
+        conn = audience.get(spectator_id)
+        if conn is not None and (websocket is None or conn.websocket is websocket):
+            self._retire(audience.pop(spectator_id))
+        if not audience:
+            self.audiences.pop(game_id, None)
+            self.audience_frames.pop(game_id, None)
 
-    async def connect(self, websocket: WebSocket, game_id: str, player_id: str):
-        await websocket.accept()
-        self.active_connections.setdefault(game_id, {})[player_id] = websocket
+    def audience_size(self, game_id: str) -> int:
+        return len(self.audiences.get(game_id, ()))
 
-    def disconnect(self, game_id: str, player_id: str):
+    @staticmethod
+    def _frame_in(frames: Dict[str, Frame], encode: Encoder, codec: Codec) -> Frame:
+        # Each codec's frame is built at most once per audience update.
+        frame = frames.get(codec.name)
+        if frame is None:
+            frame = frames[codec.name] = encode(codec)
+        return frame
+
+    def fanout_audience(self, game_id: str, frame: str, encode: Optional[Encoder] = None):
+        # Spectators only ever need the latest frame: each one replaces
+        # whatever is still queued, so a slow viewer holds at most one.
+        # Large audiences are handed the frame in batches across loop turns
+        # so timers and player traffic are not held up behind them. `frame`
+        # is the JSON encoding; without an encoder other codecs transcode it.
+        if encode is None:
+            encode = lambda codec: codec.pack(loads(frame))
+        self._fanout(game_id, {JSON.name: frame}, encode)
+
+    def _fanout(self, game_id: str, frames: Dict[str, Frame], encode: Encoder):
+        audience = self.audiences.get(game_id)
+        if audience:
+            self.audience_frames_sent += 1
+            self._fanout_batch(list(audience.values()), frames, encode, 0)
+
+    def _fanout_batch(self, conns: List[Connection], frames: Dict[str, Frame], encode: Encoder, start: int):
+        end = start + AUDIENCE_FANOUT_BATCH
+        for conn in conns[start:end]:
+            conn.replace_state(self._frame_in(frames, encode, conn.codec))
+        if end < len(conns):
+            asyncio.get_running_loop().call_soon(self._fanout_batch, conns, frames, encode, end)
+
+    def _pack_for(self, conns, message: dict):
+        # Yields each connection with the message in its codec, encoding
+        # once per codec rather than once per socket.
+        frames: Dict[str, Frame] = {}
+        for conn in conns:
+            frame = frames.get(conn.codec.name)
+            if frame is None:
+                frame = frames[conn.codec.name] = conn.codec.pack(message)
+            yield conn, frame
+
+    def close_game(self, game_id: str):
+        # The game is gone from memory; sockets stay open so players can
+        # create or join another game from the same connection.
+        self._dirty.pop(game_id, None)
+        self.trackers.pop(game_id, None)
+        self.audience_frames.pop(game_id, None)
+        message = {"type": "game_closed", "gameId": game_id}
+        for conn, frame in self._pack_for(list(self.active_connections.get(game_id, {}).values()), message):
+            self._enqueue(game_id, conn, frame)
+        for conn, frame in self._pack_for(self.audiences.get(game_id, {}).values(), message):
+            conn.replace_state(frame)
+
+    def attach(self, game_id: str, player_id: str, conn: Connection):
+        previous = self.active_connections.get(game_id, {}).get(player_id)
+        if previous is not None:
+            self._retire(previous)
+        self.active_connections.setdefault(game_id, {})[player_id] = conn
+        self.resync(game_id, player_id)
+
+    def disconnect(self, game_id: str, player_id: str, websocket: Optional[WebSocket] = None):
         game_conns = self.active_connections.get(game_id)
         if game_conns:
-            game_conns.pop(player_id, None)
+            conn = game_conns.get(player_id)
+            if conn is not None and (websocket is None or conn.websocket is websocket):
+                self._retire(game_conns.pop(player_id))
+                # Only the socket that actually left loses its place; a stale
+                # close arriving after a resume must not reset the new one.
+                self.resync(game_id, player_id)
             if not game_conns:
                 self.active_connections.pop(game_id, None)
 
-    @staticmethod
-    async def send_personal_message(message: dict, websocket: WebSocket):
-        if websocket.application_state == WebSocketState.CONNECTED:
-            try:
-                await websocket.send_json(message)
-            except Exception:
-                pass
+    def move(self, player_id: str, from_game_id: str, to_game_id: str):
+        game_conns = self.active_connections.get(from_game_id, {})
+        conn = game_conns.pop(player_id, None)
+        if from_game_id in self.active_connections and not game_conns:
+            self.active_connections.pop(from_game_id, None)
+        self.resync(from_game_id, player_id)
+        if conn is not None:
+            previous = self.active_connections.get(to_game_id, {}).get(player_id)
+            if previous is not None and previous is not conn:
+                self._retire(previous)
+            self.active_connections.setdefault(to_game_id, {})[player_id] = conn
+        self.resync(to_game_id, player_id)
+
+    def resync(self, game_id: str, player_id: str):
+        tracker = self.trackers.get(game_id)
+        if tracker:
+            tracker.forget(player_id)
+
+    def resume(self, game: Game, player_id: str, token: str, version: int) -> bool:
+        # Trackers outlive the sockets (they go with the game in close_game),
+        # so after a drop the missed versions can be replayed as one patch.
+        # False means the caller has to send a full update instead.
+        tracker = self.trackers.get(game.id)
+        conn = self.find(game.id, player_id)
+        frame = None
+        if tracker is not None and conn is not None:
+            frame = tracker.resume_frame(game, player_id, token, version, conn.codec)
+        outcome = "replayed" if frame is not None else "snapshot"
+        self.resumed[outcome] += 1
+        resumes_total.inc(outcome)
+        if frame is None:
+            return False
+        conn.offer(frame, state=True)
+        return True
+
+    def _retire(self, conn: Connection):
+        self.dropped += conn.dropped
+        conn.close()
+
+    def _evict(self, game_id: str, conn: Connection):
+        self.evicted += 1
+        game_conns = self.active_connections.get(game_id, {})
+        if game_conns.get(conn.player_id) is conn:
+            self.disconnect(game_id, conn.player_id)
+        else:
+            self._retire(conn)
+        task = asyncio.create_task(conn.evict())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _enqueue(self, game_id: str, conn: Connection, frame: Frame) -> bool:
+        if conn.offer(frame):
+            return True
+        if conn.lagging_for() > settings.SLOW_CONSUMER_SECONDS:
+            self._evict(game_id, conn)
+        return False
+
+    def relay(self, game_id: str, player_id: str, frame: Frame, state: bool) -> bool:
+        # Delivers a frame produced by the worker that owns the game; False
+        # means the state frame was dropped and the owner should resend a
+        # snapshot.
+        conn = self.find(game_id, player_id)
+        if conn is None:
+            return True
+        return self._enqueue(game_id, conn, frame) or not state
+
+    def find(self, game_id: str, player_id: str) -> Optional[Connection]:
+        return self.active_connections.get(game_id, {}).get(player_id)
+
+    async def send_personal_message(self, message: dict, game_id: str, player_id: str):
+        conn = self.find(game_id, player_id)
+        if conn is not None:
+            self._enqueue(game_id, conn, conn.codec.pack(message))
 
     async def broadcast(self, game_id: str, message: dict):
-        for player_id, ws in self.active_connections.get(game_id, {}).items():
-            await self.send_personal_message(message, ws)
+        for conn, frame in self._pack_for(list(self.active_connections.get(game_id, {}).values()), message):
+            self._enqueue(game_id, conn, frame)
+
+    def schedule_broadcast(self, game: Game):
+        # Coalesces every change made to a game during one event-loop turn
+        # (or BROADCAST_WINDOW_MS) into a single state frame per player.
+        if game.id in self._dirty:
+            self.coalesced += 1
+            return
+        self._dirty[game.id] = game
+        loop = asyncio.get_running_loop()
+        if self._flush_handle is None or self._flush_loop is not loop:
+            self._flush_loop = loop
+            if settings.BROADCAST_WINDOW_MS > 0:
+                self._flush_handle = loop.call_later(settings.BROADCAST_WINDOW_MS / 1000, self.flush)
+            else:
+                self._flush_handle = loop.call_soon(self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        dirty, self._dirty = self._dirty, {}
+        for game in dirty.values():
+            self.flushes += 1
+            self._broadcast_state(game)
 
     async def broadcast_game_state(self, game_id: str, games: Dict[str, Game]):
         game = games.get(game_id)
-        if not game:
-            return
+        if game:
+            self._dirty.pop(game.id, None)
+            self._broadcast_state(game)
 
-        base_state = {
-            "gameId": game.id,
-            "players": [p.model_dump() for p in game.players],
-            "blackCard": game.current_black_card.model_dump() if game.current_black_card else None,
-            "currentRound": game.current_round,
-            "gamePhase": game.game_phase,
-            "settings": game.settings.model_dump(),
-            "playerAnswers": [ans.model_dump() for ans in game.player_answers] if game.game_phase in ["presentation", "voting", "results"] else [],
-            "currentPresentationIndex": game.current_presentation_index,
-            "timeLeft": game.timer_value,
-            "winners": [],
-            "selectedCardId": None,
-            "votedPlayerId": None,
-            "votes": game.votes if game.game_phase == "voting" else {},
-            "answersCount": len(game.player_answers) if game.game_phase == "selection" else 0
-        }
+    def _broadcast_state(self, game: Game):
+        started = time.perf_counter()
+        tracker = self.trackers.get(game.id)
+        if tracker is None:
+            tracker = self.trackers[game.id] = StateTracker(settings.REPLAY_VERSIONS)
+        tracker.update(shared_state(game))
+        size = 0
+
+        for player_id, conn in list(self.active_connections.get(game.id, {}).items()):
+            frame = tracker.frame_for(game, player_id, conn.codec)
+            if frame is None:
+                continue
+            size += len(frame)
+            if conn.offer(frame, state=True):
+                continue
+            if conn.lagging_for() > settings.SLOW_CONSUMER_SECONDS:
+                self._evict(game.id, conn)
+                continue
+            tracker.forget(player_id)
+            conn.replace_state(tracker.frame_for(game, player_id, conn.codec))
+
+        if game.id in self.audiences or self.audience_relay is not None:
+            size += self._broadcast_audience(game, tracker)
+        broadcast_seconds.observe(time.perf_counter() - started)
+        broadcast_bytes.observe(size)
 
-        if game.game_phase == "results":
-            base_state["winners"] = [p.model_dump() for p in game.players[:3]]
-
-        for player_id, ws in self.active_connections.get(game.id, {}).items():
-            personal_state = dict(base_state)
-            personal_state["playerId"] = player_id
-            personal_state["isHost"] = (player_id == game.host_id)
-            if game.game_phase == "selection":
-                personal_state["whiteCards"] = [c.model_dump() for c in game.player_cards.get(player_id, [])]
-            if game.game_phase == "voting":
-                personal_state["votedPlayerId"] = game.votes.get(player_id)
-            await self.send_personal_message({"type": "game_update", **personal_state}, ws)
+    def _broadcast_audience(self, game: Game, tracker: StateTracker) -> int:
+        # One frame per state version and codec shared by every spectator:
+        # the shared body is already encoded for the players, no per-viewer
+        # fields.
+        cached = self.audience_frames.get(game.id)
+        if cached is not None and cached[0] is tracker and cached[1] == tracker.version:
+            return 0
+        version, shared = tracker.version, tracker.shared
+        header = {"type": "audience_update", "version": version}
+        timing = {"timeLeft": game.timer_value, "serverTime": int(time.time() * 1000)}
+
+        def encode(codec: Codec) -> Frame:
+            # Other codecs may be built a few loop turns later, by which
+            # time the tracker can have moved on to a newer version.
+            body = tracker.shared_fields(codec) if tracker.version == version else codec.pairs(shared)
+            return codec.finish(codec.obj(codec.pairs(header), body, codec.pairs(timing)))
+
+        frame = encode(JSON)
+        if game.id in self.audiences:
+            frames = {JSON.name: frame}
+            self.audience_frames[game.id] = (tracker, version, frames, encode)
+            self._fanout(game.id, frames, encode)
+        if self.audience_relay is not None:
+            self.audience_relay(game, frame)
+        return len(frame) * self.audience_size(game.id)
+
+    def stats(self) -> dict:
+        conns = [conn for game_conns in self.active_connections.values() for conn in game_conns.values()]
+        spectators = sum(len(audience) for audience in self.audiences.values())
+        depths = [conn.depth for conn in conns]
+        return {
+            "games": len(self.active_connections),
+            "connections": len(conns),
+            "queuedFrames": sum(depths),
+            "maxQueueDepth": max(depths, default=0),
+            "sentFrames": sum(conn.sent for conn in conns),
+            "droppedFrames": self.dropped + sum(conn.dropped for conn in conns),
+            "evicted": self.evicted,
+            "flushes": self.flushes,
+            "coalesced": self.coalesced,
+            "resumed": dict(self.resumed),
+            "spectators": spectators,
+            "audienceFrames": self.audience_frames_sent,
+        }
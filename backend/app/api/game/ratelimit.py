@@ -0,0 +1,116 @@
+﻿# file: app/api/game/ratelimit.py
+
+import time
+from typing import Callable, Dict, Tuple
+
+from app.api.core.metrics import registry
+
+throttled_total = registry.counter(
+    "absurdly_actions_throttled_total", "Actions dropped by a rate limit, by action and limit.", ["action", "scope"],
+)
+rejected_total = registry.counter(
+    "absurdly_frames_rejected_total", "Inbound frames refused before any action ran, by reason.", ["reason"],
+)
+
+DEFAULT = "default"
+
+
+def parse_budgets(spec: str) -> Dict[str, Tuple[float, float]]:
+    # "default=10/20,vote=2/4": refill rate per second / bucket size.
+    budgets = {}
+    for part in spec.split(","):
+        name, _, budget = part.strip().partition("=")
+        if not name:
+            continue
+        rate, _, burst = budget.partition("/")
+        budgets[name] = (float(rate), float(burst or rate))
+    budgets.setdefault(DEFAULT, (10.0, 20.0))
+    return budgets
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ConnectionLimits:
+    # Buckets of one socket, one per action type, created on first use.
+    __slots__ = ("buckets", "throttled", "warned")
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.throttled = 0
+        self.warned = False
+
+
+class RateLimiter:
+    # Token buckets per connection and action type, plus one bucket per game
+    # shared by everyone in it, so neither a single socket nor a crowd in
+    # one game can keep the event loop busy for the rest of the worker.
+    def __init__(self, budgets: Dict[str, Tuple[float, float]], game_rate: float, game_burst: float,
+                 max_batch: int = 20, clock: Callable[[], float] = time.monotonic):
+        self.budgets = budgets
+        self.game_rate = game_rate
+        self.game_burst = game_burst
+        self.max_batch = max_batch
+        self.clock = clock
+        self.games: Dict[str, TokenBucket] = {}
+        self.throttled: Dict[str, int] = {"connection": 0, "game": 0}
+        self.rejected: Dict[str, int] = {}
+
+    def allow_connection(self, limits: ConnectionLimits, action: str, label: str) -> bool:
+        now = self.clock()
+        key = action if action in self.budgets else DEFAULT
+        bucket = limits.buckets.get(key)
+        if bucket is None:
+            bucket = limits.buckets[key] = TokenBucket(*self.budgets[key], now)
+        if bucket.take(now):
+            limits.warned = False
+            return True
+        limits.throttled += 1
+        self._throttle(label, "connection")
+        return False
+
+    def allow_game(self, game_id: str, label: str) -> bool:
+        now = self.clock()
+        bucket = self.games.get(game_id)
+        if bucket is None:
+            bucket = self.games[game_id] = TokenBucket(self.game_rate, self.game_burst, now)
+        if bucket.take(now):
+            return True
+        self._throttle(label, "game")
+        return False
+
+    def _throttle(self, label: str, scope: str):
+        self.throttled[scope] += 1
+        throttled_total.inc(label, scope)
+
+    def reject(self, reason: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        rejected_total.inc(reason)
+
+    def forget_game(self, game_id: str):
+        self.games.pop(game_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "budgets": {name: {"rate": rate, "burst": burst} for name, (rate, burst) in self.budgets.items()},
+            "game": {"rate": self.game_rate, "burst": self.game_burst},
+            "maxBatch": self.max_batch,
+            "throttled": dict(self.throttled),
+            "rejected": dict(self.rejected),
+            "games": len(self.games),
+        }
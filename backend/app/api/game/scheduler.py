@@ -0,0 +1,103 @@
+﻿# file: app/api/game/scheduler.py
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from typing import Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    __slots__ = ("deadline", "callback", "cancelled")
+
+    def __init__(self, deadline: float, callback: Callable):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.callback = None
+
+
+class TimerScheduler:
+    # One task drives every game timer from a heap of absolute wall-clock
+    # deadlines. Cancelling only flags the handle; stale entries are dropped
+    # when they reach the top of the heap.
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.fired = 0
+        self._heap: List[Tuple[float, int, TimerHandle]] = []
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def call_at(self, deadline: float, callback: Callable) -> TimerHandle:
+        self._ensure_running()
+        handle = TimerHandle(deadline, callback)
+        heapq.heappush(self._heap, (deadline, next(self._seq), handle))
+        if self._heap[0][2] is handle:
+            self._wakeup.set()
+        return handle
+
+    def call_later(self, delay: float, callback: Callable) -> TimerHandle:
+        return self.call_at(self.clock() + delay, callback)
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            if self._loop is not loop:
+                self._heap.clear()
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            while self._heap and self._heap[0][2].cancelled:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - self.clock()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, handle = heapq.heappop(self._heap)
+            self._fire(handle)
+
+    def _fire(self, handle: TimerHandle):
+        callback = handle.callback
+        handle.cancel()
+        self.fired += 1
+        try:
+            result = callback()
+        except Exception:
+            logger.exception("Timer callback failed")
+            return
+        if inspect.isawaitable(result):
+            task = self._loop.create_task(result)
+            self._running.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Timer callback failed", exc_info=task.exception())
+
+
+scheduler = TimerScheduler()
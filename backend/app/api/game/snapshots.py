@@ -0,0 +1,218 @@
+﻿# file: app/api/game/snapshots.py
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.api.db.database import async_session
+from app.api.db.models import GameSnapshotDB
+from app.api.game.catalog import CardCatalog
+from app.api.game.encoding import dumps, loads
+from app.api.game.logic import Game
+from app.api.game.scheduler import TimerHandle, scheduler
+
+logger = logging.getLogger(__name__)
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class SnapshotStore:
+    async def save(self, snapshots: Dict[str, str]):
+        pass
+
+    async def delete(self, game_ids: Iterable[str]):
+        pass
+
+    async def load_all(self) -> Dict[str, str]:
+        return {}
+
+
+class FileSnapshotStore(SnapshotStore):
+    # One file per game, replaced atomically so a crash mid-write leaves the
+    # previous snapshot intact.
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, game_id: str) -> Optional[str]:
+        if not _SAFE_ID.match(game_id):
+            return None
+        return os.path.join(self.directory, f"{game_id}.json")
+
+    def _write(self, snapshots: Dict[str, str]):
+        os.makedirs(self.directory, exist_ok=True)
+        for game_id, data in snapshots.items():
+            path = self._path(game_id)
+            if path is None:
+                continue
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def _unlink(self, game_ids: Iterable[str]):
+        for game_id in game_ids:
+            path = self._path(game_id)
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+
+    def _read(self) -> Dict[str, str]:
+        if not os.path.isdir(self.directory):
+            return {}
+        snapshots = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    snapshots[name[:-5]] = f.read()
+        return snapshots
+
+    async def save(self, snapshots: Dict[str, str]):
+        await asyncio.to_thread(self._write, snapshots)
+
+    async def delete(self, game_ids: Iterable[str]):
+        await asyncio.to_thread(self._unlink, list(game_ids))
+
+    async def load_all(self) -> Dict[str, str]:
+        return await asyncio.to_thread(self._read)
+
+
+class DatabaseSnapshotStore(SnapshotStore):
+    async def save(self, snapshots: Dict[str, str]):
+        rows = [{"game_id": game_id, "data": data} for game_id, data in snapshots.items()]
+        stmt = insert(GameSnapshotDB).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GameSnapshotDB.game_id],
+            set_={"data": stmt.excluded.data, "updated_at": func.now()},
+        )
+        async with async_session() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    async def delete(self, game_ids: Iterable[str]):
+        async with async_session() as session:
+            await session.execute(delete(GameSnapshotDB).where(GameSnapshotDB.game_id.in_(list(game_ids))))
+            await session.commit()
+
+    async def load_all(self) -> Dict[str, str]:
+        async with async_session() as session:
+            result = await session.execute(select(GameSnapshotDB.game_id, GameSnapshotDB.data))
+            return {game_id: data for game_id, data in result.all()}
+
+
+def create_snapshot_store(kind: str, directory: str) -> SnapshotStore:
+    if kind == "db":
+        return DatabaseSnapshotStore()
+    if kind == "file":
+        return FileSnapshotStore(directory)
+    if kind == "none":
+        return SnapshotStore()
+    raise ValueError(f"Unknown snapshot store: {kind}")
+
+
+class GameSnapshotter:
+    # Periodically writes games whose revision moved since the last write.
+    # Games are serialized on the event loop (a few hundred bytes each) and
+    # the I/O runs in the background; a tick is skipped while the previous
+    # write is still in flight.
+    def __init__(self, games: Dict[str, Game], store: SnapshotStore, interval: float = 3.0,
+                 owns: Callable[[str], bool] = lambda game_id: True, catalog: Optional[CardCatalog] = None):
+        self.games = games
+        self.store = store
+        self.interval = interval
+        self.owns = owns
+        self.catalog = catalog
+        self.draining = False
+        self.written: Dict[str, int] = {}
+        self.writes = 0
+        self.skipped = 0
+        self.restored = 0
+        self.last_bytes = 0
+        self.last_write_ms = 0.0
+        self._handle: Optional[TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0:
+            self._handle = scheduler.call_later(self.interval, self._tick)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _tick(self):
+        self._handle = scheduler.call_later(self.interval, self._tick)
+        if self._task is not None and not self._task.done():
+            self.skipped += 1
+            return
+        self._task = asyncio.ensure_future(self._write_changes())
+
+    async def _write_changes(self):
+        try:
+            await self.write_changes()
+        except Exception:
+            logger.exception("Writing game snapshots failed")
+
+    async def write_changes(self) -> int:
+        changed = {
+            game_id: game for game_id, game in self.games.items()
+            if self.written.get(game_id) != game.revision
+        }
+        removed = [game_id for game_id in self.written if game_id not in self.games]
+        if not changed and not removed:
+            return 0
+        revisions = {game_id: game.revision for game_id, game in changed.items()}
+        snapshots = {game_id: dumps(game.to_snapshot()) for game_id, game in changed.items()}
+        started = time.perf_counter()
+        if snapshots:
+            await self.store.save(snapshots)
+        if removed:
+            await self.store.delete(removed)
+        self.last_write_ms = (time.perf_counter() - started) * 1000
+        self.last_bytes = sum(len(data) for data in snapshots.values())
+        self.writes += 1
+        self.written.update(revisions)
+        for game_id in removed:
+            self.written.pop(game_id, None)
+        return len(snapshots)
+
+    async def checkpoint(self) -> int:
+        if self._task is not None and not self._task.done():
+            await self._task
+        return await self.write_changes()
+
+    async def drain(self) -> int:
+        self.draining = True
+        return await self.checkpoint()
+
+    async def restore(self, adopt: Callable[[Game], object]) -> int:
+        snapshots = await self.store.load_all()
+        for game_id, data in snapshots.items():
+            if game_id in self.games or not self.owns(game_id):
+                continue
+            try:
+                game = Game.from_snapshot(loads(data), self.catalog)
+            except Exception:
+                logger.exception("Skipping unreadable snapshot of game %s", game_id)
+                continue
+            adopt(game)
+            game.resume_timer()
+            self.written[game_id] = game.revision
+            self.restored += 1
+        return self.restored
+
+    def stats(self) -> dict:
+        return {
+            "draining": self.draining,
+            "games": len(self.games),
+            "writes": self.writes,
+            "skippedTicks": self.skipped,
+            "restored": self.restored,
+            "lastBytes": self.last_bytes,
+            "lastWriteMs": round(self.last_write_ms, 3),
+        }
@@ -0,0 +1,194 @@
+﻿# file: app/api/game/state.py
+
+import secrets
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from app.api.game.codecs import JSON, Codec, Fields, Frame
+from app.api.game.logic import Game
+
+_MISSING = object()
+
+PERSONAL_KEYS = ("playerId", "isHost", "whiteCards", "votedPlayerId")
+
+PHASE_ROUTES = {
+    "lobby": "/lobby",
+    "selection": "/game",
+    "presentation": "/presentation",
+    "voting": "/voting",
+    "results": "/results",
+}
+
+
+def route_for(game: Game) -> str:
+    return f"{PHASE_ROUTES[game.game_phase]}/{game.id}"
+
+
+def shared_state(game: Game) -> dict:
+    phase = game.game_phase
+    return {
+        "gameId": game.id,
+        "players": [p.model_dump() for p in game.players],
+        "blackCard": game.current_black_card.model_dump() if game.current_black_card else None,
+        "currentRound": game.current_round,
+        "gamePhase": phase,
+        "route": route_for(game),
+        "settings": game.settings.model_dump(),
+        "playerAnswers": [ans.model_dump() for ans in game.player_answers] if phase in ["presentation", "voting", "results"] else [],
+        "currentPresentationIndex": game.current_presentation_index,
+        "deadline": int(game.deadline * 1000) if game.deadline is not None else None,
+        "winners": [p.model_dump() for p in game.players[:3]] if phase == "results" else [],
+        "votes": dict(game.votes) if phase == "voting" else {},
+        "answersCount": len(game.player_answers) if phase == "selection" else 0,
+        "audience": game.audience.state(),
+    }
+
+
+def personal_state(game: Game, player_id: str) -> tuple:
+    phase = game.game_phase
+    return (
+        player_id,
+        player_id == game.host_id,
+        tuple(game.player_cards.get(player_id, ())) if phase == "selection" else (),
+        game.votes.get(player_id) if phase == "voting" else None,
+    )
+
+
+def encode_personal(game: Game, personal: tuple, previous: Optional[tuple] = None, codec: Codec = JSON) -> Fields:
+    parts = []
+    values = {}
+    for i, key in enumerate(PERSONAL_KEYS):
+        value = personal[i]
+        if previous is not None and previous[i] == value:
+            continue
+        if key == "whiteCards":
+            pool = game.catalog.white
+            parts.append(codec.pair(key, codec.array(pool.encoded_card(card, codec) for card in value)))
+        else:
+            values[key] = value
+    if values:
+        parts.insert(0, codec.pairs(values))
+    if len(parts) == 1:
+        return parts[0]
+    return _join(codec, parts)
+
+
+def _join(codec: Codec, parts) -> Fields:
+    # Concatenates pre-encoded members into one Fields value.
+    parts = [part for part in parts if part[0]]
+    count = sum(part[0] for part in parts)
+    if codec.base == "json":
+        return count, ",".join(body for _, body in parts)
+    return count, b"".join(body for _, body in parts)
+
+
+def diff_state(old: dict, new: dict) -> dict:
+    return {key: value for key, value in new.items() if old.get(key, _MISSING) != value}
+
+
+class StateTracker:
+    # Remembers the last shared state of a game and what each player has
+    # already been sent. The shared part of a version is encoded once per
+    # codec in use and every player's frame is spliced together from that
+    # and their own small personal fields.
+    #
+    # The changes of the last `history` versions are kept in a ring buffer,
+    # so a player who reconnects with their resume token and the version
+    # they last saw gets one patch with what they missed.
+    def __init__(self, history: int = 64):
+        self.version = 0
+        self.shared: dict = {}
+        self.sent: Dict[str, Tuple[int, tuple]] = {}
+        self.tokens: Dict[str, str] = {}
+        self.history: Deque[Tuple[int, dict]] = deque(maxlen=history)
+        self._changes: dict = {}
+        self._shared_fields: Dict[str, Fields] = {}
+        self._changes_fields: Dict[str, Fields] = {}
+        self._replays: Dict[Tuple[int, str], Fields] = {}
+
+    def update(self, state: dict) -> dict:
+        changes = diff_state(self.shared, state)
+        if changes:
+            self.version += 1
+            self.shared = state
+            self._shared_fields = {}
+            self._replays = {}
+            self.history.append((self.version, changes))
+        self._changes = changes
+        self._changes_fields = {}
+        return changes
+
+    def token_for(self, player_id: str) -> str:
+        token = self.tokens.get(player_id)
+        if token is None:
+            token = self.tokens[player_id] = secrets.token_urlsafe(16)
+        return token
+
+    def can_replay(self, base_version: int) -> bool:
+        if base_version == self.version:
+            return True
+        return 0 <= base_version < self.version and bool(self.history) and self.history[0][0] <= base_version + 1
+
+    def replay_fields(self, base_version: int, codec: Codec = JSON) -> Fields:
+        # Shared changes since base_version folded into one set of fields.
+        # Everyone resuming from the same version shares the encoding, which
+        # keeps a reconnect storm after a network blip cheap.
+        key = (base_version, codec.base)
+        fields = self._replays.get(key)
+        if fields is None:
+            merged = {}
+            for version, changes in self.history:
+                if version > base_version:
+                    merged.update(changes)
+            fields = self._replays[key] = codec.pairs(merged)
+        return fields
+
+    def resume_frame(self, game: Game, player_id: str, token: str, base_version: int,
+                     codec: Codec = JSON) -> Optional[Frame]:
+        # None when the token is not this player's or the gap is larger than
+        # the ring buffer; the caller then falls back to a full update.
+        if not token or self.tokens.get(player_id) != token or not self.can_replay(base_version):
+            return None
+        personal = personal_state(game, player_id)
+        self.sent[player_id] = (self.version, personal)
+        return codec.finish(codec.obj(
+            codec.pairs({"type": "state_patch", "version": self.version, "baseVersion": base_version}),
+            codec.pair("changes", codec.obj(self.replay_fields(base_version, codec), encode_personal(game, personal, None, codec))),
+        ))
+
+    def forget(self, player_id: str):
+        self.sent.pop(player_id, None)
+
+    def shared_fields(self, codec: Codec = JSON) -> Fields:
+        fields = self._shared_fields.get(codec.base)
+        if fields is None:
+            fields = self._shared_fields[codec.base] = codec.pairs(self.shared)
+        return fields
+
+    def changes_fields(self, codec: Codec = JSON) -> Fields:
+        fields = self._changes_fields.get(codec.base)
+        if fields is None:
+            fields = self._changes_fields[codec.base] = codec.pairs(self._changes)
+        return fields
+
+    def frame_for(self, game: Game, player_id: str, codec: Codec = JSON) -> Optional[Frame]:
+        personal = personal_state(game, player_id)
+        previous = self.sent.get(player_id)
+        self.sent[player_id] = (self.version, personal)
+        if previous is None or previous[0] < self.version - 1:
+            return codec.finish(codec.obj(
+                codec.pairs({"type": "game_update", "version": self.version, "resumeToken": self.token_for(player_id)}),
+                self.shared_fields(codec),
+                encode_personal(game, personal, None, codec),
+                codec.pairs({"timeLeft": game.timer_value, "serverTime": int(time.time() * 1000), "selectedCardId": None}),
+            ))
+        base_version, sent_personal = previous
+        personal_fields = encode_personal(game, personal, sent_personal, codec)
+        shared_changes = self.changes_fields(codec) if base_version < self.version else (0, "")
+        if not personal_fields[0] and not shared_changes[0]:
+            return None
+        return codec.finish(codec.obj(
+            codec.pairs({"type": "state_patch", "version": self.version, "baseVersion": base_version}),
+            codec.pair("changes", codec.obj(shared_changes, personal_fields)),
+        ))
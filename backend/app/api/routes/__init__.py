@@ -1,7 +1,15 @@
 ﻿from fastapi import APIRouter
 from app.api.routes.game import router as game_router
 from app.api.routes.cards import router as cards_router
+from app.api.routes.metrics import router as metrics_router
+from app.api.routes.leaderboard import router as leaderboard_router
+from app.api.routes.packs import router as packs_router
+from app.api.routes.health import router as health_router
 
 router = APIRouter()
 router.include_router(game_router)
 router.include_router(cards_router)
+router.include_router(metrics_router)
+router.include_router(leaderboard_router)
+router.include_router(packs_router)
+router.include_router(health_router)
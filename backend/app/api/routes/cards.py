@@ -1,33 +1,89 @@
 ﻿# file: app/api/routes/cards.py
 
 import uuid
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from urllib.parse import urlencode
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.api.db.analytics import card_analytics
+from app.api.db.bulk import content_hash, export_cards, import_cards, iter_csv_rows, iter_ndjson_rows
 from app.api.db.database import get_session
-from app.api.db.models import BlackCardDB, WhiteCardDB, BlackCard, WhiteCard
+from app.api.db.pages import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, card_pages
+from app.api.db.search import CARD_KINDS, card_search, search_database
+from app.api.db.models import BlackCardDB, WhiteCardDB, BlackCard, WhiteCard, PackCardDB
+from app.api.game.catalog import catalog
 
 router = APIRouter()
 
 
+async def commit_card(session: AsyncSession):
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="A card with this content already exists")
+
+
+def card_rows(request: Request, fmt: str):
+    if fmt == "csv" or "csv" in request.headers.get("content-type", ""):
+        return iter_csv_rows(request.stream())
+    return iter_ndjson_rows(request.stream())
+
+
+async def card_listing(kind: str, request: Request, after: Optional[str], limit: int, q: Optional[str]) -> Response:
+    page = await card_pages.get(kind, after, limit, q)
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"ETag": page.etag(gzipped), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if headers["ETag"] in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        card_pages.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    if page.next_cursor is not None:
+        query = {"after": page.next_cursor, "limit": limit, **({"q": q} if q else {})}
+        headers["Link"] = f'<{request.url.path}?{urlencode(query)}>; rel="next"'
+        headers["X-Next-Cursor"] = page.next_cursor
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(page.gzipped, media_type="application/json", headers=headers)
+    return Response(page.body, media_type="application/json", headers=headers)
+
+
+def card_export(kind: str, fmt: str) -> StreamingResponse:
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format must be ndjson or csv")
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_cards(kind, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{kind}_cards.{fmt}"'},
+    )
+
+
 @router.get("/black_cards", response_model=List[BlackCard])
-async def get_black_cards(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(BlackCardDB))
-    cards = result.scalars().all()
-    return [BlackCard.model_validate(card) for card in cards]
+async def get_black_cards(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    q: Optional[str] = None,
+):
+    return await card_listing("black", request, after, limit, q)
 
 
 @router.post("/black_cards", response_model=BlackCard)
 async def create_black_card(card: BlackCard, session: AsyncSession = Depends(get_session)):
     data = card.model_dump()
     data["id"] = data.get("id") or str(uuid.uuid4())
+    data["content_hash"] = content_hash(data["content"])
     db_card = BlackCardDB(**data)
     session.add(db_card)
-    await session.commit()
-    await session.refresh(db_card)
-    return BlackCard.model_validate(db_card)
+    await commit_card(session)
+    saved = BlackCard.model_validate(db_card)
+    catalog.put("black", saved)
+    return saved
 
 
 @router.put("/black_cards/{card_id}", response_model=BlackCard)
@@ -37,9 +93,11 @@ async def update_black_card(card_id: str, card_data: BlackCard, session: AsyncSe
     if not db_card:
         raise HTTPException(status_code=404, detail="Card not found")
     db_card.content = card_data.content
-    await session.commit()
-    await session.refresh(db_card)
-    return BlackCard.model_validate(db_card)
+    db_card.content_hash = content_hash(card_data.content)
+    await commit_card(session)
+    saved = BlackCard.model_validate(db_card)
+    catalog.put("black", saved)
+    return saved
 
 
 @router.delete("/black_cards/{card_id}")
@@ -49,26 +107,33 @@ async def delete_black_card(card_id: str, session: AsyncSession = Depends(get_se
     if not db_card:
         raise HTTPException(status_code=404, detail="Card not found")
     await session.delete(db_card)
+    await session.execute(delete(PackCardDB).where(PackCardDB.kind == "black", PackCardDB.card_id == card_id))
     await session.commit()
+    catalog.remove("black", card_id)
     return {"detail": "Card deleted"}
 
 
 @router.get("/white_cards", response_model=List[WhiteCard])
-async def get_white_cards(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(WhiteCardDB))
-    cards = result.scalars().all()
-    return [WhiteCard.model_validate(card) for card in cards]
+async def get_white_cards(
+    request: Request,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    q: Optional[str] = None,
+):
+    return await card_listing("white", request, after, limit, q)
 
 
 @router.post("/white_cards", response_model=WhiteCard)
 async def create_white_card(card: WhiteCard, session: AsyncSession = Depends(get_session)):
     data = card.model_dump()
     data["id"] = data.get("id") or str(uuid.uuid4())
+    data["content_hash"] = content_hash(data["content"])
     db_card = WhiteCardDB(**data)
     session.add(db_card)
-    await session.commit()
-    await session.refresh(db_card)
-    return WhiteCard.model_validate(db_card)
+    await commit_card(session)
+    saved = WhiteCard.model_validate(db_card)
+    catalog.put("white", saved)
+    return saved
 
 
 @router.put("/white_cards/{card_id}", response_model=WhiteCard)
@@ -78,9 +143,11 @@ async def update_white_card(card_id: str, card_data: WhiteCard, session: AsyncSe
     if not db_card:
         raise HTTPException(status_code=404, detail="Card not found")
     db_card.content = card_data.content
-    await session.commit()
-    await session.refresh(db_card)
-    return WhiteCard.model_validate(db_card)
+    db_card.content_hash = content_hash(card_data.content)
+    await commit_card(session)
+    saved = WhiteCard.model_validate(db_card)
+    catalog.put("white", saved)
+    return saved
 
 
 @router.delete("/white_cards/{card_id}")
@@ -90,5 +157,78 @@ async def delete_white_card(card_id: str, session: AsyncSession = Depends(get_se
     if not db_card:
         raise HTTPException(status_code=404, detail="Card not found")
     await session.delete(db_card)
+    await session.execute(delete(PackCardDB).where(PackCardDB.kind == "white", PackCardDB.card_id == card_id))
     await session.commit()
+    catalog.remove("white", card_id)
     return {"detail": "Card deleted"}
+
+
+@router.post("/black_cards/import")
+async def import_black_cards(request: Request, format: str = "ndjson"):
+    return await import_cards("black", card_rows(request, format))
+
+
+@router.get("/black_cards/export")
+async def export_black_cards(format: str = "ndjson"):
+    return card_export("black", format)
+
+
+@router.post("/white_cards/import")
+async def import_white_cards(request: Request, format: str = "ndjson"):
+    return await import_cards("white", card_rows(request, format))
+
+
+@router.get("/white_cards/export")
+async def export_white_cards(format: str = "ndjson"):
+    return card_export("white", format)
+
+
+@router.get("/cards/search")
+async def search_cards(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: str = Query("all", pattern="^(all|black|white)$"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+):
+    kinds = CARD_KINDS if kind == "all" else (kind,)
+    if card_search.ready:
+        total, results = card_search.search(q, kinds, limit, offset)
+        source = "memory"
+    else:
+        total, results = await search_database(q, kinds, limit, offset)
+        source = "database"
+    return {"query": q, "total": total, "offset": offset, "source": source, "results": results}
+
+
+async def card_win_rates():
+    if not card_analytics.available:
+        raise HTTPException(status_code=503, detail="Card analytics need numpy installed")
+    return await card_analytics.get()
+
+
+@router.get("/cards/analytics")
+async def get_card_analytics(
+    min_plays: int = Query(5, ge=1),
+    limit: int = Query(50, ge=1, le=1000),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+):
+    rates = await card_win_rates()
+    ascending = order == "asc"
+    return {
+        "version": card_analytics.version,
+        "outcomes": rates.outcomes,
+        "white": rates.cards("white", catalog, min_plays, limit, ascending),
+        "black": rates.cards("black", catalog, min_plays, limit, ascending),
+        "pairs": rates.pairs(min_plays, limit, ascending),
+    }
+
+
+@router.get("/cards/analytics/matrix")
+async def get_card_matrix(blacks: int = Query(20, ge=1, le=200), whites: int = Query(50, ge=1, le=500)):
+    rates = await card_win_rates()
+    return {"version": card_analytics.version, **rates.matrix(blacks, whites)}
+
+
+@router.get("/catalog/stats")
+async def get_catalog_stats():
+    return {**catalog.stats(), "pages": card_pages.stats(), "analytics": card_analytics.stats(), "search": card_search.stats()}
@@ -1,124 +1,439 @@
 ﻿# file: app/api/routes/game.py
 
-import uuid
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import hmac
+import time
+from functools import partial
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect
+from app.api.core.config import settings
+from app.api.core.metrics import action_seconds, actions_total
+from app.api.game.backplane import create_backplane
+from app.api.game.catalog import catalog
+from app.api.game.cluster import Cluster
+from app.api.game.codecs import Codec, describe
+from app.api.game.encoding import loads
+from app.api.game.history import HistoryWriter, create_history_store
+from app.api.game.leaderboard import leaderboards
+from app.api.game.lifecycle import GameLifecycle
 from app.api.game.logic import Game
 from app.api.game.manager import ConnectionManager
+from app.api.game.ratelimit import ConnectionLimits, RateLimiter, parse_budgets
+from app.api.game.snapshots import GameSnapshotter, create_snapshot_store
 from app.api.db.models import GameSettings
-from app.api.schemas.game import GameUpdate, NavigateResponse
 
 router = APIRouter()
+AUDIENCE_ACTIONS = ("audience_vote", "audience_viewers")
+KNOWN_ACTIONS = frozenset((
+    "create_game", "join_game", "update_settings", "start_game", "restart_game",
+    "select_card", "vote", "leave_game", "sync", "resume", "batch", *AUDIENCE_ACTIONS,
+))
+# Actions that move the socket between games cannot be batched.
+UNBATCHABLE_ACTIONS = frozenset(("create_game", "join_game", "leave_game", "resume", "batch", *AUDIENCE_ACTIONS))
 games: dict[str, Game] = {}
 manager = ConnectionManager()
+cluster = Cluster(
+    manager,
+    create_backplane(settings.BACKPLANE, settings.BACKPLANE_ADDRESS) if settings.WORKER_COUNT > 1 else None,
+    settings.WORKER_COUNT,
+)
+snapshotter = GameSnapshotter(
+    games,
+    create_snapshot_store(settings.SNAPSHOT_STORE, settings.SNAPSHOT_DIR),
+    settings.SNAPSHOT_INTERVAL,
+    cluster.owns,
+)
+history = HistoryWriter(
+    create_history_store(settings.HISTORY_STORE),
+    settings.HISTORY_QUEUE_SIZE,
+    settings.HISTORY_BATCH_SIZE,
+    settings.HISTORY_FLUSH_MS / 1000,
+)
 
+lifecycle = GameLifecycle(
+    games,
+    manager,
+    finished_ttl=settings.GAME_FINISHED_TTL,
+    abandoned_ttl=settings.GAME_ABANDONED_TTL,
+    idle_ttl=settings.GAME_IDLE_TTL,
+    max_games=settings.MAX_GAMES,
+    max_bytes=settings.MAX_GAMES_MEMORY_MB * 1024 * 1024,
+    interval=settings.LIFECYCLE_INTERVAL,
+)
+limiter = RateLimiter(
+    parse_budgets(settings.ACTION_RATE_LIMITS),
+    settings.GAME_ACTION_RATE,
+    settings.GAME_ACTION_BURST,
+    settings.MAX_BATCH_ACTIONS,
+)
+lifecycle.on_evict = limiter.forget_game
+
+
+def record_result(kind: str, row: dict):
+    history.record(kind, row)
+    if kind == "game":
+        leaderboards.record_game(row)
+        cluster.share_result(row)
+
+
+def adopt_game(game: Game) -> Game:
+    game.notify = partial(manager.schedule_broadcast, game)
+    game.record = record_result
+    games[game.id] = game
+    lifecycle.touch(game.id)
+    return game
+
+
+def register_game(game_id: str, host_id: str) -> Game:
+    return adopt_game(Game(game_id=game_id, host_id=host_id))
+
+
+def action_label(action) -> str:
+    return action if action in KNOWN_ACTIONS else "other"
+
+
+async def apply_action(game_id: str, player_id: str, data: dict):
+    # Runs on the worker that owns the game, whichever worker holds the socket.
+    action = data.get("action")
+    if action == "batch":
+        await apply_batch(game_id, player_id, data["actions"])
+        return
+    label = action_label(action)
+    if action not in AUDIENCE_ACTIONS and not limiter.allow_game(game_id, label):
+        return
+    started = time.perf_counter()
+    try:
+        await handle_action(game_id, player_id, action, data)
+    finally:
+        actions_total.inc(label)
+        action_seconds.observe(time.perf_counter() - started, label)
+
+
+async def apply_batch(game_id: str, player_id: str, actions: List[dict]):
+    # The game's notify hook is held while the actions run, so the whole
+    # batch results in one state broadcast.
+    game = games.get(game_id)
+    if game is None:
+        return
+    notify, changed = game.notify, []
+    game.notify = lambda: changed.append(True)
+    try:
+        for data in actions:
+            await apply_action(game_id, player_id, data)
+    finally:
+        if games.get(game_id) is game:
+            game.notify = notify
+            if changed and notify is not None:
+                notify()
+
+
+def unpack_batch(data: dict) -> Optional[List[dict]]:
+    actions = data.get("actions")
+    if not isinstance(actions, list) or not actions:
+        limiter.reject("malformed")
+        return None
+    if len(actions) > limiter.max_batch:
+        limiter.reject("batch_too_large")
+        return None
+    if any(not isinstance(item, dict) or item.get("action") in UNBATCHABLE_ACTIONS for item in actions):
+        limiter.reject("batch_action")
+        return None
+    return actions
 
-@router.websocket("/ws/{game_id}/{player_id}")
-async def websocket_endpoint(websocket: WebSocket, game_id: str, player_id: str):
-    await manager.connect(websocket, game_id, player_id)
 
-    if game_id != "nogame" and game_id not in games:
-        games[game_id] = Game(game_id=game_id, host_id=player_id)
+async def admit(limits: ConnectionLimits, game_id: str, player_id: str, data: dict) -> bool:
+    action = data.get("action")
+    if limiter.allow_connection(limits, action, action_label(action)):
+        return True
+    # One error per throttled streak; repeating it would feed the spam.
+    if not limits.warned:
+        limits.warned = True
+        await send_error(game_id, player_id, "Too many actions, slow down")
+    return False
 
+
+async def send_error(game_id: str, player_id: str, message: str):
+    await manager.send_personal_message({"type": "error", "message": message}, game_id, player_id)
+
+
+async def handle_action(game_id: str, player_id: str, action: str, data: dict):
+    # Only actions that changed the game mark it dirty: a new revision means
+    # a broadcast and a snapshot, and keeps the game from looking idle.
+    # Game methods that mark the game dirty themselves leave changed False.
+    # resend asks for a broadcast without a new revision, which only sends
+    # the full state to players whose tracker was reset by resync().
     game = games.get(game_id)
+    changed = resend = False
+
+    if action in ("create_game", "join_game"):
+        if game is None:
+            if action == "join_game":
+                await send_error(game_id, player_id, "Game not found")
+                return
+            if not lifecycle.admit():
+                await send_error(game_id, player_id, "Server is full, try again later")
+                return
+            game = register_game(game_id, player_id)
+        changed = player_id not in game.player_index
+        game.add_player(player_id, data["nickname"])
+        if not changed:
+            # Already seated (e.g. a second tab): only this socket needs the state.
+            manager.resync(game.id, player_id)
+            resend = True
+
+    elif game is None:
+        return
+
+    elif action == "audience_vote":
+        # Merged into the state on the audience interval, not per vote.
+        game.submit_audience_vote(player_id, data.get("votedPlayerId"))
+        return
+
+    elif action == "audience_viewers":
+        game.audience.set_viewers(data["origin"], data["count"])
+        return
+
+    elif action == "update_settings":
+        new_settings = data.get("settings")
+        if new_settings:
+            merged = GameSettings.model_validate({**game.settings.model_dump(), **new_settings})
+            if merged.packs != game.settings.packs:
+                if game.game_phase != "lobby":
+                    await send_error(game_id, player_id, "Card packs can only be changed in the lobby")
+                    return
+                await game.catalog.ensure_packs(merged.packs)
+                unknown = [pack_id for pack_id in merged.packs if pack_id not in game.catalog.packs]
+                if unknown:
+                    await send_error(game_id, player_id, f"Unknown card pack: {unknown[0]}")
+                    return
+            before = game.settings
+            game.settings = merged.model_copy(update={"packs": game.settings.packs})
+            game.choose_packs(merged.packs)
+            changed = game.settings != before
+
+    elif action == "start_game":
+        await game.start_game()
+
+    elif action == "restart_game":
+        changed = game.game_phase != "lobby" or game.current_round != 0
+        game.cancel_timer()
+        game.current_round = 0
+        game.game_phase = "lobby"
+        game.reset_round()
+
+    elif action == "select_card":
+        card_id = data.get("cardId")
+        game.submit_answer(player_id, card_id)
+
+    elif action == "vote":
+        voted_player_id = data.get("votedPlayerId")
+        game.submit_vote(player_id, voted_player_id)
+
+    elif action == "leave_game":
+        changed = player_id in game.player_index
+        game.remove_player(player_id)
+
+    elif action == "sync":
+        manager.resync(game.id, player_id)
+        resend = True
+
+    elif action == "resume":
+        # A reconnecting player gets the versions they missed in one patch,
+        # or a full update when the ring buffer no longer reaches back.
+        version = data.get("version")
+        if manager.resume(game, player_id, str(data.get("token") or ""), version if isinstance(version, int) else -1):
+            return
+        manager.resync(game.id, player_id)
+        resend = True
+
+    if changed:
+        game.mark_dirty()
+    elif resend and game.notify is not None:
+        game.notify()
+
+
+cluster.action_handler = apply_action
+cluster.result_handler = leaderboards.record_game
+cluster.catalog_handler = catalog.apply_change
+catalog.on_change = cluster.share_catalog_change
+
 
-    def setup_notify():
-        async def notify():
-            await manager.broadcast_game_state(game.id, games)
-            route = None
-            if game.game_phase == "presentation":
-                route = f"/presentation/{game.id}"
-            elif game.game_phase == "voting":
-                route = f"/voting/{game.id}"
-            elif game.game_phase == "selection" and game.current_round > 0:
-                route = f"/game/{game.id}"
-            elif game.game_phase == "results":
-                route = f"/results/{game.id}"
-            if route:
-                await manager.broadcast(game.id, NavigateResponse(route=route).model_dump())
-        game.notify = notify
+async def receive_action(websocket: WebSocket, codec: Codec) -> dict:
+    # Text frames are always JSON; binary frames use the negotiated codec.
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("text") is not None:
+        return loads(message["text"])
+    return codec.decode(message["bytes"])
 
+
+@router.websocket("/ws/{game_id}/{player_id}")
+async def websocket_endpoint(websocket: WebSocket, game_id: str, player_id: str):
+    conn = await manager.connect(websocket, game_id, player_id)
+    codec = conn.codec
+    current_id = game_id
+
+    if not cluster.owns(game_id):
+        cluster.attach(game_id, player_id, codec)
+    elif game_id != "nogame" and game_id not in games:
+        await send_error(game_id, player_id, "Game not found")
+
+    token = websocket.query_params.get("resume")
+    if token and game_id != "nogame" and (game_id in games or not cluster.owns(game_id)):
+        version = websocket.query_params.get("version", "")
+        resume = {"action": "resume", "token": token, "version": int(version) if version.isdigit() else -1}
+        if cluster.owns(game_id):
+            await apply_action(game_id, player_id, resume)
+        else:
+            cluster.forward(game_id, player_id, resume)
+
+    limits = ConnectionLimits()
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await receive_action(websocket, codec)
+            if not isinstance(data, dict):
+                limiter.reject("malformed")
+                continue
             action = data.get("action")
+            if action in AUDIENCE_ACTIONS:
+                continue
+
+            if action == "batch":
+                actions = unpack_batch(data)
+                if actions is None:
+                    await send_error(current_id, player_id, f"A batch holds 1 to {limiter.max_batch} in-game actions")
+                    continue
+                actions = [item for item in actions if await admit(limits, current_id, player_id, item)]
+                if not actions:
+                    continue
+                data = {"action": "batch", "actions": actions}
+            elif not await admit(limits, current_id, player_id, data):
+                continue
+
+            if action in ("create_game", "join_game"):
+                if snapshotter.draining and (action == "create_game" or data["gameId"] not in games):
+                    await send_error(current_id, player_id, "Server is restarting, try again in a moment")
+                    continue
+                if action == "join_game" and cluster.owns(data["gameId"]) and data["gameId"] not in games:
+                    await send_error(current_id, player_id, "Game not found")
+                    continue
+                target_id = cluster.new_game_id() if action == "create_game" else data["gameId"]
+                if not cluster.owns(current_id):
+                    cluster.detach(current_id, player_id)
+                manager.move(player_id, current_id, target_id)
+                current_id = target_id
+                if not cluster.owns(current_id):
+                    cluster.attach(current_id, player_id, codec)
+
+            if current_id == "nogame":
+                continue
+
+            if cluster.owns(current_id):
+                await apply_action(current_id, player_id, data)
+            else:
+                cluster.forward(current_id, player_id, data)
 
-            if action == "create_game":
-                nickname = data["nickname"]
-                new_game_id = str(uuid.uuid4())[:8]
-                games[new_game_id] = Game(game_id=new_game_id, host_id=player_id)
-                game = games[new_game_id]
-                game.add_player(player_id, nickname)
-                setup_notify()
-
-                conn = manager.active_connections.get("nogame", {}).pop(player_id, None)
-                if conn:
-                    manager.active_connections.setdefault(new_game_id, {})[player_id] = conn
-                if not manager.active_connections.get("nogame"):
-                    manager.active_connections.pop("nogame", None)
-
-                await manager.send_personal_message(
-                    GameUpdate(gameId=new_game_id, playerId=player_id, isHost=True).model_dump(),
-                    websocket
-                )
-                await manager.send_personal_message(
-                    NavigateResponse(route=f"/lobby/{new_game_id}").model_dump(),
-                    websocket
-                )
-
-            elif action == "join_game":
-                nickname = data["nickname"]
-                join_game_id = data["gameId"]
-                if join_game_id not in games:
-                    games[join_game_id] = Game(game_id=join_game_id, host_id=player_id)
-                game = games[join_game_id]
-                game.add_player(player_id, nickname)
-                setup_notify()
-
-                conn = manager.active_connections.get("nogame", {}).pop(player_id, None)
-                if conn:
-                    manager.active_connections.setdefault(join_game_id, {})[player_id] = conn
-                if not manager.active_connections.get("nogame"):
-                    manager.active_connections.pop("nogame", None)
-
-                await manager.send_personal_message(
-                    GameUpdate(gameId=join_game_id, playerId=player_id, isHost=False).model_dump(),
-                    websocket
-                )
-                await manager.send_personal_message(
-                    NavigateResponse(route=f"/lobby/{join_game_id}").model_dump(),
-                    websocket
-                )
-
-            elif action == "update_settings":
-                new_settings = data.get("settings")
-                if new_settings:
-                    merged = {**game.settings.model_dump(), **new_settings}
-                    game.settings = GameSettings.model_validate(merged)
-
-            elif action == "start_game":
-                await game.start_game()
-                await manager.broadcast(game.id, NavigateResponse(route=f"/game/{game.id}").model_dump())
-
-            elif action == "restart_game":
-                game.current_round = 0
-                game.game_phase = "lobby"
-                game.player_answers.clear()
-                game.votes.clear()
-                await manager.broadcast_game_state(game.id, games)
-                await manager.broadcast(game.id, NavigateResponse(route=f"/lobby/{game.id}").model_dump())
-
-            elif action == "select_card":
-                card_id = data.get("cardId")
-                game.submit_answer(player_id, card_id)
-
-            elif action == "vote":
-                voted_player_id = data.get("votedPlayerId")
-                game.submit_vote(player_id, voted_player_id)
-
-            elif action == "leave_game":
-                game.remove_player(player_id)
-
-            await manager.broadcast_game_state(game.id, games)
+            if action == "leave_game":
+                if not cluster.owns(current_id):
+                    cluster.detach(current_id, player_id)
+                manager.move(player_id, current_id, "nogame")
+                current_id = "nogame"
 
     except WebSocketDisconnect:
-        manager.disconnect(game_id, player_id)
+        if not cluster.owns(current_id):
+            cluster.detach(current_id, player_id)
+        manager.disconnect(current_id, player_id, websocket)
+
+
+def report_viewers(game_id: str):
+    count = manager.audience_size(game_id)
+    if cluster.owns(game_id):
+        game = games.get(game_id)
+        if game is not None:
+            game.audience.set_viewers(cluster.worker_id, count)
+    else:
+        cluster.forward(game_id, "", {"action": "audience_viewers", "origin": cluster.worker_id, "count": count})
+
+
+@router.websocket("/ws/{game_id}/audience/{spectator_id}")
+async def audience_endpoint(websocket: WebSocket, game_id: str, spectator_id: str):
+    owned = cluster.owns(game_id)
+    if owned and game_id not in games:
+        await websocket.accept()
+        await websocket.send_json({"type": "error", "message": "Game not found"})
+        await websocket.close(code=1008)
+        return
+
+    conn = await manager.connect_spectator(websocket, game_id, spectator_id)
+    if owned:
+        if game_id not in manager.audience_frames:
+            manager.schedule_broadcast(games[game_id])
+    else:
+        cluster.watch(game_id)
+    report_viewers(game_id)
+
+    limits = ConnectionLimits()
+    try:
+        while True:
+            data = await receive_action(websocket, conn.codec)
+            if not isinstance(data, dict) or data.get("action") != "vote":
+                continue
+            if not limiter.allow_connection(limits, "audience_vote", "audience_vote"):
+                continue
+            vote = {"action": "audience_vote", "votedPlayerId": data.get("votedPlayerId")}
+            if owned:
+                await apply_action(game_id, spectator_id, vote)
+            else:
+                cluster.forward(game_id, spectator_id, vote)
+    except WebSocketDisconnect:
+        manager.disconnect_spectator(game_id, spectator_id, websocket)
+        report_viewers(game_id)
+
+
+@router.get("/protocol")
+async def get_protocol():
+    return describe()
+
+
+@router.get("/history/stats")
+async def get_history_stats():
+    return history.stats()
+
+
+@router.get("/rate-limits/stats")
+async def get_rate_limit_stats():
+    return limiter.stats()
+
+
+@router.get("/games/stats")
+async def get_game_stats():
+    return lifecycle.stats()
+
+
+@router.get("/connections/stats")
+async def get_connection_stats():
+    return manager.stats()
+
+
+@router.get("/cluster/stats")
+async def get_cluster_stats():
+    return cluster.stats()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Admin endpoints stay closed unless ADMIN_TOKEN is configured.
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@router.post("/admin/drain", dependencies=[Depends(require_admin)])
+async def drain():
+    await snapshotter.drain()
+    return snapshotter.stats()
+
+
+@router.get("/snapshots/stats")
+async def get_snapshot_stats():
+    return snapshotter.stats()
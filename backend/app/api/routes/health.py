@@ -0,0 +1,26 @@
+﻿# file: app/api/routes/health.py
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.api.core.startup import startup
+from app.api.routes.game import snapshotter
+
+router = APIRouter()
+
+
+@router.get("/health/live")
+async def live():
+    # Answers as long as the event loop does; no dependencies are checked,
+    # so a slow database never gets the process restarted.
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def ready():
+    # Not ready while warming up, while draining for a restart and during
+    # shutdown, so the load balancer only sends traffic to a warm worker.
+    is_ready = startup.ready and not snapshotter.draining
+    status = "ready" if is_ready else "starting" if startup.ready_at is None else "draining"
+    body = {**startup.stats(), "status": status, "ready": is_ready}
+    return JSONResponse(body, status_code=200 if is_ready else 503)
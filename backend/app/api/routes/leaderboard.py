@@ -0,0 +1,60 @@
+﻿# file: app/api/routes/leaderboard.py
+
+import re
+import time
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.api.game.leaderboard import METRICS, leaderboards, periods_of
+
+router = APIRouter()
+
+PERIOD_PATTERN = re.compile(r"^(all|month:\d{4}-\d{2}|week:\d{4}-W\d{2})$")
+
+
+def resolve_period(period: str) -> str:
+    # "month" and "week" mean the current one.
+    if period in ("month", "week"):
+        return next(p for p in periods_of(time.time()) if p.startswith(period + ":"))
+    if not PERIOD_PATTERN.match(period):
+        raise HTTPException(status_code=400, detail="Period must be all, month, week, month:YYYY-MM or week:YYYY-Www")
+    return period
+
+
+def check_metric(metric: str) -> str:
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Metric must be one of {', '.join(METRICS)}")
+    return metric
+
+
+@router.get("/leaderboard")
+async def get_leaderboard(
+    period: str = "all",
+    metric: str = "wins",
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    period, metric = resolve_period(period), check_metric(metric)
+    board = await leaderboards.board(period)
+    return {
+        "period": period,
+        "metric": metric,
+        "total": board.size(metric),
+        "entries": board.top(metric, limit, offset),
+    }
+
+
+@router.get("/leaderboard/players/{key}")
+async def get_player_rank(key: str, period: str = "all", metric: str = "wins", by: str = "id"):
+    period, metric = resolve_period(period), check_metric(metric)
+    board = await leaderboards.board(period)
+    player_id = board.by_nickname.get(key) if by == "nickname" else key
+    entry = board.player(player_id, metric) if player_id is not None else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No games recorded for this player")
+    return {"period": period, "metric": metric, **entry}
+
+
+@router.get("/leaderboard/stats")
+async def get_leaderboard_stats():
+    return leaderboards.stats()
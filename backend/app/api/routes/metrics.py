@@ -0,0 +1,41 @@
+﻿# file: app/api/routes/metrics.py
+
+from collections import Counter
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.api.core.metrics import loop_monitor, registry
+from app.api.game.scheduler import scheduler
+from app.api.routes.game import games, history, manager
+
+router = APIRouter()
+
+
+def _games_by_phase():
+    counts = Counter(game.game_phase for game in games.values())
+    return {(phase,): counts.get(phase, 0) for phase in ("lobby", "selection", "presentation", "voting", "results")}
+
+
+def _connections():
+    return {
+        ("player",): sum(len(conns) for conns in manager.active_connections.values()),
+        ("spectator",): sum(len(audience) for audience in manager.audiences.values()),
+    }
+
+
+# Gauges are computed when scraped, so they cost nothing between scrapes.
+registry.gauge("absurdly_games", "Games in memory, by phase.", ["phase"], _games_by_phase)
+registry.gauge("absurdly_connections", "Open sockets, by tier.", ["tier"], _connections)
+registry.gauge("absurdly_queued_frames", "Frames waiting in send queues.",
+               collect=lambda: {(): manager.stats()["queuedFrames"]})
+registry.gauge("absurdly_pending_timers", "Entries in the timer heap.", collect=lambda: {(): len(scheduler)})
+registry.gauge("absurdly_history_pending", "Game history records waiting to be written.",
+               collect=lambda: {(): history.pending})
+registry.gauge("absurdly_event_loop_lag_last_seconds", "Lag seen by the most recent loop probe.",
+               collect=lambda: {(): loop_monitor.last_lag})
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,84 @@
+﻿# file: app/api/routes/packs.py
+
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.api.db.database import get_session
+from app.api.db.models import CardPack, CardPackDB, PackCardDB
+from app.api.game.catalog import catalog
+
+router = APIRouter()
+
+
+def member_rows(pack: CardPack) -> list:
+    # Only cards the catalog knows about; unknown ids are rejected.
+    rows = []
+    for kind, card_ids in (("black", pack.blackCardIds), ("white", pack.whiteCardIds)):
+        pool = catalog.pool(kind)
+        for card_id in dict.fromkeys(card_ids):
+            if pool.find(card_id) is None:
+                raise HTTPException(status_code=400, detail=f"Unknown {kind} card: {card_id}")
+            rows.append(PackCardDB(pack_id=pack.id, kind=kind, card_id=card_id))
+    return rows
+
+
+async def commit_pack(session: AsyncSession):
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="A pack with this name already exists")
+
+
+@router.get("/packs")
+async def get_packs():
+    await catalog.ensure_loaded()
+    return [catalog.pack_summary(pack_id) for pack_id in catalog.packs]
+
+
+@router.post("/packs")
+async def create_pack(pack: CardPack, session: AsyncSession = Depends(get_session)):
+    await catalog.ensure_loaded()
+    pack = pack.model_copy(update={"id": pack.id or str(uuid.uuid4())})
+    rows = member_rows(pack)
+    session.add(CardPackDB(id=pack.id, name=pack.name, description=pack.description))
+    session.add_all(rows)
+    await commit_pack(session)
+    catalog.set_pack(pack)
+    return catalog.pack_summary(pack.id)
+
+
+@router.put("/packs/{pack_id}")
+async def update_pack(pack_id: str, pack: CardPack, session: AsyncSession = Depends(get_session)):
+    # Replaces the name, description and the whole card list.
+    await catalog.ensure_loaded()
+    result = await session.execute(select(CardPackDB).where(CardPackDB.id == pack_id))
+    db_pack = result.scalars().first()
+    if not db_pack:
+        raise HTTPException(status_code=404, detail="Pack not found")
+    pack = pack.model_copy(update={"id": pack_id})
+    rows = member_rows(pack)
+    db_pack.name = pack.name
+    db_pack.description = pack.description
+    await session.execute(delete(PackCardDB).where(PackCardDB.pack_id == pack_id))
+    session.add_all(rows)
+    await commit_pack(session)
+    catalog.set_pack(pack)
+    return catalog.pack_summary(pack_id)
+
+
+@router.delete("/packs/{pack_id}")
+async def delete_pack(pack_id: str, session: AsyncSession = Depends(get_session)):
+    result = await session.execute(select(CardPackDB).where(CardPackDB.id == pack_id))
+    db_pack = result.scalars().first()
+    if not db_pack:
+        raise HTTPException(status_code=404, detail="Pack not found")
+    await session.delete(db_pack)
+    await session.commit()
+    catalog.remove_pack(pack_id)
+    return {"detail": "Pack deleted"}
@@ -23,34 +23,50 @@ class VoteRequest(BaseModel):
     votedPlayerId: str
 
 
-class GameUpdate(BaseModel):
-    type: str = "game_update"
-    gameId: str
-    playerId: str
-    isHost: bool
-
-
-class NavigateResponse(BaseModel):
-    type: str = "navigate"
-    route: str
-
-
 class GameStateResponse(BaseModel):
     type: str = "game_update"
+    version: int
     gameId: str
     players: List[Dict]
     blackCard: Optional[Dict]
     currentRound: int
     gamePhase: str
+    route: str
     settings: Dict
     playerAnswers: List[Dict]
     currentPresentationIndex: int
+    deadline: Optional[int]
+    serverTime: int
     timeLeft: int
     winners: List[Dict]
     selectedCardId: Optional[str]
     votedPlayerId: Optional[str]
     votes: Optional[Dict]
     answersCount: Optional[int]
+    audience: Optional[Dict] = None
     playerId: str
     isHost: bool
     whiteCards: Optional[List[Dict]] = None
+
+
+class AudienceStateResponse(BaseModel):
+    type: str = "audience_update"
+    version: int
+    gameId: str
+    players: List[Dict]
+    blackCard: Optional[Dict]
+    currentRound: int
+    gamePhase: str
+    playerAnswers: List[Dict]
+    currentPresentationIndex: int
+    deadline: Optional[int]
+    serverTime: int
+    winners: List[Dict]
+    audience: Dict
+
+
+class StatePatchResponse(BaseModel):
+    type: str = "state_patch"
+    version: int
+    baseVersion: int
+    changes: Dict
@@ -1,17 +1,58 @@
+﻿# Imported first so time-to-ready counts the imports below.
+from app.api.core.startup import prepare_schema, startup, warm_pool
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import time
 import uvicorn
 
 from app.api.routes import router
+from app.api.core.config import settings
+from app.api.core.metrics import loop_monitor
 from app.api.db.database import engine
-from app.api.db.models import Base
+from app.api.db.search import card_search
+from app.api.game.catalog import catalog
+from app.api.game.leaderboard import leaderboards
+from app.api.routes.game import adopt_game, cluster, history, lifecycle, snapshotter
+
+
+async def warm_catalog():
+    await catalog.load()
+    card_search.sync()
+
+
+async def warm_up():
+    # The schema goes first: in "create" mode the tables the other steps
+    # read may not exist yet.
+    await startup.step("schema", prepare_schema(engine, settings.DB_SCHEMA))
+    await startup.run(
+        pool=warm_pool(engine, settings.DB_WARM_CONNECTIONS),
+        catalog=warm_catalog(),
+        leaderboards=leaderboards.load(time.time()),
+    )
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await warm_up()
+    await startup.step("cluster", cluster.start())
+    await startup.step("restore", snapshotter.restore(adopt_game))
+    snapshotter.start()
+    history.start()
+    lifecycle.start()
+    leaderboards.start()
+    loop_monitor.start()
+    startup.mark_ready()
     yield
+    startup.stopping = True
+    loop_monitor.stop()
+    leaderboards.stop()
+    lifecycle.stop()
+    snapshotter.stop()
+    await snapshotter.checkpoint()
+    await history.close()
+    await cluster.close()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -0,0 +1,312 @@
+﻿# file: benchmarks/ws_load.py
+#
+# Plays full games against the ASGI app in this process, with no server
+# or database, and reports latency, throughput, CPU and memory per game.
+#
+#   python -m benchmarks.ws_load --games 1,10,50 --players 4 --rounds 3 --output run.json
+#   python -m benchmarks.ws_load --games 50 --baseline run.json
+#   python -m benchmarks.ws_load --games 50 --codec fields+deflate
+
+import argparse
+import asyncio
+import gc
+import os
+import platform
+import resource
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from app.api.core.config import settings
+from app.api.db.models import BlackCard, WhiteCard
+from app.api.game.catalog import catalog
+from app.api.game.codecs import CODECS, JSON, SUBPROTOCOL_PREFIX, Codec
+from app.api.game.encoding import dumps, loads
+from app.api.routes.game import games, manager
+from app.main import app
+
+
+class InProcessWebSocket:
+    # Minimal ASGI websocket client: the app runs as a task on this loop
+    # and messages go through two queues.
+    def __init__(self, path: str, codec: Codec = JSON):
+        self.path = path
+        self.codec = codec
+        self.to_app: asyncio.Queue = asyncio.Queue()
+        self.from_app: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.received_bytes = 0
+
+    async def connect(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "http_version": "1.1",
+            "path": self.path, "raw_path": self.path.encode(), "root_path": "", "query_string": b"",
+            "headers": [], "client": ("bench", 0), "server": ("bench", 80),
+            "subprotocols": [SUBPROTOCOL_PREFIX + self.codec.name] if self.codec is not JSON else [],
+        }
+        self.task = asyncio.create_task(app(scope, self.to_app.get, self.from_app.put))
+        await self.to_app.put({"type": "websocket.connect"})
+        message = await self.from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"Connection to {self.path} refused: {message}")
+
+    async def send(self, data: dict):
+        if self.codec.binary:
+            await self.to_app.put({"type": "websocket.receive", "bytes": self.codec.pack(data)})
+        else:
+            await self.to_app.put({"type": "websocket.receive", "text": dumps(data)})
+
+    async def receive(self) -> Optional[dict]:
+        message = await self.from_app.get()
+        if message["type"] == "websocket.close":
+            return None
+        self.received_bytes += len(message.get("bytes") or message.get("text") or "")
+        return self.codec.decode(message["bytes"] if message.get("bytes") is not None else message["text"])
+
+    async def close(self):
+        await self.to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self.task is not None:
+            try:
+                await asyncio.wait_for(self.task, 1)
+            except (asyncio.TimeoutError, Exception):
+                self.task.cancel()
+
+
+class Table:
+    # Shared bookkeeping for the bots of one game.
+    def __init__(self, players: int, rounds: int):
+        self.players = players
+        self.rounds = rounds
+        self.game_id: Optional[str] = None
+        self.created = asyncio.Event()
+        self.last_action = 0.0
+        self.finished = False
+
+
+class Bot:
+    def __init__(self, run: "Run", table: Table, player_id: str, host: bool):
+        self.run = run
+        self.table = table
+        self.player_id = player_id
+        self.host = host
+        self.state: dict = {}
+        self.answered_round = -1
+        self.voted_round = -1
+        self.started = False
+        self.ws = InProcessWebSocket(f"/ws/nogame/{player_id}", run.codec)
+
+    async def act(self, data: dict):
+        self.table.last_action = time.perf_counter()
+        self.run.actions += 1
+        await self.ws.send(data)
+
+    async def play(self):
+        await self.ws.connect()
+        if self.host:
+            await self.act({"action": "create_game", "nickname": self.player_id})
+        else:
+            await self.table.created.wait()
+            await self.act({"action": "join_game", "gameId": self.table.game_id, "nickname": self.player_id})
+        while not self.table.finished:
+            message = await self.ws.receive()
+            if message is None:
+                break
+            self.on_frame(message)
+            await self.react()
+        self.run.received_bytes += self.ws.received_bytes
+        await self.ws.close()
+
+    def on_frame(self, message: dict):
+        kind = message.get("type")
+        if kind == "game_update":
+            self.state = message
+        elif kind == "state_patch":
+            self.state.update(message["changes"])
+            self.state["version"] = message["version"]
+        else:
+            return
+        self.run.frames += 1
+        if self.table.last_action:
+            self.run.latencies.append(time.perf_counter() - self.table.last_action)
+
+    async def react(self):
+        state = self.state
+        phase = state.get("gamePhase")
+        round_number = state.get("currentRound", 0)
+        if self.host and self.table.game_id is None and state.get("gameId"):
+            self.table.game_id = state["gameId"]
+            await self.act({"action": "update_settings", "settings": {
+                "cardsPerPlayer": self.table.rounds, "maxPlayers": self.table.players,
+            }})
+            self.table.created.set()
+        if phase == "lobby" and self.host and not self.started and len(state.get("players", ())) == self.table.players:
+            self.started = True
+            await self.act({"action": "start_game"})
+        elif phase == "selection" and self.answered_round != round_number and state.get("whiteCards"):
+            self.answered_round = round_number
+            await self.act({"action": "select_card", "cardId": state["whiteCards"][0]["id"]})
+        elif phase == "voting" and self.voted_round != round_number:
+            others = [a["playerId"] for a in state.get("playerAnswers", ()) if a["playerId"] != self.player_id]
+            if others:
+                self.voted_round = round_number
+                await self.act({"action": "vote", "votedPlayerId": others[0]})
+        elif phase == "results":
+            self.table.finished = True
+
+
+class Run:
+    def __init__(self, codec: Codec = JSON):
+        self.codec = codec
+        self.received_bytes = 0
+        self.frames = 0
+        self.actions = 0
+        self.latencies: List[float] = []
+
+
+def seed_catalog(white: int = 2000, black: int = 200):
+    if catalog.loaded and catalog.white.live_count and catalog.black.live_count:
+        return
+    for i in range(black):
+        catalog.put("black", BlackCard(id=f"bench-b{i}", content=f"Benchmark question {i} ____?"))
+    for i in range(white):
+        catalog.put("white", WhiteCard(id=f"bench-w{i}", content=f"Benchmark answer {i}"))
+    catalog.loaded = True
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_step(game_count: int, players: int = 4, rounds: int = 3, timeout: float = 120.0,
+                   codec: Codec = JSON) -> dict:
+    seed_catalog()
+    run = Run(codec)
+    tables = [Table(players, rounds) for _ in range(game_count)]
+    prefix = uuid.uuid4().hex[:6]
+    bots = [
+        Bot(run, table, f"{prefix}-g{g}-p{p}", host=p == 0)
+        for g, table in enumerate(tables) for p in range(players)
+    ]
+    gc.collect()
+    rss_before = rss_bytes()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(bot.play()) for bot in bots]
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    rss_after = rss_bytes()
+    for task in pending:
+        task.cancel()
+    finished = sum(table.finished for table in tables)
+    for table in tables:
+        game = games.pop(table.game_id, None) if table.game_id else None
+        if game is not None:
+            game.cancel_timer()
+            game.audience.cancel()
+    lat_ms = [value * 1000 for value in run.latencies]
+    return {
+        "games": game_count,
+        "players": players,
+        "rounds": rounds,
+        "completedGames": finished,
+        "wallSeconds": round(wall, 4),
+        "cpuSeconds": round(cpu, 4),
+        "cpuPerGameMs": round(cpu * 1000 / game_count, 3),
+        "actions": run.actions,
+        "framesReceived": run.frames,
+        "framesPerSecond": round(run.frames / wall, 1) if wall else 0.0,
+        "bytesPerFrame": round(run.received_bytes / run.frames, 1) if run.frames else 0.0,
+        "latencyMs": {
+            "p50": round(percentile(lat_ms, 0.50), 3),
+            "p90": round(percentile(lat_ms, 0.90), 3),
+            "p99": round(percentile(lat_ms, 0.99), 3),
+            "max": round(max(lat_ms, default=0.0), 3),
+        },
+        "rssPerGameKb": round(max(0, rss_after - rss_before) / 1024 / game_count, 1),
+        "connections": manager.stats()["connections"],
+    }
+
+
+async def run_suite(game_counts: List[int], players: int, rounds: int, timeout: float,
+                    codec: Codec = JSON) -> dict:
+    presentation = settings.PRESENTATION_SECONDS
+    settings.PRESENTATION_SECONDS = 0
+    try:
+        steps = [await run_step(count, players, rounds, timeout, codec) for count in game_counts]
+    finally:
+        settings.PRESENTATION_SECONDS = presentation
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "players": players,
+            "rounds": rounds,
+            "codec": codec.name,
+        },
+        "runs": steps,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    # Flags steps whose p99 latency or CPU per game grew beyond tolerance.
+    previous: Dict[int, dict] = {step["games"]: step for step in baseline.get("runs", [])}
+    regressions = []
+    for step in result["runs"]:
+        before = previous.get(step["games"])
+        if before is None:
+            continue
+        for label, now, then in (
+            ("latency p99", step["latencyMs"]["p99"], before["latencyMs"]["p99"]),
+            ("cpu per game", step["cpuPerGameMs"], before["cpuPerGameMs"]),
+        ):
+            if then and now > then * (1 + tolerance):
+                regressions.append(f"{step['games']} games: {label} {then} -> {now}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="In-process WebSocket load test")
+    parser.add_argument("--games", default="1,10,50", help="comma-separated game counts, one step each")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--codec", default=JSON.name, choices=sorted(CODECS), help="wire encoding the bots negotiate")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    parser.add_argument("--baseline", help="JSON result of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before failing")
+    args = parser.parse_args(argv)
+
+    counts = [int(value) for value in args.games.split(",") if value]
+    result = asyncio.run(run_suite(counts, args.players, args.rounds, args.timeout, CODECS[args.codec]))
+    encoded = dumps(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(encoded)
+    else:
+        print(encoded)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, loads(f.read()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
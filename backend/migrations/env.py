@@ -1,12 +1,17 @@
 import asyncio
+import os
 from logging.config import fileConfig
 from sqlalchemy.ext.asyncio import async_engine_from_config
 from sqlalchemy import pool
 from alembic import context
-from app.models import Base
+from app.api.core.config import settings
+from app.api.db.models import Base
 
 config = context.config
 fileConfig(config.config_file_name)
+# Containers point alembic at the same database as the app.
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
 
 target_metadata = Base.metadata
 
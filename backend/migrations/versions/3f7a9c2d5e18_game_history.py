@@ -0,0 +1,62 @@
+"""Game history
+
+Revision ID: 3f7a9c2d5e18
+Revises: 8d4b2e6f1a37
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3f7a9c2d5e18'
+down_revision = '8d4b2e6f1a37'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'game_results',
+        sa.Column('match_id', sa.String(), nullable=False),
+        sa.Column('game_id', sa.String(), nullable=False),
+        sa.Column('rounds', sa.Integer(), nullable=False),
+        sa.Column('winner_ids', sa.Text(), nullable=False),
+        sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('match_id')
+    )
+    op.create_index(op.f('ix_game_results_game_id'), 'game_results', ['game_id'], unique=False)
+    op.create_index(op.f('ix_game_results_finished_at'), 'game_results', ['finished_at'], unique=False)
+    op.create_table(
+        'player_results',
+        sa.Column('match_id', sa.String(), nullable=False),
+        sa.Column('player_id', sa.String(), nullable=False),
+        sa.Column('nickname', sa.String(), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('match_id', 'player_id')
+    )
+    op.create_index(op.f('ix_player_results_player_id'), 'player_results', ['player_id'], unique=False)
+    op.create_table(
+        'round_results',
+        sa.Column('match_id', sa.String(), nullable=False),
+        sa.Column('round', sa.Integer(), nullable=False),
+        sa.Column('game_id', sa.String(), nullable=False),
+        sa.Column('black_card_id', sa.String(), nullable=True),
+        sa.Column('winner_ids', sa.Text(), nullable=False),
+        sa.Column('winning_card_ids', sa.Text(), nullable=False),
+        sa.Column('votes', sa.Text(), nullable=False),
+        sa.Column('answers', sa.Integer(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('match_id', 'round')
+    )
+    op.create_index(op.f('ix_round_results_game_id'), 'round_results', ['game_id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_round_results_game_id'), table_name='round_results')
+    op.drop_table('round_results')
+    op.drop_index(op.f('ix_player_results_player_id'), table_name='player_results')
+    op.drop_table('player_results')
+    op.drop_index(op.f('ix_game_results_finished_at'), table_name='game_results')
+    op.drop_index(op.f('ix_game_results_game_id'), table_name='game_results')
+    op.drop_table('game_results')
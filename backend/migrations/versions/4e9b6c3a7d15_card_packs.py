@@ -0,0 +1,40 @@
+"""Card packs
+
+Revision ID: 4e9b6c3a7d15
+Revises: 7a3d1f9e4c62
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4e9b6c3a7d15'
+down_revision = '7a3d1f9e4c62'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'card_packs',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name')
+    )
+    op.create_table(
+        'pack_cards',
+        sa.Column('pack_id', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(length=5), nullable=False),
+        sa.Column('card_id', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['pack_id'], ['card_packs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('pack_id', 'kind', 'card_id')
+    )
+    op.create_index('ix_pack_cards_kind_card', 'pack_cards', ['kind', 'card_id'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_pack_cards_kind_card', table_name='pack_cards')
+    op.drop_table('pack_cards')
+    op.drop_table('card_packs')
@@ -0,0 +1,27 @@
+"""Game snapshots
+
+Revision ID: 5c1e7f3a9b21
+Revises: 099a207bd331
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7f3a9b21'
+down_revision = '099a207bd331'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'game_snapshots',
+        sa.Column('game_id', sa.String(), nullable=False),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('game_id')
+    )
+
+def downgrade():
+    op.drop_table('game_snapshots')
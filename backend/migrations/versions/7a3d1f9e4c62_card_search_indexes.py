@@ -0,0 +1,26 @@
+"""Card search indexes
+
+Revision ID: 7a3d1f9e4c62
+Revises: e2c5a8f1b364
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '7a3d1f9e4c62'
+down_revision = 'e2c5a8f1b364'
+branch_labels = None
+depends_on = None
+
+TABLES = ('black_cards', 'white_cards')
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table in TABLES:
+        # Trigram index: serves similarity search and ILIKE '%...%' filters.
+        op.execute(f"CREATE INDEX ix_{table}_content_trgm ON {table} USING gin (content gin_trgm_ops)")
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_content_trgm")
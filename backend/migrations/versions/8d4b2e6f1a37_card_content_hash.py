@@ -0,0 +1,37 @@
+"""Card content hash
+
+Revision ID: 8d4b2e6f1a37
+Revises: 5c1e7f3a9b21
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8d4b2e6f1a37'
+down_revision = '5c1e7f3a9b21'
+branch_labels = None
+depends_on = None
+
+TABLES = ('black_cards', 'white_cards')
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('content_hash', sa.String(length=64), nullable=True))
+        # Same normalisation as app.api.db.bulk.content_hash: collapse whitespace, sha256 hex.
+        op.execute(
+            f"UPDATE {table} SET content_hash = encode(sha256(convert_to("
+            f"regexp_replace(btrim(content, E' \\t\\n\\r'), E'\\\\s+', ' ', 'g'), 'UTF8')), 'hex')"
+        )
+        # Existing duplicates keep their rows but only the first one gets the hash.
+        op.execute(
+            f"UPDATE {table} SET content_hash = NULL WHERE id NOT IN "
+            f"(SELECT min(id) FROM {table} GROUP BY content_hash)"
+        )
+        op.create_unique_constraint(f'uq_{table}_content_hash', table, ['content_hash'])
+
+def downgrade():
+    for table in TABLES:
+        op.drop_constraint(f'uq_{table}_content_hash', table, type_='unique')
+        op.drop_column(table, 'content_hash')
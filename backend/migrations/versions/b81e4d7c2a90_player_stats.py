@@ -0,0 +1,46 @@
+"""Player stats
+
+Revision ID: b81e4d7c2a90
+Revises: 3f7a9c2d5e18
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b81e4d7c2a90'
+down_revision = '3f7a9c2d5e18'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'player_stats',
+        sa.Column('period', sa.String(), nullable=False),
+        sa.Column('player_id', sa.String(), nullable=False),
+        sa.Column('nickname', sa.String(), nullable=False),
+        sa.Column('games', sa.Integer(), nullable=False),
+        sa.Column('wins', sa.Integer(), nullable=False),
+        sa.Column('points', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint('period', 'player_id')
+    )
+    op.create_index('ix_player_stats_period_wins', 'player_stats', ['period', 'wins'], unique=False)
+    # Aggregate what history is already stored.
+    op.execute("""
+        INSERT INTO player_stats (period, player_id, nickname, games, wins, points)
+        SELECT period, p.player_id, max(p.nickname), count(*), sum(CASE WHEN p.rank = 1 THEN 1 ELSE 0 END), sum(p.score)
+        FROM player_results p
+        JOIN game_results g ON g.match_id = p.match_id
+        CROSS JOIN LATERAL (VALUES
+            ('all'),
+            ('month:' || to_char(g.finished_at AT TIME ZONE 'UTC', 'YYYY-MM')),
+            ('week:' || to_char(g.finished_at AT TIME ZONE 'UTC', 'IYYY-"W"IW'))
+        ) AS periods(period)
+        GROUP BY period, p.player_id
+    """)
+
+def downgrade():
+    op.drop_index('ix_player_stats_period_wins', table_name='player_stats')
+    op.drop_table('player_stats')
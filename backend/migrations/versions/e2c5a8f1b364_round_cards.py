@@ -0,0 +1,31 @@
+"""Round cards
+
+Revision ID: e2c5a8f1b364
+Revises: b81e4d7c2a90
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e2c5a8f1b364'
+down_revision = 'b81e4d7c2a90'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'round_cards',
+        sa.Column('match_id', sa.String(), nullable=False),
+        sa.Column('round', sa.Integer(), nullable=False),
+        sa.Column('player_id', sa.String(), nullable=False),
+        sa.Column('black_card_id', sa.String(), nullable=True),
+        sa.Column('white_card_id', sa.String(), nullable=False),
+        sa.Column('votes', sa.Integer(), nullable=False),
+        sa.Column('won', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('match_id', 'round', 'player_id')
+    )
+
+def downgrade():
+    op.drop_table('round_cards')
@@ -0,0 +1,62 @@
+﻿import asyncio
+import pytest
+from app.api.game.audience import AudienceVotes
+from app.api.game.manager import ConnectionManager
+from tests.test_connection_queues import FakeWebSocket, make_game
+
+
+@pytest.mark.asyncio
+async def test_audience_votes_are_merged_once_per_interval():
+    merges = []
+    audience = AudienceVotes(shards=4, interval=0.01, on_merge=lambda: merges.append(dict(audience.totals)))
+    for i in range(100):
+        audience.vote(f"s{i}", "p1" if i % 4 else "p2")
+    audience.vote("s0", "p1")
+    audience.set_viewers(0, 100)
+    assert audience.totals == {}
+
+    await asyncio.sleep(0.03)
+    assert merges == [{"p1": 76, "p2": 24}]
+    assert audience.viewers == 100
+
+    audience.clear()
+    assert audience.totals == {}
+    assert all(not shard.choices for shard in audience.shards)
+
+
+@pytest.mark.asyncio
+async def test_spectators_share_one_frame_without_personal_fields():
+    manager = ConnectionManager()
+    games = make_game()
+    player = FakeWebSocket()
+    spectators = [FakeWebSocket() for _ in range(3)]
+    await manager.connect(player, "g1", "fast")
+    for i, websocket in enumerate(spectators):
+        await manager.connect_spectator(websocket, "g1", f"s{i}")
+
+    await manager.broadcast_game_state("g1", games)
+    await manager.broadcast_game_state("g1", games)
+    await asyncio.sleep(0.01)
+
+    frames = [websocket.frames for websocket in spectators]
+    assert all(len(f) == 1 for f in frames)
+    assert frames[0] == frames[1] == frames[2]
+    assert frames[0][0]["type"] == "audience_update"
+    assert "whiteCards" not in frames[0][0] and "playerId" not in frames[0][0]
+    assert player.frames[0]["type"] == "game_update"
+
+    late = FakeWebSocket()
+    await manager.connect_spectator(late, "g1", "late")
+    await asyncio.sleep(0.01)
+    assert late.frames == frames[0]
+    assert manager.stats()["spectators"] == 4
+
+
+@pytest.mark.asyncio
+async def test_audience_votes_only_count_during_voting():
+    game = make_game()["g1"]
+    assert game.submit_audience_vote("s1", "fast") is False
+    game.game_phase = "voting"
+    assert game.submit_audience_vote("s1", "nobody") is False
+    assert game.submit_audience_vote("s1", "fast") is True
+    game.audience.cancel()
@@ -1,6 +1,18 @@
 ﻿import pytest
 
 
+async def list_all(client, path):
+    cards, params = [], {"limit": 1000}
+    while True:
+        response = await client.get(path, params=params)
+        assert response.status_code == 200
+        cards.extend(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return cards
+        params = {"limit": 1000, "after": cursor}
+
+
 @pytest.mark.asyncio
 async def test_create_get_delete_black_card(test_client):
     # --- CREATE ---
@@ -12,14 +24,13 @@ async def test_create_get_delete_black_card(test_client):
     card_id = created_card["id"]
 
     # --- GET ---
-    get_response = await test_client.get("/black_cards")
-    assert get_response.status_code == 200
-    assert any(card["id"] == card_id for card in get_response.json())
+    cards = await list_all(test_client, "/black_cards")
+    assert any(card["id"] == card_id for card in cards)
 
     # --- DELETE ---
     delete_response = await test_client.delete(f"/black_cards/{card_id}")
     assert delete_response.status_code == 200
 
     # --- GET after DELETE ---
-    get_after = await test_client.get("/black_cards")
-    assert all(card["id"] != card_id for card in get_after.json())
+    cards_after = await list_all(test_client, "/black_cards")
+    assert all(card["id"] != card_id for card in cards_after)
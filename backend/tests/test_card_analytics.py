@@ -0,0 +1,71 @@
+﻿import random
+import pytest
+from app.api.db.analytics import CardAnalytics, CardWinRates
+from app.api.db.models import WhiteCard
+from tests.test_game_logic import make_catalog
+
+np = pytest.importorskip("numpy")
+
+
+def outcomes(count=2000, seed=3):
+    rng = random.Random(seed)
+    rows = [(f"b{rng.randrange(5)}", f"w{rng.randrange(40)}", rng.random() < 0.3) for _ in range(count)]
+    return [list(column) for column in zip(*rows)]
+
+
+def test_card_and_pair_win_rates_match_a_plain_count():
+    black, white, won = outcomes()
+    rates = CardWinRates(black, white, won)
+
+    plays, wins = {}, {}
+    for b, w, x in zip(black, white, won):
+        plays[w] = plays.get(w, 0) + 1
+        wins[w] = wins.get(w, 0) + x
+    top = rates.cards("white", make_catalog(), min_plays=1, limit=100)
+    assert len(top) == len(plays)
+    for row in top:
+        assert (row["plays"], row["wins"]) == (plays[row["id"]], wins[row["id"]])
+    assert [row["winRate"] for row in top] == sorted((row["winRate"] for row in top), reverse=True)
+
+    pairs = rates.pairs(min_plays=1, limit=10000)
+    assert sum(row["plays"] for row in pairs) == len(won)
+    assert sum(row["wins"] for row in pairs) == sum(won)
+    b, w = pairs[0]["blackCardId"], pairs[0]["whiteCardId"]
+    assert pairs[0]["plays"] == sum(1 for x, y in zip(black, white) if (x, y) == (b, w))
+
+
+def test_matrix_covers_the_most_played_cards():
+    black, white, won = outcomes()
+    rates = CardWinRates(black, white, won)
+    matrix = rates.matrix(blacks=5, whites=40)
+    assert sum(map(sum, matrix["plays"])) == len(won)
+    assert sum(map(sum, matrix["wins"])) == sum(won)
+    small = rates.matrix(blacks=2, whites=3)
+    assert len(small["plays"]) == 2 and len(small["plays"][0]) == 3
+
+
+def test_low_win_rate_cards_come_first_in_ascending_order():
+    rates = CardWinRates(["b"] * 6, ["w1", "w1", "w1", "w2", "w2", "w3"], [0, 0, 0, 1, 0, 1])
+    catalog = make_catalog()
+    catalog.put("white", WhiteCard(id="w1", content="Dud"))
+    rows = rates.cards("white", catalog, min_plays=2, ascending=True)
+    assert [(r["id"], r["content"], r["winRate"]) for r in rows] == [("w1", "Dud", 0.0), ("w2", None, 0.5)]
+
+
+@pytest.mark.asyncio
+async def test_results_are_cached_per_catalog_version():
+    catalog = make_catalog()
+    analytics = CardAnalytics(catalog)
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        return ["b1"], ["w1"], [True]
+
+    analytics._fetch = fetch
+    first = await analytics.get()
+    assert await analytics.get() is first
+    catalog.put("white", WhiteCard(id="w9", content="New"))
+    assert await analytics.get() is not first
+    assert len(fetches) == 2
+    assert analytics.stats()["hits"] == 1
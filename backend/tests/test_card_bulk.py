@@ -0,0 +1,89 @@
+﻿import pytest
+from app.api.db import bulk
+from app.api.db.bulk import _split_batch, content_hash, import_cards, iter_csv_rows, iter_ndjson_rows
+
+
+async def chunked(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+def test_content_hash_ignores_whitespace():
+    assert content_hash("  Why  is\tthere\n_?") == content_hash("Why is there _?")
+    assert content_hash("Why is there _?") != content_hash("Why was there _?")
+
+
+@pytest.mark.asyncio
+async def test_ndjson_rows_survive_chunk_boundaries_and_report_errors():
+    body = b'{"content": "First"}\n\n{"id": "w2", "content": "Second"}\nnot json\n{"content": " "}\n{"content": "Last"}'
+    rows = await collect(iter_ndjson_rows(chunked(body)))
+
+    assert [(n, row) for n, row, error in rows if error is None] == [
+        (1, {"id": None, "content": "First"}),
+        (3, {"id": "w2", "content": "Second"}),
+        (6, {"id": None, "content": "Last"}),
+    ]
+    assert [(n, error) for n, row, error in rows if error] == [(4, "Invalid JSON"), (5, "Missing content")]
+
+
+@pytest.mark.asyncio
+async def test_csv_rows_allow_quoted_newlines():
+    body = 'id,content\r\nb1,"Line one\nline two"\r\n,"Say ""hi"""\r\n'.encode()
+    rows = await collect(iter_csv_rows(chunked(body, 5)))
+
+    assert rows == [
+        (2, {"id": "b1", "content": "Line one\nline two"}, None),
+        (4, {"id": None, "content": 'Say "hi"'}, None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_import_deduplicates_by_content_in_batches(monkeypatch):
+    written = []
+
+    async def fake_write(kind, rows, report):
+        written.append([row["content"] for row in rows])
+        report.inserted += len(rows)
+
+    monkeypatch.setattr(bulk, "_write_batch", fake_write)
+    monkeypatch.setattr(bulk, "BATCH_SIZE", 2)
+    body = b'{"content": "A"}\n{"content": "A "}\n{"content": "B"}\n{"content": "C"}\n{}\n'
+    report = await import_cards("white", iter_ndjson_rows(chunked(body)))
+
+    assert written == [["A", "B"], ["C"]]
+    assert (report["received"], report["inserted"], report["duplicates"], report["failed"]) == (5, 3, 1, 1)
+    assert report["errors"] == [{"line": 5, "error": "Missing content"}]
+
+
+def test_split_batch_updates_known_ids_with_new_content():
+    rows = [
+        {"id": "w1", "content": "Same", "content_hash": content_hash("Same")},
+        {"id": "w2", "content": "Edited", "content_hash": content_hash("Edited")},
+        {"id": "w3", "content": "New", "content_hash": content_hash("New")},
+        {"id": "w4", "content": "Copy", "content_hash": content_hash("Copy")},
+    ]
+    existing = {"w1": content_hash("Same"), "w2": content_hash("Old"), "w9": content_hash("Copy")}
+    fresh, changed = _split_batch(rows, existing)
+
+    assert [row["id"] for row in fresh] == ["w3"]
+    assert [row["id"] for row in changed] == ["w2"]
+
+
+@pytest.mark.asyncio
+async def test_repeated_id_in_a_batch_keeps_the_last_line(monkeypatch):
+    written = []
+
+    async def fake_write(kind, rows, report):
+        written.append([(row["id"], row["content"]) for row in rows])
+
+    monkeypatch.setattr(bulk, "_write_batch", fake_write)
+    body = b'{"id": "w1", "content": "A"}\n{"content": "B"}\n{"id": "w1", "content": "C"}\n'
+    report = await import_cards("white", iter_ndjson_rows(chunked(body)))
+
+    assert [content for _, content in written[0]] == ["B", "C"]
+    assert written[0][1] == ("w1", "C")
+    assert report["duplicates"] == 1
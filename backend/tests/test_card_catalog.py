@@ -0,0 +1,81 @@
+﻿import pytest
+from app.api.game.catalog import CardCatalog
+from app.api.game.logic import Game
+from app.api.db.models import WhiteCard, BlackCard
+
+
+def make_catalog():
+    catalog = CardCatalog()
+    for i in range(3):
+        catalog.put("black", BlackCard(id=f"b{i}", content=f"Question {i}?"))
+    for i in range(10):
+        catalog.put("white", WhiteCard(id=f"w{i}", content=f"Answer {i}"))
+    catalog.loaded = True
+    return catalog
+
+
+def test_pool_keeps_slots_stable_on_update_and_delete():
+    catalog = make_catalog()
+    slot = catalog.white.slot_of("w5")
+
+    catalog.put("white", WhiteCard(id="w5", content="Edited"))
+    assert catalog.white.slot_of("w5") == slot
+    assert catalog.white.get(slot).content == "Edited"
+
+    assert catalog.remove("white", "w5") is True
+    assert catalog.white.get(slot) is None
+    assert catalog.white.slot_of("w6") == slot + 1
+    assert catalog.white.live_count == 9
+
+
+def test_replace_all_reuses_existing_slots():
+    catalog = make_catalog()
+    slot = catalog.white.slot_of("w3")
+
+    catalog.white.replace_all([WhiteCard(id="w3", content="Answer 3"), WhiteCard(id="new", content="New")])
+
+    assert catalog.white.slot_of("w3") == slot
+    assert catalog.white.find("w0") is None
+    assert catalog.white.live_count == 2
+
+
+@pytest.mark.asyncio
+async def test_ensure_loaded_counts_hits_and_misses(monkeypatch):
+    catalog = CardCatalog()
+    loads = []
+
+    async def fake_load():
+        loads.append(1)
+        catalog.loaded = True
+        catalog.reloads += 1
+
+    monkeypatch.setattr(catalog, "load", fake_load)
+
+    await catalog.ensure_loaded()
+    await catalog.ensure_loaded()
+    await catalog.ensure_loaded()
+
+    assert len(loads) == 1
+    assert catalog.stats()["misses"] == 1
+    assert catalog.stats()["hits"] == 2
+    assert catalog.stats()["reloads"] == 1
+
+
+@pytest.mark.asyncio
+async def test_games_share_catalog_cards():
+    catalog = make_catalog()
+    game1 = Game(game_id="g1", host_id="host", catalog=catalog)
+    game2 = Game(game_id="g2", host_id="host", catalog=catalog)
+
+    await game1.load_cards()
+    await game2.load_cards()
+
+    assert len(game1.white_deck) == 10
+    assert catalog.hits == 2
+
+    game1.add_player("p1", "Alice")
+    game2.add_player("p1", "Alice")
+    game1.deal_cards()
+    game2.deal_cards()
+    for card in game1.player_cards["p1"] + game2.player_cards["p1"]:
+        assert card is catalog.white.find(card.id)
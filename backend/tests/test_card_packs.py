@@ -0,0 +1,69 @@
+﻿import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.api.db.models import BlackCard, CardPack, WhiteCard
+from app.api.game.catalog import CardCatalog, catalog
+from app.api.game.logic import Game
+from app.main import app
+from tests.test_ws_routes import receive_until
+
+
+def make_catalog():
+    catalog = CardCatalog()
+    for i in range(4):
+        catalog.put("black", BlackCard(id=f"b{i}", content=f"Question {i}?"))
+    for i in range(40):
+        catalog.put("white", WhiteCard(id=f"w{i}", content=f"Answer {i}"))
+    catalog.set_pack(CardPack(id="small", name="Small", blackCardIds=["b0"], whiteCardIds=[f"w{i}" for i in range(12)]))
+    catalog.set_pack(CardPack(id="other", name="Other", blackCardIds=["b1"], whiteCardIds=["w10", "w11", "w30"]))
+    catalog.loaded = True
+    return catalog
+
+
+def test_pack_slots_are_merged_without_duplicates():
+    catalog = make_catalog()
+
+    assert catalog.slots_of("white", ["small"]) is catalog.pack_slots["small"]["white"]
+    merged = catalog.slots_of("white", ["small", "other", "missing"])
+    assert sorted(catalog.white.get(slot).id for slot in merged) == sorted([f"w{i}" for i in range(12)] + ["w30"])
+
+    catalog.remove("white", "w30")
+    assert catalog.pack_summary("other")["whiteCards"] == 2
+
+
+def test_game_draws_only_from_its_packs():
+    game = Game(game_id="packs", host_id="p1", catalog=make_catalog())
+    game.add_player("p1", "Alice")
+    game.add_player("p2", "Bob")
+    game.choose_packs(["small", "other"])
+    asyncio.run(game.start_game())
+
+    assert len(game.white_deck.base) == 13
+    dealt = {card.id for hand in game.player_cards.values() for card in hand}
+    assert dealt <= {f"w{i}" for i in range(12)} | {"w30"}
+    assert game.current_black_card.id in ("b0", "b1")
+
+    with pytest.raises(ValueError):
+        game.choose_packs(["small"])
+
+
+def test_update_settings_checks_packs(monkeypatch):
+    monkeypatch.setattr(catalog, "loaded", True)
+    catalog.set_pack(CardPack(id="route-pack", name="Route pack"))
+    client = TestClient(app)
+    try:
+        with client.websocket_connect("/ws/nogame/host") as host:
+            host.send_json({"action": "create_game", "nickname": "Alice"})
+            receive_until(host, "game_update")
+
+            host.send_json({"action": "update_settings", "settings": {"packs": ["nope"]}})
+            assert receive_until(host, "error")["message"] == "Unknown card pack: nope"
+
+            host.send_json({"action": "update_settings", "settings": {"packs": ["route-pack"], "votingTime": 30}})
+            patch = receive_until(host, "state_patch")
+            assert patch["changes"]["settings"]["packs"] == ["route-pack"]
+            assert patch["changes"]["settings"]["votingTime"] == 30
+    finally:
+        catalog.remove_pack("route-pack")
@@ -0,0 +1,65 @@
+﻿import gzip
+import pytest
+from starlette.testclient import TestClient
+from app.api.db.models import WhiteCard
+from app.api.db.pages import CardPage, CardPageCache, card_pages
+from app.api.game.catalog import CardCatalog
+from app.main import app
+
+
+@pytest.mark.asyncio
+async def test_pages_are_cached_until_the_catalog_changes(monkeypatch):
+    catalog = CardCatalog()
+    cache = CardPageCache(catalog)
+    fetched = []
+
+    async def fake_fetch(kind, after, limit, q):
+        fetched.append((kind, after, limit, q))
+        return CardPage(b"[]", None)
+
+    monkeypatch.setattr(cache, "_fetch", fake_fetch)
+    await cache.get("white", None, 10, None)
+    await cache.get("white", None, 10, None)
+    await cache.get("white", "w9", 10, None)
+    assert len(fetched) == 2
+    assert cache.hits == 1
+
+    catalog.put("white", WhiteCard(id="w1", content="New"))
+    await cache.get("white", None, 10, None)
+    assert len(fetched) == 3
+
+
+def test_page_compresses_lazily_once():
+    page = CardPage(b'[{"id":"w1","content":"Answer"}]' * 10, "w1")
+    assert gzip.decompress(page.gzipped) == page.body
+    assert page.gzipped is page.gzipped
+
+
+def test_etag_follows_the_body_and_encoding():
+    page = CardPage(b'[{"id":"w1","content":"Answer"}]', None)
+    same = CardPage(b'[{"id":"w1","content":"Answer"}]', None)
+    assert page.etag() == same.etag()
+    assert page.etag(gzipped=True) != page.etag()
+    assert CardPage(b'[{"id":"w1","content":"Edited"}]', None).etag() != page.etag()
+
+
+def test_matching_etag_is_answered_from_the_cached_page(monkeypatch):
+    fetched = []
+
+    async def fake_fetch(kind, after, limit, q):
+        fetched.append(kind)
+        return CardPage(b"[]", None)
+
+    monkeypatch.setattr(card_pages, "_fetch", fake_fetch)
+    monkeypatch.setattr(card_pages, "pages", type(card_pages.pages)())
+    client = TestClient(app)
+    first = client.get("/white_cards", headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["etag"]
+    assert etag.endswith('-gzip"')
+
+    response = client.get("/white_cards", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    # The identity body has a different tag, so it is sent in full.
+    assert client.get("/white_cards", headers={"If-None-Match": etag, "Accept-Encoding": "identity"}).status_code == 200
+    assert fetched == ["white"]
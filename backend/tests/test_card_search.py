@@ -0,0 +1,77 @@
+﻿from starlette.testclient import TestClient
+from app.api.db.models import BlackCard, WhiteCard
+from app.api.db.search import CardSearchIndex, tokenize
+from app.api.game.catalog import CardCatalog, catalog
+from app.main import app
+
+
+def make_index():
+    cards = CardCatalog()
+    for i, content in enumerate([
+        "A disappointing birthday party",
+        "Grandma's secret birthday cake",
+        "A party",
+        "Free samples",
+        "Party animals at a funeral",
+    ]):
+        cards.put("white", WhiteCard(id=f"w{i}", content=content))
+    cards.put("black", BlackCard(id="b0", content="What ruined the party? ____"))
+    cards.loaded = True
+    return cards, CardSearchIndex(cards)
+
+
+def test_tokenizer_ignores_blanks_and_case():
+    assert tokenize("What's ____ FOR dinner?") == ["what", "s", "for", "dinner"]
+
+
+def test_all_words_must_match_and_short_cards_rank_first():
+    _, index = make_index()
+    total, results = index.search("party ")
+    assert total == 4
+    assert results[0]["id"] == "w2"
+    assert {r["id"] for r in results} == {"w0", "w2", "w4", "b0"}
+
+    total, results = index.search("birthday party ")
+    assert total == 1
+    assert results[0]["id"] == "w0"
+
+    assert index.search("party", kinds=("black",))[0] == 1
+    assert index.search("nothing here")[0] == 0
+
+
+def test_last_word_matches_as_prefix_while_typing():
+    _, index = make_index()
+    assert {r["id"] for r in index.search("birth")[1]} == {"w0", "w1"}
+    assert index.search("birth ")[0] == 0
+    assert {r["id"] for r in index.search("secret bir")[1]} == {"w1"}
+
+
+def test_index_catches_up_with_card_writes():
+    cards, index = make_index()
+    index.search("party")
+    cards.put("white", WhiteCard(id="w1", content="A surprise party"))
+    cards.remove("white", "w2")
+    total, results = index.search("party ")
+    assert {r["id"] for r in results} == {"w0", "w1", "w4", "b0"}
+    assert index.search("grandma")[0] == 0
+    assert index.stats()["reindexedCards"] == 8
+
+
+def test_pagination_is_stable():
+    _, index = make_index()
+    total, everything = index.search("party", limit=10)
+    pages = index.search("party", limit=2)[1] + index.search("party", limit=2, offset=2)[1]
+    assert pages == everything
+
+
+def test_search_route_serves_from_memory(monkeypatch):
+    monkeypatch.setattr(catalog, "loaded", True)
+    catalog.put("white", WhiteCard(id="search-w1", content="Zyzzyva racing league"))
+    try:
+        response = TestClient(app).get("/cards/search", params={"q": "zyzzyva rac", "kind": "white"})
+    finally:
+        catalog.remove("white", "search-w1")
+    body = response.json()
+    assert body["source"] == "memory"
+    assert body["total"] == 1
+    assert body["results"][0]["id"] == "search-w1"
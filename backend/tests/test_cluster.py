@@ -0,0 +1,148 @@
+﻿import asyncio
+import pytest
+from app.api.game.backplane import LocalBackplane, SocketBackplane
+from app.api.game.cluster import Cluster, shard_of
+from app.api.game.logic import Game
+from app.api.game.manager import ConnectionManager
+from tests.test_connection_queues import FakeWebSocket
+
+
+async def make_node(backplane):
+    manager = ConnectionManager()
+    cluster = Cluster(manager, backplane, worker_count=2)
+    games = {}
+
+    async def apply_action(game_id, player_id, data):
+        game = games.get(game_id)
+        if data["action"] == "join_game":
+            if game is None:
+                game = games[game_id] = Game(game_id=game_id, host_id=player_id)
+                game.notify = lambda: manager.schedule_broadcast(game)
+            game.add_player(player_id, data["nickname"])
+        manager.schedule_broadcast(game)
+
+    cluster.action_handler = apply_action
+    await cluster.start()
+    return cluster, games
+
+
+def test_games_are_spread_over_workers():
+    owners = {shard_of(f"game{i}", 4) for i in range(100)}
+    assert owners == {0, 1, 2, 3}
+
+
+@pytest.mark.asyncio
+async def test_new_game_ids_are_owned_by_the_creating_worker():
+    backplane = LocalBackplane()
+    first, _ = await make_node(backplane)
+    second, _ = await make_node(backplane)
+
+    assert {first.worker_id, second.worker_id} == {0, 1}
+    assert all(second.owns(second.new_game_id()) for _ in range(20))
+
+
+@pytest.mark.asyncio
+async def test_actions_are_forwarded_to_owner_and_frames_relayed_back():
+    backplane = LocalBackplane()
+    owner, owner_games = await make_node(backplane)
+    other, other_games = await make_node(backplane)
+    game_id = owner.new_game_id()
+    assert not other.owns(game_id)
+
+    websocket = FakeWebSocket()
+    await other.manager.connect(websocket, game_id, "p1")
+    other.attach(game_id, "p1")
+    other.forward(game_id, "p1", {"action": "join_game", "nickname": "Alice"})
+    await asyncio.sleep(0.02)
+
+    assert game_id in owner_games
+    assert game_id not in other_games
+    assert websocket.frames[-1]["type"] == "game_update"
+    assert websocket.frames[-1]["players"][0]["nickname"] == "Alice"
+    assert other.stats()["relayedFrames"] == 1
+
+    other.detach(game_id, "p1")
+    await asyncio.sleep(0.01)
+    assert owner.manager.find(game_id, "p1") is None
+
+
+@pytest.mark.asyncio
+async def test_socket_backplane_assigns_workers_and_relays(tmp_path):
+    address = f"unix:{tmp_path}/backplane.sock"
+    first, second = SocketBackplane(address), SocketBackplane(address)
+    received = []
+    try:
+        assert await first.start(2) == 0
+        assert await second.start(2) == 1
+        second.subscribe("worker:1", received.append)
+        await asyncio.sleep(0.02)
+
+        first.publish("worker:1", {"kind": "frame", "frame": "{}"})
+        await asyncio.sleep(0.05)
+        assert received == [{"kind": "frame", "frame": "{}"}]
+    finally:
+        await second.close()
+        await first.close()
+
+
+@pytest.mark.asyncio
+async def test_socket_backplane_reconnects_when_the_hub_goes_away(tmp_path):
+    address = f"unix:{tmp_path}/backplane.sock"
+    first, second = SocketBackplane(address), SocketBackplane(address, reconnect_delays=(0.01,) * 5)
+    third = SocketBackplane(address)
+    received = []
+    try:
+        assert await first.start(2) == 0
+        assert await second.start(2) == 1
+        second.subscribe("worker:1", received.append)
+        await asyncio.sleep(0.02)
+
+        # The first worker hosted the hub; the second takes over and keeps
+        # its slot and subscriptions.
+        await first.close()
+        await asyncio.sleep(0.1)
+        assert second.reconnects == 1
+        assert second.hub is not None
+
+        assert await third.start(2) == 0
+        third.publish("worker:1", {"kind": "frame", "frame": "{}"})
+        await asyncio.sleep(0.05)
+        assert received == [{"kind": "frame", "frame": "{}"}]
+    finally:
+        await third.close()
+        await second.close()
+
+
+@pytest.mark.asyncio
+async def test_card_writes_reach_the_other_workers_catalog():
+    from app.api.db.models import CardPack, WhiteCard
+    from app.api.db.pages import CardPageCache
+    from app.api.db.search import CardSearchIndex
+    from app.api.game.catalog import CardCatalog
+
+    backplane = LocalBackplane()
+    catalogs = []
+    for _ in range(2):
+        cluster, _ = await make_node(backplane)
+        catalog = CardCatalog()
+        catalog.loaded = True
+        catalog.on_change = cluster.share_catalog_change
+        cluster.catalog_handler = catalog.apply_change
+        catalogs.append(catalog)
+    writer, reader = catalogs
+    search, pages = CardSearchIndex(reader), CardPageCache(reader)
+    pages._sync()
+    cached_version = pages.version
+
+    writer.put_many("white", [WhiteCard(id="w1", content="Zebra crossing"), WhiteCard(id="w2", content="Tea")])
+    writer.set_pack(CardPack(id="p1", name="Pack", whiteCardIds=["w1", "w2"]))
+    writer.remove("white", "w2")
+    await asyncio.sleep(0.01)
+
+    assert reader.remote_changes == 3 and writer.remote_changes == 0
+    assert reader.white.find("w1").content == "Zebra crossing"
+    assert reader.white.find("w2") is None
+    assert "p1" in reader.packs
+    assert search.search("zebra")[1][0]["id"] == "w1"
+    pages._sync()
+    assert pages.version != cached_version
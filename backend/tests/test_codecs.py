@@ -0,0 +1,110 @@
+﻿import asyncio
+import pytest
+from starlette.testclient import TestClient
+from app.api.game.codecs import CODECS, FIELD_IDS, JSON, negotiate
+from app.api.game.manager import ConnectionManager
+from app.api.game.state import StateTracker, shared_state
+from app.main import app
+from tests.test_connection_queues import FakeWebSocket, make_game
+from tests.test_state_protocol import make_game as make_catalog_game
+
+pytest.importorskip("msgpack")
+
+
+class BinaryWebSocket(FakeWebSocket):
+    def __init__(self, protocol):
+        super().__init__()
+        self.scope = {"subprotocols": [protocol]}
+        self.subprotocol = None
+        self.codec = CODECS[protocol.split(".", 1)[1]]
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_bytes(self, frame):
+        self.frames.append(self.codec.decode(frame))
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_spliced_frames_decode_to_the_json_message(name):
+    codec = CODECS[name]
+    game = make_catalog_game()
+    game.game_phase = "selection"
+    game.player_cards["p1"] = [game.catalog.white.find("w1")]
+    frames = {}
+    for current in (JSON, codec):
+        tracker = StateTracker()
+        tracker.update(shared_state(game))
+        snapshot = current.decode(tracker.frame_for(game, "p1", current))
+        game.current_round += 1
+        tracker.update(shared_state(game))
+        patch = current.decode(tracker.frame_for(game, "p1", current))
+        game.current_round -= 1
+        frames[current.name] = (snapshot, patch)
+
+    snapshot, patch = frames[name]
+    expected_snapshot, expected_patch = frames["json"]
+    snapshot["serverTime"] = expected_snapshot["serverTime"]
+    snapshot["resumeToken"] = expected_snapshot["resumeToken"]
+    assert snapshot == expected_snapshot
+    assert patch == expected_patch
+    assert snapshot["whiteCards"] == [{"id": "w1", "content": "Answer"}]
+
+
+def test_field_ids_and_dictionary_make_frames_smaller():
+    game = make_catalog_game()
+    sizes = {}
+    for name in ("json", "msgpack", "fields", "fields+deflate"):
+        tracker = StateTracker()
+        tracker.update(shared_state(game))
+        frame = tracker.frame_for(game, "p1", CODECS[name])
+        sizes[name] = len(frame)
+    assert sizes["json"] > sizes["msgpack"] > sizes["fields"] > sizes["fields+deflate"]
+    assert FIELD_IDS["type"] == 0
+
+
+def test_negotiation_prefers_subprotocol_then_query():
+    class Socket:
+        def __init__(self, subprotocols, query=b""):
+            self.scope = {"subprotocols": subprotocols, "query_string": query}
+
+    assert negotiate(Socket(["other", "absurdly.fields+deflate"])) == (CODECS["fields+deflate"], "absurdly.fields+deflate")
+    assert negotiate(Socket([], b"codec=msgpack%2Bdeflate")) == (CODECS["msgpack+deflate"], None)
+    assert negotiate(Socket(["absurdly.bogus"], b"codec=bogus")) == (JSON, None)
+
+
+@pytest.mark.asyncio
+async def test_shared_state_is_encoded_once_per_codec():
+    manager = ConnectionManager()
+    games = make_game()
+    json_socket, packed, deflated = FakeWebSocket(), BinaryWebSocket("absurdly.msgpack"), BinaryWebSocket("absurdly.msgpack+deflate")
+    await manager.connect(json_socket, "g1", "fast")
+    await manager.connect(packed, "g1", "slow")
+    games["g1"].add_player("third", "Carol")
+    await manager.connect(deflated, "g1", "third")
+    assert packed.subprotocol == "absurdly.msgpack"
+
+    await manager.broadcast_game_state("g1", games)
+    await manager.broadcast("g1", {"type": "notice"})
+    await asyncio.sleep(0.01)
+
+    tracker = manager.trackers["g1"]
+    assert sorted(tracker._shared_fields) == ["json", "msgpack"]
+    for socket in (json_socket, packed, deflated):
+        assert socket.frames[0]["type"] == "game_update"
+        assert socket.frames[0]["players"] == json_socket.frames[0]["players"]
+        assert socket.frames[1] == {"type": "notice"}
+
+
+def test_binary_client_plays_over_a_subprotocol():
+    client = TestClient(app)
+    codec = CODECS["fields+deflate"]
+    with client.websocket_connect("/ws/nogame/packed", subprotocols=["absurdly.fields+deflate"]) as ws:
+        assert ws.accepted_subprotocol == "absurdly.fields+deflate"
+        ws.send_bytes(codec.pack({"action": "create_game", "nickname": "Alice"}))
+        snapshot = codec.decode(ws.receive_bytes())
+        assert snapshot["type"] == "game_update"
+        assert snapshot["isHost"] is True
+
+    assert client.get("/protocol").json()["default"] == "json"
+    assert "fields+deflate" in client.get("/protocol").json()["codecs"]
@@ -0,0 +1,115 @@
+﻿import asyncio
+import json
+import pytest
+from starlette.websockets import WebSocketState
+from app.api.game.logic import Game
+from app.api.game.manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, blocked=False):
+        self.application_state = WebSocketState.CONNECTED
+        self.frames = []
+        self.closed_with = None
+        self.unblocked = asyncio.Event()
+        if not blocked:
+            self.unblocked.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        await self.unblocked.wait()
+        self.frames.append(json.loads(frame))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+        self.application_state = WebSocketState.DISCONNECTED
+
+
+def make_game():
+    game = Game(game_id="g1", host_id="fast")
+    game.add_player("fast", "Alice")
+    game.add_player("slow", "Bob")
+    return {"g1": game}
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_block_broadcast(monkeypatch):
+    monkeypatch.setattr("app.api.game.manager.settings.SEND_QUEUE_SIZE", 4)
+    manager = ConnectionManager()
+    games = make_game()
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    await manager.connect(fast, "g1", "fast")
+    await manager.connect(slow, "g1", "slow")
+
+    for i in range(10):
+        games["g1"].current_round = i
+        await asyncio.wait_for(manager.broadcast_game_state("g1", games), 0.1)
+    await asyncio.sleep(0)
+
+    assert len(fast.frames) == 10
+    assert manager.stats()["droppedFrames"] > 0
+
+    slow.unblocked.set()
+    await asyncio.sleep(0.01)
+    assert slow.frames[-1]["type"] == "game_update"
+    assert slow.frames[-1]["currentRound"] == 9
+
+
+@pytest.mark.asyncio
+async def test_client_behind_past_threshold_is_evicted(monkeypatch):
+    monkeypatch.setattr("app.api.game.manager.settings.SEND_QUEUE_SIZE", 1)
+    monkeypatch.setattr("app.api.game.manager.settings.SLOW_CONSUMER_SECONDS", 0)
+    manager = ConnectionManager()
+    slow = FakeWebSocket(blocked=True)
+    await manager.connect(slow, "g1", "slow")
+
+    for i in range(4):
+        await manager.broadcast("g1", {"type": "error", "message": f"message {i}"})
+    await asyncio.sleep(0.01)
+
+    assert slow.closed_with == 1013
+    assert manager.stats()["evicted"] == 1
+    assert manager.find("g1", "slow") is None
+
+
+@pytest.mark.asyncio
+async def test_changes_in_one_turn_are_flushed_as_one_frame():
+    manager = ConnectionManager()
+    games = make_game()
+    game = games["g1"]
+    game.notify = lambda: manager.schedule_broadcast(game)
+    fast = FakeWebSocket()
+    await manager.connect(fast, "g1", "fast")
+
+    game.add_player("p3", "Carol")
+    game.mark_dirty()
+    game.current_round = 1
+    game.mark_dirty()
+    manager.schedule_broadcast(game)
+    await asyncio.sleep(0.01)
+
+    assert len(fast.frames) == 1
+    assert fast.frames[0]["currentRound"] == 1
+    assert len(fast.frames[0]["players"]) == 3
+    assert manager.stats()["coalesced"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stale_disconnect_keeps_the_new_connection_in_sync():
+    manager = ConnectionManager()
+    games = make_game()
+    old, new = FakeWebSocket(), FakeWebSocket()
+    await manager.connect(old, "g1", "fast")
+    await manager.connect(new, "g1", "fast")
+    await manager.broadcast_game_state("g1", games)
+
+    # The old socket's close handler runs after the new one took over.
+    manager.disconnect("g1", "fast", old)
+    games["g1"].current_round = 2
+    await manager.broadcast_game_state("g1", games)
+    await asyncio.sleep(0.01)
+
+    assert manager.find("g1", "fast").websocket is new
+    assert [frame["type"] for frame in new.frames] == ["game_update", "state_patch"]
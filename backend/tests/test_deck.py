@@ -0,0 +1,44 @@
+﻿import random
+from app.api.game.deck import Deck
+
+
+def test_draws_every_slot_once():
+    deck = Deck(50, rng=random.Random(1))
+    drawn = [deck.draw() for _ in range(50)]
+
+    assert sorted(drawn) == list(range(50))
+    assert len(deck) == 0
+    assert deck.draw() is None
+    assert deck.swaps == {}
+
+
+def test_draw_order_is_shuffled():
+    deck = Deck(1000, rng=random.Random(7))
+    assert [deck.draw() for _ in range(10)] != list(range(10))
+
+
+def test_large_deck_only_stores_touched_positions():
+    deck = Deck(1_000_000, rng=random.Random(3))
+    hand = [deck.draw() for _ in range(100)]
+
+    assert len(set(hand)) == 100
+    assert len(deck) == 1_000_000 - 100
+    assert len(deck.swaps) <= 100
+
+
+def test_reshuffle_merges_remaining_and_discards():
+    deck = Deck(10, rng=random.Random(5))
+    drawn = [deck.draw() for _ in range(8)]
+    for slot in drawn[:3]:
+        deck.discard(slot)
+
+    deck.reshuffle()
+
+    assert len(deck) == 5
+    assert deck.discards == []
+    assert sorted(deck.draw() for _ in range(5)) == sorted(set(range(10)) - set(drawn) | set(drawn[:3]))
+
+
+def test_deck_over_explicit_base():
+    deck = Deck(base=[7, 11, 42], rng=random.Random(2))
+    assert sorted(deck.draw() for _ in range(3)) == [7, 11, 42]
@@ -1,9 +1,20 @@
 ﻿import pytest
 from app.api.game.logic import Game
+from app.api.game.catalog import CardCatalog
 from app.api.db.models import WhiteCard, BlackCard, PlayerAnswer
 import asyncio
 
 
+def make_catalog(white_count=0, black_count=0):
+    catalog = CardCatalog()
+    for i in range(white_count):
+        catalog.put("white", WhiteCard(id=str(i), content=f"White {i}"))
+    for i in range(black_count):
+        catalog.put("black", BlackCard(id=f"b{i + 1}", content="Question?"))
+    catalog.loaded = True
+    return catalog
+
+
 def test_add_and_remove_player():
     game = Game(game_id="abc123", host_id="host")
     player = game.add_player("p1", "Alice")
@@ -16,9 +27,9 @@ def test_add_and_remove_player():
 
 
 def test_deal_cards():
-    game = Game(game_id="abc123", host_id="host")
+    game = Game(game_id="abc123", host_id="host", catalog=make_catalog(white_count=10))
     game.add_player("p1", "Alice")
-    game.white_cards = [WhiteCard(id=str(i), content=f"Card {i}") for i in range(10)]
+    game.build_decks()
 
     game.settings.cardsPerPlayer = 5
     game.deal_cards()
@@ -29,8 +40,8 @@ def test_deal_cards():
 
 
 def test_select_black_card():
-    game = Game(game_id="abc123", host_id="host")
-    game.black_cards = [BlackCard(id="b1", content="Black question")]
+    game = Game(game_id="abc123", host_id="host", catalog=make_catalog(black_count=1))
+    game.build_decks()
 
     game.select_black_card()
     assert game.current_black_card is not None
@@ -67,13 +78,40 @@ def test_tally_votes():
     bob = next(p for p in game.players if p.id == "p2")
     assert bob.score == 1
 
+
+def test_changed_votes_move_between_counters():
+    game = Game(game_id="abc123", host_id="host")
+    for i in range(4):
+        game.add_player(f"p{i}", f"Player {i}")
+
+    game.submit_vote("p0", "p1")
+    game.submit_vote("p1", "p2")
+    game.submit_vote("p0", "p2")
+    game.submit_vote("p0", "p2")
+
+    assert game.vote_counts == {"p2": 2}
+    assert game.tally_votes() == ["p2"]
+    assert game.player_index["p2"].score == 1
+
+
+def test_player_index_follows_joins_and_leaves():
+    game = Game(game_id="abc123", host_id="p1")
+    game.add_player("p1", "Alice")
+    game.add_player("p2", "Alice")
+    assert game.add_player("p1", "Someone") is game.player_index["p1"]
+    assert len(game.nicknames) == 2
+
+    game.remove_player("p1")
+    assert "p1" not in game.player_index
+    assert game.nicknames == {game.player_index["p2"].nickname}
+    assert game.host_id == "p2"
+
 @pytest.mark.asyncio
 async def test_next_round_starts_over():
-    game = Game(game_id="abc123", host_id="host")
+    game = Game(game_id="abc123", host_id="host", catalog=make_catalog(white_count=20, black_count=1))
     game.add_player("p1", "Alice")
     game.add_player("p2", "Bob")
-    game.white_cards = [WhiteCard(id=str(i), content=f"White {i}") for i in range(20)]
-    game.black_cards = [BlackCard(id="b1", content="Question?")]
+    game.build_decks()
 
     game.deal_cards()
     game.select_black_card()
@@ -96,3 +134,52 @@ async def test_next_round_starts_over():
     assert result is True
     assert game.current_round == 1
     assert game.game_phase == "selection"
+
+
+def test_stale_presentation_timer_does_not_leave_the_lobby():
+    game = Game(game_id="abc123", host_id="host")
+    game.game_phase = "lobby"
+
+    game._transition_to_voting()
+
+    assert game.game_phase == "lobby"
+    assert game.timer_handle is None
+
+
+@pytest.mark.asyncio
+async def test_restart_cancels_the_pending_timer(monkeypatch):
+    from app.api.routes import game as game_routes
+
+    game = Game(game_id="restart1", host_id="host")
+    game.game_phase = "presentation"
+    game.start_timer(60, game._transition_to_voting)
+    handle = game.timer_handle
+    monkeypatch.setitem(game_routes.games, game.id, game)
+    await game_routes.handle_action(game.id, "host", "restart_game", {"action": "restart_game"})
+
+    assert handle.cancelled
+    assert game.timer_handle is None
+    assert game.game_phase == "lobby"
+
+
+@pytest.mark.asyncio
+async def test_only_actions_that_change_the_game_mark_it_dirty(monkeypatch):
+    from app.api.routes import game as game_routes
+
+    game = Game(game_id="dirty1", host_id="host", catalog=make_catalog(white_count=5, black_count=1))
+    game.add_player("host", "Alice")
+    monkeypatch.setitem(game_routes.games, game.id, game)
+    revisions = []
+    for action, data in [
+        ("restart_game", {}),
+        ("update_settings", {"settings": {"votingTime": game.settings.votingTime}}),
+        ("select_card", {"cardId": "nope"}),
+        ("leave_game", {}),
+        ("sync", {}),
+        ("update_settings", {"settings": {"votingTime": 45}}),
+    ]:
+        player_id = "ghost" if action == "leave_game" else "host"
+        await game_routes.handle_action(game.id, player_id, action, {"action": action, **data})
+        revisions.append(game.revision)
+
+    assert revisions == [0, 0, 0, 0, 0, 1]
@@ -0,0 +1,96 @@
+﻿import asyncio
+import pytest
+from app.api.game.history import HistoryStore, HistoryWriter
+from app.api.game.logic import Game
+from tests.test_game_logic import make_catalog
+
+
+class MemoryStore(HistoryStore):
+    def __init__(self, fail=0, delay=0.0):
+        self.games = []
+        self.rounds = []
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    async def write(self, games, rounds):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("database unavailable")
+        self.games.extend(games)
+        self.rounds.extend(rounds)
+
+
+@pytest.mark.asyncio
+async def test_rounds_and_result_are_recorded_without_touching_the_store():
+    store = MemoryStore()
+    writer = HistoryWriter(store, interval=60)
+    game = Game(game_id="g1", host_id="p1", catalog=make_catalog(white_count=20, black_count=3))
+    game.record = writer.record
+    game.add_player("p1", "Alice")
+    game.add_player("p2", "Bob")
+    game.settings.cardsPerPlayer = 1
+    await game.start_game()
+    for player_id in ("p1", "p2"):
+        game.submit_answer(player_id, game.player_cards[player_id][0].id)
+    game._transition_to_voting()
+    game.submit_vote("p1", "p2")
+    game.submit_vote("p2", "p2")
+
+    assert game.game_phase == "results"
+    assert store.calls == 0
+    assert writer.pending == 2
+    [round_row] = writer.rounds
+    assert round_row["round"] == 0
+    assert round_row["winner_ids"] == ["p2"]
+    assert round_row["votes"] == {"p2": 2}
+    assert [(pid, votes, won) for pid, _, votes, won in round_row["plays"]] == [("p1", 0, False), ("p2", 2, True)]
+    [result] = writer.games
+    assert result["match_id"] == round_row["match_id"]
+    assert result["winner_ids"] == ["p2"]
+    assert [(p["player_id"], p["score"], p["rank"]) for p in result["players"]] == [("p2", 1, 1), ("p1", 0, 2)]
+
+    await writer.close()
+    assert len(store.games) == 1 and len(store.rounds) == 1
+    assert writer.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_drops_oldest_rounds_before_results():
+    writer = HistoryWriter(MemoryStore(), max_pending=3)
+    writer.record("game", {"match_id": "m1"})
+    for i in range(4):
+        writer.record("round", {"round": i})
+    assert [row["round"] for row in writer.rounds] == [2, 3]
+    assert writer.dropped == {"game": 0, "round": 2}
+
+    writer.record("game", {"match_id": "m2"})
+    writer.record("game", {"match_id": "m3"})
+    writer.record("game", {"match_id": "m4"})
+    assert [row["match_id"] for row in writer.games] == ["m2", "m3", "m4"]
+    assert writer.dropped == {"game": 1, "round": 4}
+
+
+@pytest.mark.asyncio
+async def test_failed_batches_are_retried_in_order():
+    store = MemoryStore(fail=1)
+    writer = HistoryWriter(store, batch_size=2, interval=0.01)
+    writer.start()
+    for i in range(3):
+        writer.record("round", {"round": i})
+    await asyncio.sleep(0.1)
+    await writer.close()
+
+    assert [row["round"] for row in store.rounds] == [0, 1, 2]
+    assert writer.failures == 1
+    assert writer.stats()["written"] == {"game": 0, "round": 3}
+
+
+@pytest.mark.asyncio
+async def test_close_gives_up_on_a_stuck_database():
+    writer = HistoryWriter(MemoryStore(delay=5), interval=60)
+    writer.record("round", {"round": 0})
+    await writer.close(timeout=0.05)
+    assert writer.pending == 1
@@ -0,0 +1,115 @@
+﻿import asyncio
+import random
+import pytest
+from app.api.game.backplane import LocalBackplane
+from app.api.game.cluster import Cluster
+from app.api.game.leaderboard import Board, Leaderboards, PlayerStats, SortedKeys, periods_of, stat_rows
+from app.api.game.manager import ConnectionManager
+
+FINISHED = 1790000000.0
+
+
+def result(match_id, *players):
+    return {
+        "match_id": match_id,
+        "finished_at": FINISHED,
+        "players": [
+            {"player_id": pid, "nickname": pid.upper(), "score": score, "rank": rank}
+            for pid, score, rank in players
+        ],
+    }
+
+
+def test_sorted_keys_match_a_plain_sorted_list():
+    rng = random.Random(7)
+    keys, expected = SortedKeys(load=4), []
+    for _ in range(500):
+        key = (rng.randint(-20, 0), rng.randint(0, 50), str(rng.random()))
+        if expected and rng.random() < 0.3:
+            gone = expected.pop(rng.randrange(len(expected)))
+            keys.remove(gone)
+        keys.add(key)
+        expected.append(key)
+        expected.sort()
+    assert len(keys) == len(expected)
+    assert keys.slice(0, len(expected)) == expected
+    assert keys.slice(37, 10) == expected[37:47]
+    for key in expected[::17]:
+        assert keys.index(key) == expected.index(key)
+
+
+def test_board_ranks_by_metric_and_hides_win_rate_below_min_games():
+    board = Board("all", min_games=2)
+    board.apply("a", "Ann", 1, 1, 3)
+    board.apply("b", "Bob", 1, 0, 1)
+    board.apply("b", "Bob", 1, 1, 2)
+    board.apply("c", "Cid", 3, 1, 4)
+
+    assert [e["playerId"] for e in board.top("wins", 10)] == ["a", "b", "c"]
+    assert [e["playerId"] for e in board.top("games", 10)] == ["c", "b", "a"]
+    assert [e["playerId"] for e in board.top("winRate", 10)] == ["b", "c"]
+    assert board.player("c", "wins")["rank"] == 3
+    assert board.player("a", "winRate")["rank"] is None
+    assert board.top("wins", 1, offset=1)[0] == {
+        "rank": 2, "playerId": "b", "nickname": "Bob", "games": 2, "wins": 1, "winRate": 0.5, "points": 3,
+    }
+
+
+def test_finished_games_update_every_current_period():
+    boards = Leaderboards(min_games=1)
+    boards.record_game(result("m1", ("p1", 3, 1), ("p2", 1, 2)))
+    boards.record_game(result("m2", ("p2", 2, 1), ("p1", 2, 1)))
+
+    assert sorted(boards.boards) == sorted(periods_of(FINISHED))
+    for board in boards.boards.values():
+        assert board.player("p1", "wins")["wins"] == 2
+        assert board.player("p2", "wins")["rank"] == 2
+    assert boards.boards["all"].by_nickname["P2"] == "p2"
+
+
+def test_stat_rows_sum_a_batch_per_period_and_player():
+    rows = stat_rows([result("m1", ("p1", 3, 1), ("p2", 1, 2)), result("m2", ("p1", 1, 2), ("p2", 2, 1))])
+    assert len(rows) == 6
+    p1_all = next(r for r in rows if r["period"] == "all" and r["player_id"] == "p1")
+    assert (p1_all["games"], p1_all["wins"], p1_all["points"]) == (2, 1, 4)
+
+
+@pytest.mark.asyncio
+async def test_refresh_replaces_drifted_boards_with_the_stored_totals(monkeypatch):
+    boards = Leaderboards(min_games=1)
+    boards.record_game(result("m1", ("p1", 3, 1), ("p2", 1, 2)))
+
+    async def read(period):
+        board = Board(period, 1)
+        board.load([PlayerStats("p1", "P1", 4, 3, 9), PlayerStats("p3", "P3", 2, 2, 5)])
+        return board
+
+    monkeypatch.setattr(boards, "_read", read)
+    await boards.refresh(FINISHED)
+
+    assert boards.refreshes == 1
+    board = boards.boards["all"]
+    assert board.player("p1", "wins")["wins"] == 3
+    assert board.player("p2", "wins") is None
+    assert [e["playerId"] for e in board.top("wins", 10)] == ["p1", "p3"]
+
+
+@pytest.mark.asyncio
+async def test_finished_games_reach_the_other_workers_boards():
+    backplane = LocalBackplane()
+    nodes = []
+    for _ in range(2):
+        cluster = Cluster(ConnectionManager(), backplane, worker_count=2)
+        boards = Leaderboards(min_games=1)
+        cluster.result_handler = boards.record_game
+        await cluster.start()
+        nodes.append((cluster, boards))
+
+    (first, first_boards), (second, second_boards) = nodes
+    row = result("m1", ("p1", 3, 1), ("p2", 1, 2))
+    first_boards.record_game(row)
+    first.share_result(row)
+    await asyncio.sleep(0.01)
+
+    assert first_boards.recorded == second_boards.recorded == 1
+    assert second_boards.boards["all"].player("p1", "wins")["wins"] == 1
@@ -0,0 +1,78 @@
+﻿import pytest
+from starlette.testclient import TestClient
+from app.api.game.lifecycle import GameLifecycle
+from app.api.game.logic import Game
+from app.api.game.manager import ConnectionManager
+from app.main import app
+from tests.test_connection_queues import FakeWebSocket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_lifecycle(**kwargs):
+    clock = Clock()
+    games = {}
+    manager = ConnectionManager()
+    lifecycle = GameLifecycle(games, manager, interval=0, clock=clock, **kwargs)
+    return lifecycle, games, manager, clock
+
+
+def add_game(lifecycle, games, game_id, phase="lobby"):
+    game = Game(game_id=game_id, host_id="p1")
+    game.game_phase = phase
+    games[game_id] = game
+    lifecycle.touch(game_id)
+    return game
+
+
+@pytest.mark.asyncio
+async def test_finished_and_abandoned_games_expire():
+    lifecycle, games, manager, clock = make_lifecycle(finished_ttl=60, abandoned_ttl=120, idle_ttl=1000)
+    add_game(lifecycle, games, "done", phase="results")
+    add_game(lifecycle, games, "empty")
+    busy = add_game(lifecycle, games, "busy", phase="selection")
+    await manager.connect(FakeWebSocket(), "busy", "p1")
+
+    clock.now += 90
+    assert lifecycle.sweep() == ["done"]
+
+    clock.now += 90
+    busy.mark_dirty()
+    assert lifecycle.sweep() == ["empty"]
+    assert list(games) == ["busy"]
+    assert lifecycle.stats()["evicted"] == {"finished": 1, "abandoned": 1}
+
+    clock.now += 1001
+    assert lifecycle.sweep() == ["busy"]
+
+
+@pytest.mark.asyncio
+async def test_cap_evicts_least_recently_active_idle_game():
+    lifecycle, games, manager, clock = make_lifecycle(max_games=2)
+    add_game(lifecycle, games, "old")
+    clock.now += 10
+    add_game(lifecycle, games, "new")
+
+    assert lifecycle.admit() is True
+    assert list(games) == ["new"]
+    assert lifecycle.stats()["evicted"] == {"capacity": 1}
+
+    add_game(lifecycle, games, "playing")
+    await manager.connect(FakeWebSocket(), "playing", "p1")
+    await manager.connect(FakeWebSocket(), "new", "p1")
+    assert lifecycle.admit() is False
+    assert lifecycle.rejected == 1
+
+
+def test_joining_an_unknown_game_is_an_error():
+    client = TestClient(app)
+    with client.websocket_connect("/ws/nogame/lost") as ws:
+        ws.send_json({"action": "join_game", "gameId": "missing1", "nickname": "Lost"})
+        message = ws.receive_json()
+    assert message == {"type": "error", "message": "Game not found"}
@@ -0,0 +1,52 @@
+﻿import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from starlette.testclient import TestClient
+from app.api.core.metrics import MetricsRegistry, db_query_seconds, instrument_engine
+from app.main import app
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("demo_seconds", "Demo.", ["kind"], buckets=(0.1, 1.0))
+    counter = registry.counter("demo_total", "Demo.", ["kind"])
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, "a")
+    counter.inc("a")
+    counter.inc("a", amount=2)
+
+    text = registry.render()
+    assert 'demo_seconds_bucket{kind="a",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{kind="a",le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{kind="a",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{kind="a"} 3' in text
+    assert 'demo_total{kind="a"} 3' in text
+    assert "# TYPE demo_seconds histogram" in text
+
+
+def test_metrics_endpoint_reports_actions_and_games():
+    client = TestClient(app)
+    with client.websocket_connect("/ws/nogame/metrics-host") as ws:
+        ws.send_json({"action": "create_game", "nickname": "Alice"})
+        ws.receive_json()
+        text = client.get("/metrics").text
+
+    assert 'absurdly_actions_total{action="create_game"}' in text
+    assert 'absurdly_action_seconds_count{action="create_game"}' in text
+    assert "absurdly_broadcast_bytes_count" in text
+    assert 'absurdly_games{phase="lobby"}' in text
+    assert 'absurdly_connections{tier="player"}' in text
+
+
+
+def test_failed_statement_does_not_skew_the_next_timing():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.connect() as conn:
+        observed = db_query_seconds.labels().count
+        with pytest.raises(OperationalError):
+            conn.execute(text("SELECT * FROM missing_table"))
+        assert conn.info["query_started"] == []
+        conn.execute(text("SELECT 1"))
+        assert conn.info["query_started"] == []
+        assert db_query_seconds.labels().count == observed + 1
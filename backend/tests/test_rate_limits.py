@@ -0,0 +1,80 @@
+﻿from starlette.testclient import TestClient
+
+from app.api.game.ratelimit import ConnectionLimits, RateLimiter, parse_budgets
+from app.api.routes.game import limiter
+from app.main import app
+from tests.test_ws_routes import receive_until
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_budgets_are_parsed_with_a_default():
+    budgets = parse_budgets("vote=2/4, sync=1")
+    assert budgets["vote"] == (2.0, 4.0)
+    assert budgets["sync"] == (1.0, 1.0)
+    assert "default" in budgets
+
+
+def test_connection_buckets_refill_per_action():
+    clock = FakeClock()
+    limits = ConnectionLimits()
+    rl = RateLimiter({"default": (10, 10), "vote": (1, 2)}, game_rate=100, game_burst=100, clock=clock)
+
+    assert [rl.allow_connection(limits, "vote", "vote") for _ in range(3)] == [True, True, False]
+    assert rl.allow_connection(limits, "sync", "sync") is True
+    clock.now += 1
+    assert rl.allow_connection(limits, "vote", "vote") is True
+    assert rl.allow_connection(limits, "vote", "vote") is False
+    assert limits.throttled == 2
+    assert rl.stats()["throttled"] == {"connection": 2, "game": 0}
+
+
+def test_game_bucket_is_shared_and_forgotten_on_eviction():
+    clock = FakeClock()
+    rl = RateLimiter({"default": (10, 10)}, game_rate=1, game_burst=2, clock=clock)
+
+    assert [rl.allow_game("g1", "vote") for _ in range(3)] == [True, True, False]
+    assert rl.allow_game("g2", "vote") is True
+    rl.forget_game("g1")
+    assert rl.allow_game("g1", "vote") is True
+
+
+def test_batched_actions_share_one_broadcast():
+    client = TestClient(app)
+    with client.websocket_connect("/ws/nogame/host") as host:
+        host.send_json({"action": "create_game", "nickname": "Alice"})
+        receive_until(host, "game_update")
+
+        host.send_json({"action": "batch", "actions": [
+            {"action": "update_settings", "settings": {"votingTime": 30}},
+            {"action": "update_settings", "settings": {"selectionTime": 20}},
+        ]})
+        patch = receive_until(host, "state_patch")
+        assert patch["changes"]["settings"]["votingTime"] == 30
+        assert patch["changes"]["settings"]["selectionTime"] == 20
+
+        rejected = limiter.rejected.get("batch_action", 0)
+        host.send_json({"action": "batch", "actions": [{"action": "leave_game"}]})
+        assert "in-game actions" in receive_until(host, "error")["message"]
+        assert limiter.rejected["batch_action"] == rejected + 1
+
+
+def test_spam_is_throttled_with_a_single_error():
+    client = TestClient(app)
+    with client.websocket_connect("/ws/nogame/host") as host:
+        host.send_json({"action": "create_game", "nickname": "Alice"})
+        receive_until(host, "game_update")
+
+        throttled = limiter.throttled["connection"]
+        for _ in range(10):
+            host.send_json({"action": "update_settings", "settings": {"votingTime": 40}})
+        assert receive_until(host, "error")["message"] == "Too many actions, slow down"
+        host.send_json({"action": "sync"})
+        receive_until(host, "game_update")
+        assert limiter.throttled["connection"] >= throttled + 5
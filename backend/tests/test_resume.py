@@ -0,0 +1,71 @@
+﻿import json
+
+from starlette.testclient import TestClient
+
+from app.api.game.state import StateTracker, shared_state
+from app.api.routes.game import manager
+from app.main import app
+from tests.test_state_protocol import broadcast, make_game
+from tests.test_ws_routes import receive_until
+
+
+def test_resume_replays_missed_versions_as_one_patch():
+    game = make_game()
+    tracker = StateTracker(history=4)
+    token = broadcast(tracker, game, "p1")["resumeToken"]
+
+    game.current_round = 1
+    tracker.update(shared_state(game))
+    game.settings = game.settings.model_copy(update={"votingTime": 30})
+    tracker.update(shared_state(game))
+
+    patch = json.loads(tracker.resume_frame(game, "p1", token, 1))
+    assert patch["type"] == "state_patch"
+    assert (patch["baseVersion"], patch["version"]) == (1, 3)
+    assert patch["changes"]["currentRound"] == 1
+    assert patch["changes"]["settings"]["votingTime"] == 30
+    assert patch["changes"]["isHost"] is True
+
+    assert tracker.resume_frame(game, "p1", "stolen", 1) is None
+    assert tracker.resume_frame(game, "p2", token, 1) is None
+    # Up to date already: only the personal fields.
+    assert set(json.loads(tracker.resume_frame(game, "p1", token, 3))["changes"]) == {
+        "playerId", "isHost", "whiteCards", "votedPlayerId",
+    }
+
+
+def test_gap_larger_than_the_ring_needs_a_snapshot():
+    game = make_game()
+    tracker = StateTracker(history=2)
+    token = broadcast(tracker, game, "p1")["resumeToken"]
+    for round_number in range(1, 4):
+        game.current_round = round_number
+        tracker.update(shared_state(game))
+
+    assert tracker.version == 4
+    assert not tracker.can_replay(1)
+    assert tracker.resume_frame(game, "p1", token, 1) is None
+    assert tracker.resume_frame(game, "p1", token, 2) is not None
+
+
+def test_reconnect_with_token_gets_only_missed_updates():
+    client = TestClient(app)
+    with client.websocket_connect("/ws/nogame/host") as host:
+        host.send_json({"action": "create_game", "nickname": "Alice"})
+        snapshot = receive_until(host, "game_update")
+        game_id, token, version = snapshot["gameId"], snapshot["resumeToken"], snapshot["version"]
+
+    replayed = manager.resumed["replayed"]
+    with client.websocket_connect(f"/ws/{game_id}/guest") as guest:
+        guest.send_json({"action": "join_game", "gameId": game_id, "nickname": "Bob"})
+        receive_until(guest, "game_update")
+
+        with client.websocket_connect(f"/ws/{game_id}/host?resume={token}&version={version}") as host:
+            patch = host.receive_json()
+            assert patch["type"] == "state_patch"
+            assert patch["baseVersion"] == version
+            assert [p["nickname"] for p in patch["changes"]["players"]] == ["Alice", "Bob"]
+        assert manager.resumed["replayed"] == replayed + 1
+
+        with client.websocket_connect(f"/ws/{game_id}/host?resume=wrong&version={version}") as host:
+            assert receive_until(host, "game_update")["players"][1]["nickname"] == "Bob"
@@ -0,0 +1,72 @@
+﻿import asyncio
+import pytest
+from app.api.game.scheduler import TimerScheduler, scheduler
+from app.api.game.logic import Game
+from app.api.game.catalog import CardCatalog
+from app.api.db.models import WhiteCard, BlackCard
+
+
+@pytest.mark.asyncio
+async def test_fires_in_deadline_order():
+    timers = TimerScheduler()
+    fired = []
+    now = timers.clock()
+    timers.call_at(now + 0.03, lambda: fired.append("late"))
+    timers.call_at(now + 0.01, lambda: fired.append("early"))
+
+    await asyncio.sleep(0.06)
+    assert fired == ["early", "late"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_timer_does_not_fire():
+    timers = TimerScheduler()
+    fired = []
+    handle = timers.call_later(0.01, lambda: fired.append("x"))
+    handle.cancel()
+
+    await asyncio.sleep(0.03)
+    assert fired == []
+
+
+@pytest.mark.asyncio
+async def test_async_callbacks_are_awaited():
+    timers = TimerScheduler()
+    fired = []
+
+    async def callback():
+        fired.append("async")
+
+    timers.call_later(0, callback)
+    await asyncio.sleep(0.02)
+    assert fired == ["async"]
+
+
+@pytest.mark.asyncio
+async def test_game_phases_follow_deadlines(monkeypatch):
+    monkeypatch.setattr("app.api.game.logic.app_settings.PRESENTATION_SECONDS", 0.02)
+    catalog = CardCatalog()
+    for i in range(20):
+        catalog.put("white", WhiteCard(id=str(i), content=f"White {i}"))
+    catalog.put("black", BlackCard(id="b1", content="Question?"))
+    catalog.loaded = True
+
+    game = Game(game_id="abc123", host_id="p1", catalog=catalog)
+    game.add_player("p1", "Alice")
+    game.add_player("p2", "Bob")
+    game.settings.selectionTime = 0
+    await game.start_game()
+    assert game.deadline is not None
+
+    await asyncio.sleep(0.01)
+    assert game.game_phase == "presentation"
+    assert len(game.player_answers) == 2
+
+    await asyncio.sleep(0.04)
+    assert game.game_phase == "voting"
+    assert game.timer_value == game.settings.votingTime
+
+    game.cancel_timer()
+    assert game.deadline is None
+    assert game.timer_value == 0
+    assert scheduler.fired >= 2
@@ -0,0 +1,102 @@
+﻿import asyncio
+import time
+import pytest
+from starlette.testclient import TestClient
+from app.api.game.encoding import dumps, loads
+from app.api.game.logic import Game
+from app.api.game.snapshots import FileSnapshotStore, GameSnapshotter
+from app.api.routes import game as game_routes
+from app.main import app
+from tests.test_game_logic import make_catalog
+
+
+def started_game(catalog):
+    game = Game(game_id="g1", host_id="p1", catalog=catalog)
+    game.add_player("p1", "Alice")
+    game.add_player("p2", "Bob")
+    game.build_decks()
+    game.game_phase = "selection"
+    game.current_round = 1
+    game.deal_cards()
+    game.select_black_card()
+    return game
+
+
+def test_snapshot_round_trip_keeps_in_play_cards_out_of_the_deck():
+    catalog = make_catalog(white_count=20, black_count=3)
+    game = started_game(catalog)
+    game.players[1].score = 2
+    game.submit_answer("p1", game.player_cards["p1"][0].id)
+
+    data = dumps(game.to_snapshot())
+    assert len(data) < 1000
+    restored = Game.from_snapshot(loads(data), catalog)
+
+    assert restored.game_phase == "selection"
+    assert [(p.id, p.score) for p in restored.players] == [("p1", 0), ("p2", 2)]
+    assert restored.player_cards == game.player_cards
+    assert restored.player_answers == game.player_answers
+    assert restored.current_black_card == game.current_black_card
+
+    in_play = {c.id for hand in restored.player_cards.values() for c in hand}
+    in_play |= {a.card.id for a in restored.player_answers}
+    drawn = [catalog.white.get(restored.white_deck.draw()).id for _ in restored.white_deck.remaining()]
+    assert not in_play & set(drawn)
+    assert len(drawn) == 20 - len(in_play)
+
+
+@pytest.mark.asyncio
+async def test_restored_game_resumes_its_timer(tmp_path):
+    catalog = make_catalog(white_count=20, black_count=3)
+    game = started_game(catalog)
+    game.deadline = time.time() + 0.05
+    store = FileSnapshotStore(str(tmp_path))
+    writer = GameSnapshotter({"g1": game}, store, catalog=catalog)
+    assert await writer.checkpoint() == 1
+    assert await writer.checkpoint() == 0
+
+    games = {}
+    reader = GameSnapshotter(games, store, catalog=catalog)
+    assert await reader.restore(lambda g: games.__setitem__(g.id, g)) == 1
+    restored = games["g1"]
+    assert restored.game_phase == "selection"
+
+    await asyncio.sleep(0.1)
+    assert restored.game_phase == "presentation"
+    restored.cancel_timer()
+
+
+@pytest.mark.asyncio
+async def test_only_changed_games_are_written_and_removed_ones_deleted(tmp_path):
+    catalog = make_catalog(white_count=20, black_count=3)
+    games = {"g1": started_game(catalog)}
+    store = FileSnapshotStore(str(tmp_path))
+    snapshotter = GameSnapshotter(games, store, catalog=catalog)
+    await snapshotter.checkpoint()
+
+    games["g1"].mark_dirty()
+    assert await snapshotter.checkpoint() == 1
+
+    del games["g1"]
+    await snapshotter.drain()
+    assert snapshotter.draining
+    assert await store.load_all() == {}
+
+
+def test_drain_requires_the_admin_token(monkeypatch):
+    drained = []
+
+    async def drain():
+        drained.append(True)
+
+    monkeypatch.setattr(game_routes.snapshotter, "drain", drain)
+    client = TestClient(app)
+    assert client.post("/admin/drain").status_code == 403
+
+    monkeypatch.setattr("app.api.routes.game.settings.ADMIN_TOKEN", "s3cret")
+    assert client.post("/admin/drain").status_code == 401
+    assert client.post("/admin/drain", headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert drained == []
+
+    assert client.post("/admin/drain", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+    assert drained == [True]
@@ -0,0 +1,106 @@
+﻿import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.api.core import startup as startup_module
+from app.api.core.startup import SchemaError, Startup, migration_heads, prepare_schema, startup
+from app.main import app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_steps_run_concurrently_and_are_timed():
+    clock = FakeClock()
+    boot = Startup(clock)
+    order = []
+
+    async def step(name, wait):
+        order.append(name)
+        await asyncio.sleep(wait)
+        clock.now += 1
+
+    asyncio.run(boot.run(catalog=step("catalog", 0.02), pool=step("pool", 0.01)))
+    assert order == ["catalog", "pool"]
+    assert boot.phases == {"catalog": 2.0, "pool": 1.0}
+    assert not boot.ready
+
+    boot.mark_ready()
+    assert boot.ready
+    assert boot.time_to_ready == 2.0
+    boot.stopping = True
+    assert not boot.ready
+
+
+def test_schema_error_wins_over_other_failures():
+    async def broken():
+        raise OSError("relation does not exist")
+
+    async def behind():
+        raise SchemaError("run alembic upgrade head")
+
+    with pytest.raises(SchemaError):
+        asyncio.run(Startup().run(catalog=broken(), schema=behind()))
+
+
+def test_schema_check_compares_revisions(monkeypatch):
+    async def revisions(engine):
+        return {"0000"}
+
+    monkeypatch.setattr(startup_module, "database_revisions", revisions)
+    with pytest.raises(SchemaError):
+        asyncio.run(prepare_schema(None, "check"))
+    asyncio.run(prepare_schema(None, "warn"))
+
+    async def current(engine):
+        return migration_heads()
+
+    monkeypatch.setattr(startup_module, "database_revisions", current)
+    asyncio.run(prepare_schema(None, "check"))
+
+
+def test_ready_only_after_warm_up(monkeypatch):
+    client = TestClient(app)
+    assert client.get("/health/live").json() == {"status": "alive"}
+
+    monkeypatch.setattr(startup, "ready_at", None)
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "starting"
+
+    monkeypatch.setattr(startup, "ready_at", startup.began + 1.5)
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["timeToReadyMs"] == 1500.0
+
+
+@pytest.mark.asyncio
+async def test_schema_is_ready_before_the_warm_up_reads_it(monkeypatch):
+    import app.main as main
+
+    events = []
+
+    async def prepare(engine, mode):
+        await asyncio.sleep(0.02)
+        events.append("schema")
+
+    def reader(name):
+        async def read(*args):
+            events.append(name)
+        return read
+
+    monkeypatch.setattr(main, "prepare_schema", prepare)
+    monkeypatch.setattr(main, "warm_pool", reader("pool"))
+    monkeypatch.setattr(main, "warm_catalog", reader("catalog"))
+    monkeypatch.setattr(main.leaderboards, "load", reader("leaderboards"))
+    monkeypatch.setattr(main, "startup", Startup())
+    await main.warm_up()
+
+    assert events[0] == "schema"
+    assert sorted(events[1:]) == ["catalog", "leaderboards", "pool"]
@@ -0,0 +1,104 @@
+﻿import json
+from app.api.game.logic import Game
+from app.api.game.catalog import CardCatalog
+from app.api.game.state import StateTracker, shared_state
+from app.api.db.models import WhiteCard
+
+
+def make_game():
+    catalog = CardCatalog()
+    catalog.put("white", WhiteCard(id="w1", content="Answer"))
+    game = Game(game_id="abc123", host_id="p1", catalog=catalog)
+    game.add_player("p1", "Alice")
+    game.add_player("p2", "Bob")
+    return game
+
+
+def broadcast(tracker, game, player_id):
+    tracker.update(shared_state(game))
+    frame = tracker.frame_for(game, player_id)
+    return json.loads(frame) if frame is not None else None
+
+
+def test_first_message_is_full_snapshot():
+    game = make_game()
+    tracker = StateTracker()
+
+    message = broadcast(tracker, game, "p1")
+
+    assert message["type"] == "game_update"
+    assert message["version"] == 1
+    assert message["isHost"] is True
+    assert len(message["players"]) == 2
+    assert message["selectedCardId"] is None
+    assert "serverTime" in message
+
+
+def test_patch_only_carries_changed_keys():
+    game = make_game()
+    tracker = StateTracker()
+    broadcast(tracker, game, "p1")
+
+    game.add_player("p3", "Carol")
+    message = broadcast(tracker, game, "p1")
+
+    assert message["type"] == "state_patch"
+    assert message["baseVersion"] == 1
+    assert message["version"] == 2
+    assert list(message["changes"]) == ["players"]
+
+
+def test_unchanged_state_sends_nothing():
+    game = make_game()
+    tracker = StateTracker()
+    broadcast(tracker, game, "p1")
+
+    assert broadcast(tracker, game, "p1") is None
+
+
+def test_personal_changes_are_patched_without_new_version():
+    game = make_game()
+    game.game_phase = "selection"
+    tracker = StateTracker()
+    broadcast(tracker, game, "p1")
+    broadcast(tracker, game, "p2")
+
+    game.player_cards["p2"] = [game.catalog.white.find("w1")]
+    tracker.update(shared_state(game))
+
+    assert tracker.frame_for(game, "p1") is None
+    message = json.loads(tracker.frame_for(game, "p2"))
+    assert message["version"] == message["baseVersion"]
+    assert message["changes"] == {"whiteCards": [{"id": "w1", "content": "Answer"}]}
+
+
+def test_card_fragments_are_encoded_once():
+    game = make_game()
+    card = game.catalog.white.find("w1")
+
+    first = game.catalog.white.fragment(card)
+    assert game.catalog.white.fragment(card) is first
+
+    game.catalog.put("white", WhiteCard(id="w1", content="Edited"))
+    assert json.loads(game.catalog.white.fragment(game.catalog.white.find("w1")))["content"] == "Edited"
+
+
+def test_deadline_is_sent_once_instead_of_ticking():
+    game = make_game()
+    tracker = StateTracker()
+    broadcast(tracker, game, "p1")
+
+    game.deadline = 1_700_000_015.5
+    message = broadcast(tracker, game, "p1")
+    assert message["changes"] == {"deadline": 1_700_000_015_500}
+
+    assert broadcast(tracker, game, "p1") is None
+
+
+def test_forgotten_player_gets_snapshot_again():
+    game = make_game()
+    tracker = StateTracker()
+    broadcast(tracker, game, "p1")
+
+    tracker.forget("p1")
+    assert broadcast(tracker, game, "p1")["type"] == "game_update"
@@ -24,9 +24,4 @@ async def test_create_game_websocket():
         assert message["playerId"] == player_id
         assert message["isHost"] is True
         assert "gameId" in message
-
-        response = await websocket.recv()
-        nav = json.loads(response)
-
-        assert nav["type"] == "navigate"
-        assert nav["route"].startswith("/lobby/")
+        assert message["route"].startswith("/lobby/")
@@ -0,0 +1,19 @@
+﻿import pytest
+from benchmarks.ws_load import compare, run_suite
+
+
+@pytest.mark.asyncio
+async def test_bots_play_full_games_in_process():
+    result = await run_suite([2], players=3, rounds=2, timeout=10)
+    step = result["runs"][0]
+
+    assert step["completedGames"] == 2
+    assert step["actions"] == 2 * (3 + 2 + 2 * 3 * 2)
+    assert step["framesReceived"] > step["actions"]
+    assert step["latencyMs"]["p50"] <= step["latencyMs"]["p99"]
+
+
+def test_compare_flags_slower_steps():
+    before = {"runs": [{"games": 10, "latencyMs": {"p99": 10.0}, "cpuPerGameMs": 2.0}]}
+    after = {"runs": [{"games": 10, "latencyMs": {"p99": 11.0}, "cpuPerGameMs": 3.0}]}
+    assert compare(after, before, 0.2) == ["10 games: cpu per game 2.0 -> 3.0"]
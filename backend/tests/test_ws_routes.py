@@ -0,0 +1,30 @@
+from starlette.testclient import TestClient
+from app.main import app
+
+
+def receive_until(ws, message_type):
+    while True:
+        message = ws.receive_json()
+        if message["type"] == message_type:
+            return message
+
+
+def test_create_and_join_game_in_process():
+    client = TestClient(app)
+    with client.websocket_connect("/ws/nogame/host") as host:
+        host.send_json({"action": "create_game", "nickname": "Alice"})
+        snapshot = host.receive_json()
+        assert snapshot["type"] == "game_update"
+        assert snapshot["isHost"] is True
+        game_id = snapshot["gameId"]
+        assert snapshot["route"] == f"/lobby/{game_id}"
+
+        with client.websocket_connect(f"/ws/{game_id}/guest") as guest:
+            guest.send_json({"action": "join_game", "gameId": game_id, "nickname": "Bob"})
+            state = receive_until(guest, "game_update")
+            assert state["isHost"] is False
+            assert [p["nickname"] for p in state["players"]] == ["Alice", "Bob"]
+
+            patch = receive_until(host, "state_patch")
+            assert patch["baseVersion"] == snapshot["version"]
+            assert list(patch["changes"]) == ["players"]
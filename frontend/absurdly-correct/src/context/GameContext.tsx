@@ -3,6 +3,7 @@ import React, {
   useContext,
   useState,
   useRef,
+  useEffect,
   ReactNode,
 } from "react";
 import { useNavigate } from "react-router-dom";
@@ -64,6 +65,8 @@ interface GameState {
   votedPlayerId: string | null;
   votes: Record<string, number>;
   answersCount?: number;
+  version: number;
+  deadline: number | null;
 }
 
 // --------------------------------
@@ -109,6 +112,8 @@ const initialState: GameState = {
   selectedCardId: null,
   votedPlayerId: null,
   votes: {},
+  version: 0,
+  deadline: null,
 };
 
 const GameContext = createContext<GameContextProps | undefined>(undefined);
@@ -118,16 +123,36 @@ function hasOwn(obj: unknown, prop: string): boolean {
   return Object.prototype.hasOwnProperty.call(obj, prop);
 }
 
+// Serwer wysyła termin (deadline) zamiast tykać co sekundę - odliczamy lokalnie
+function secondsUntil(deadline: number | null, clockOffset: number): number {
+  if (deadline === null) return 0;
+  return Math.max(0, Math.ceil((deadline - (Date.now() + clockOffset)) / 1000));
+}
+
 export const GameProvider: React.FC<{ children: ReactNode }> = ({ children }) => {
   const [gameState, setGameState] = useState<GameState>(initialState);
   const navigate = useNavigate();
   const [playerId] = useState(() => crypto.randomUUID().slice(0, 8));
   const wsRef = useRef<WebSocket | null>(null);
-
-  const openWebsocket = (gameId: string): Promise<void> => {
+  const versionRef = useRef(0);
+  const resumeRef = useRef<{ gameId: string; token: string } | null>(null);
+  const clockOffsetRef = useRef(0);
+
+  useEffect(() => {
+    const interval = setInterval(() => {
+      setGameState((prev) => {
+        if (prev.deadline === null) return prev;
+        const timeLeft = secondsUntil(prev.deadline, clockOffsetRef.current);
+        return timeLeft === prev.timeLeft ? prev : { ...prev, timeLeft };
+      });
+    }, 250);
+    return () => clearInterval(interval);
+  }, []);
+
+  const openWebsocket = (gameId: string, query = ""): Promise<void> => {
     return new Promise((resolve, reject) => {
       const base = import.meta.env.VITE_API_URL || "http://localhost:8000";
-      const wsUrl = base.replace(/^http/i, "ws") + `/ws/${gameId}/${playerId}`;
+      const wsUrl = base.replace(/^http/i, "ws") + `/ws/${gameId}/${playerId}${query}`;
       console.log("Opening WebSocket to", wsUrl);
       const newWs = new WebSocket(wsUrl);
       wsRef.current = newWs;
@@ -153,10 +178,42 @@ export const GameProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
 
       newWs.onclose = () => {
         console.log("WS closed");
+        // Unexpected drop: reconnect with the resume token so the server
+        // only sends what was missed. The jitter spreads out reconnects
+        // after a network blip.
+        if (wsRef.current === newWs && resumeRef.current) {
+          setTimeout(resumeSession, 500 + Math.random() * 1500);
+        }
       };
     });
   };
 
+  const resumeSession = () => {
+    const session = resumeRef.current;
+    if (!session) return;
+    const query = `?resume=${encodeURIComponent(session.token)}&version=${versionRef.current}`;
+    openWebsocket(session.gameId, query).catch(() => {
+      console.warn("Resume failed, retrying");
+    });
+  };
+
+  const endSession = (message: string) => {
+    // The server no longer has the game (evicted after it ended or sat
+    // idle): stop resuming it and go back to the start page.
+    resumeRef.current = null;
+    versionRef.current = 0;
+    wsRef.current?.close();
+    setGameState((prev) => ({ ...initialState, nickname: prev.nickname }));
+    navigate("/");
+    alert(message);
+  };
+
+  const followRoute = (route: unknown) => {
+    if (typeof route === "string" && route && window.location.pathname !== route) {
+      navigate(route);
+    }
+  };
+
   const handleIncomingMessage = (rawData: unknown) => {
     if (!rawData || typeof rawData !== "object") return;
     const data = rawData as Record<string, unknown>;
@@ -164,6 +221,16 @@ export const GameProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
     console.log("Got message from server:", data);
 
     if (type === "game_update") {
+      if (hasOwn(data, "serverTime")) {
+        clockOffsetRef.current = (data.serverTime as number) - Date.now();
+      }
+      if (hasOwn(data, "version")) {
+        versionRef.current = data.version as number;
+      }
+      if (hasOwn(data, "resumeToken") && hasOwn(data, "gameId")) {
+        resumeRef.current = { gameId: data.gameId as string, token: data.resumeToken as string };
+      }
+      const deadline = hasOwn(data, "deadline") ? (data.deadline as number | null) : null;
       setGameState((prev) => ({
         ...prev,
         gameId: hasOwn(data, "gameId") ? (data.gameId as string) : prev.gameId,
@@ -179,21 +246,46 @@ export const GameProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
         currentPresentationIndex: hasOwn(data, "currentPresentationIndex")
             ? (data.currentPresentationIndex as number)
             : 0,
-        timeLeft: hasOwn(data, "timeLeft") ? (data.timeLeft as number) : 0,
+        timeLeft: deadline !== null
+            ? secondsUntil(deadline, clockOffsetRef.current)
+            : hasOwn(data, "timeLeft") ? (data.timeLeft as number) : 0,
         winners: hasOwn(data, "winners") ? (data.winners as PlayerScore[]) : [],
         whiteCards: hasOwn(data, "whiteCards") ? (data.whiteCards as WhiteCard[]) : [],
         votedPlayerId: hasOwn(data, "votedPlayerId") ? (data.votedPlayerId as string | null) : null,
         votes: hasOwn(data, "votes") ? (data.votes as Record<string, number>) : {},
         answersCount: hasOwn(data, "answersCount") ? (data.answersCount as number) : 0,
         selectedCardId: prev.selectedCardId,
+        version: hasOwn(data, "version") ? (data.version as number) : prev.version,
+        deadline,
       }));
+      followRoute(data.route);
+    } else if (type === "state_patch") {
+      if (data.baseVersion !== versionRef.current) {
+        sendMessage({ action: "sync" });
+        return;
+      }
+      versionRef.current = data.version as number;
+      const changes = data.changes as Partial<GameState>;
+      setGameState((prev) => {
+        const next = { ...prev, ...changes, version: data.version as number };
+        if (hasOwn(changes, "deadline")) {
+          next.timeLeft = secondsUntil(next.deadline, clockOffsetRef.current);
+        }
+        return next;
+      });
+      if (hasOwn(changes, "route")) followRoute((changes as Record<string, unknown>).route);
+    } else if (type === "game_closed") {
+      if (resumeRef.current?.gameId === data.gameId) {
+        endSession("This game has been closed");
+      }
     } else if (type === "error") {
       const msg = data.message as string;
+      if (msg === "Game not found" && resumeRef.current) {
+        // A resume that raced the eviction never saw game_closed.
+        endSession(msg);
+        return;
+      }
       alert(msg || "Unknown error");
-    } else if (type === "navigate") {
-      const route = data.route as string;
-      console.log("Navigating to:", route);
-      if (route) navigate(route);
     }
   };
 
@@ -266,6 +358,7 @@ export const GameProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
   };
 
   const leaveGame = () => {
+    resumeRef.current = null;
     if (gameState.gameId) {
       sendMessage({ action: "leave_game", gameId: gameState.gameId });
     }